@@ -0,0 +1,118 @@
+# scripts/bench_logging.py
+"""
+Micro-benchmark del pipeline de logging.
+
+Compara, desde el punto de vista del hilo que loggea (el request):
+- baseline: formatter JSON original (reserved set por record + json.dumps) + StreamHandler síncrono
+- sync:     _JsonFormatter precomputado + StreamHandler síncrono
+- queue:    _JsonFormatter precomputado detrás de _NonBlockingQueueHandler (QueueListener)
+- disabled: logger.debug con nivel INFO (f-string vs formato perezoso)
+
+Uso:
+    python scripts/bench_logging.py [N]
+"""
+from __future__ import annotations
+
+import io
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.logging_conf import _JsonFormatter, _NonBlockingQueueHandler  # noqa: E402
+
+
+class _BaselineJsonFormatter(logging.Formatter):
+    """Copia del formatter anterior, solo para comparar."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+        }
+        reserved = {
+            "name", "msg", "args", "levelname", "levelno", "pathname", "filename",
+            "module", "exc_info", "exc_text", "stack_info", "lineno", "funcName",
+            "created", "msecs", "relativeCreated", "thread", "threadName",
+            "processName", "process", "message", "asctime"
+        }
+        for k, v in record.__dict__.items():
+            if k not in reserved and not k.startswith("_"):
+                payload[k] = v
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class _SlowStream(io.StringIO):
+    """Simula stdout lento (pipe de Cloud Logging saturado)."""
+
+    def __init__(self, delay_s: float) -> None:
+        super().__init__()
+        self._delay = delay_s
+
+    def write(self, s: str) -> int:
+        if self._delay:
+            time.sleep(self._delay)
+        return len(s)
+
+
+def _logger(name: str, handler: logging.Handler, level: int = logging.INFO) -> logging.Logger:
+    lg = logging.getLogger(name)
+    lg.handlers[:] = [handler]
+    lg.propagate = False
+    lg.setLevel(level)
+    return lg
+
+
+def _run(lg: logging.Logger, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        lg.info("🚀 run_testimony %s", i, extra={"case_id": "CASE-001", "context": "Witness"})
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main(n: int) -> None:
+    results = {}
+
+    for label, delay in (("fast stdout", 0.0), ("slow stdout (50µs/line)", 0.00005)):
+        h = logging.StreamHandler(_SlowStream(delay))
+        h.setFormatter(_BaselineJsonFormatter())
+        results[f"baseline · {label}"] = _run(_logger("bench.baseline", h), n)
+
+        h = logging.StreamHandler(_SlowStream(delay))
+        h.setFormatter(_JsonFormatter())
+        results[f"sync · {label}"] = _run(_logger("bench.sync", h), n)
+
+        sink = logging.StreamHandler(_SlowStream(delay))
+        sink.setFormatter(_JsonFormatter())
+        q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=n + 1)
+        listener = logging.handlers.QueueListener(q, sink)
+        listener.start()
+        results[f"queue · {label}"] = _run(_logger("bench.queue", _NonBlockingQueueHandler(q)), n)
+        listener.stop()
+
+    lg = _logger("bench.disabled", logging.NullHandler(), level=logging.INFO)
+    big = {"k": list(range(50))}
+    t0 = time.perf_counter()
+    for _ in range(n):
+        lg.debug(f"payload={big}")
+    results["debug deshabilitado · f-string"] = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    for _ in range(n):
+        lg.debug("payload=%s", big)
+    results["debug deshabilitado · lazy %s"] = (time.perf_counter() - t0) / n * 1e6
+
+    width = max(len(k) for k in results)
+    print(f"N={n} records (µs por llamada, hilo del request)")
+    for k, v in results.items():
+        print(f"  {k:<{width}}  {v:8.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
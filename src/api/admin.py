@@ -0,0 +1,61 @@
+# src/api/admin.py
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from src.logging_conf import get_logger
+from src.settings import get_settings
+from src import profiling
+
+logger = get_logger(__name__)
+router = APIRouter(prefix="/admin")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Sin ADMIN_TOKEN configurado, /admin/* no existe (404); con token inválido, 403."""
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.admin_token_matches(x_admin_token):
+        raise HTTPException(status_code=403, detail="X-Admin-Token inválido.")
+
+
+@router.get("/profiles", summary="Últimos profiles guardados (resumen por etapa)", dependencies=[Depends(require_admin)])
+async def list_profiles(limit: int = 50):
+    return {"profiles": profiling.list_profiles(limit)}
+
+
+@router.get("/profiles/{profile_id}", summary="Resumen de un profile: wall vs CPU por etapa",
+            dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    summary = profiling.load_summary(profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} no existe.")
+    return summary
+
+
+@router.get("/profiles/{profile_id}/flamegraph", response_class=PlainTextResponse,
+            summary="Collapsed stacks (flamegraph.pl / speedscope)", dependencies=[Depends(require_admin)])
+async def get_profile_flamegraph(profile_id: str):
+    text = profiling.load_collapsed(profile_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} sin collapsed stacks (¿PROFILE_MODE=cprofile?).")
+    return text
+
+
+@router.get("/profiles/{profile_id}/pstats", summary="Dump pstats (PROFILE_MODE=cprofile)",
+            dependencies=[Depends(require_admin)])
+async def get_profile_pstats(profile_id: str, text: bool = False, sort: str = "cumulative"):
+    """`?text=true` devuelve el top de funciones ya formateado en vez del archivo binario."""
+    path = profiling.pstats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} sin pstats (¿PROFILE_MODE=sample?).")
+    if text:
+        try:
+            return PlainTextResponse(profiling.pstats_text(profile_id, sort=sort))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Orden inválido: {sort}")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
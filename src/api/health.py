@@ -1,13 +1,18 @@
 # src/api/health.py
 from __future__ import annotations
 
+import asyncio
 import os
+
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 
 from src.logging_conf import get_logger
 from src.settings import get_settings
-from src.auth import build_docs_client
-from src.clients.drive_client import assert_sa_has_access
+from src.domain.prompt_loader import get_prompt_registry
+from src.health_probe import adhoc_doc_checks, get_health_prober, uptime_s
+from src import metrics
+from src.shared_cache import get_shared_cache
 
 logger = get_logger(__name__)
 settings = get_settings()
@@ -19,38 +24,72 @@ async def health():
     return {"ok": True, "service": "testimonios", "project": settings.project_id}
 
 
-@router.get("/health/sa", summary="Verificación SA/ADC de Docs (escritura reversible) y Vertex")
+@router.get("/health/live", summary="Liveness: solo el proceso (sin dependencias)")
+async def health_live():
+    return {"ok": True, "uptime_s": round(uptime_s(), 1)}
+
+
+@router.get("/health/ready", summary="Readiness: dependencias calientes y alcanzables (desde cache)")
+async def health_ready():
+    prober = get_health_prober()
+    if prober is None:
+        # Prober desactivado: sin datos de dependencias, listo si el proceso responde
+        return {"ready": True, "checks": {}, "prober": "disabled"}
+    ready, checks = prober.readiness()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "checks": checks})
+
+
+@router.get("/health/prompts", summary="Plantillas precompiladas: variables requeridas, render time y tamaño de prompt")
+async def health_prompts():
+    registry = get_prompt_registry(str(settings.prompts_dir))
+    return {"prompts_dir": registry.templates_dir, "templates": registry.stats()}
+
+
+@router.get("/health/metrics", summary="Métricas en proceso (edad/latencia del token, etc.)")
+async def health_metrics():
+    # Con varios workers (src.serve) cada proceso responde con sus propias métricas;
+    # `shared_cache` sí es de toda la instancia.
+    snap = metrics.snapshot()
+    snap["pid"] = os.getpid()
+    try:
+        snap["shared_cache"] = await asyncio.to_thread(get_shared_cache().stats)
+    except Exception as e:
+        snap["shared_cache"] = {"error": str(e)}
+    return snap
+
+
+@router.get("/health/sa", summary="Verificación SA/ADC de Docs (escritura reversible) y Vertex, desde cache")
 async def health_sa(doc_id: str | None = Query(default=None, description="Doc existente para prueba de escritura")):
     # 1) resolver doc para prueba
-    test_doc = doc_id or os.getenv("HEALTHCHECK_DOC_ID")
+    test_doc = doc_id or settings.healthcheck_doc_id
     if not test_doc:
         raise HTTPException(status_code=422, detail="Falta doc_id en query o HEALTHCHECK_DOC_ID en el entorno.")
 
-    # 2) acceso
-    try:
-        assert_sa_has_access(test_doc, use_docs_api=True)
-    except Exception as e:
-        raise HTTPException(status_code=403, detail=f"Sin acceso al doc {test_doc}: {e}")
+    prober = get_health_prober()
+    checks = prober.snapshot() if prober is not None else {}
+    if test_doc == settings.healthcheck_doc_id and "docs_write" in checks:
+        docs = {k: checks[k] for k in ("docs_read", "docs_write")}
+    else:
+        # Doc explícito (o prober apagado): sondas ad-hoc, cacheadas por doc
+        # para que un polling no gaste cuota de escritura
+        results = await asyncio.to_thread(adhoc_doc_checks, test_doc)
+        docs = {k: r.as_dict(settings.health_write_probe_interval_s) for k, r in results.items()}
+    vertex = checks.get("vertex", {"ok": True, "fresh": False, "detail": "sin prober (no verificado)"})
 
-    # 3) escritura reversible (insert + delete en la misma batch)
-    docs = build_docs_client()
-    probe = "SA health-check ✔"
-    try:
-        docs.documents().batchUpdate(
-            documentId=test_doc,
-            body={"requests": [
-                {"insertText": {"location": {"index": 1}, "text": probe}},
-                {"deleteContentRange": {"range": {"startIndex": 1, "endIndex": 1 + len(probe)}}},
-            ]}
-        ).execute()
-    except Exception as e:
-        raise HTTPException(status_code=403, detail=f"No se pudo escribir en el doc {test_doc}: {e}")
-
-    # 4) Vertex init (sin generar, para no consumir)
-    from src.clients.vertex_client import init_vertex_ai
-    try:
-        init_vertex_ai()
-    except Exception as e:
-        raise HTTPException(status_code=403, detail=f"Vertex AI no inicializó: {e}")
+    # 2) acceso, 3) escritura reversible, 4) Vertex init
+    for name, check, label in (
+        ("docs_read", docs.get("docs_read"), f"Sin acceso al doc {test_doc}"),
+        ("docs_write", docs.get("docs_write"), f"No se pudo escribir en el doc {test_doc}"),
+        ("vertex", vertex, "Vertex AI no inicializó"),
+    ):
+        if check is None:
+            continue
+        if check.get("detail") == "pendiente":
+            raise HTTPException(status_code=503, detail=f"Health check {name} aún en curso; reintenta en unos segundos.")
+        if not check["ok"]:
+            raise HTTPException(status_code=403, detail=f"{label}: {check['detail']}")
 
-    return {"status": "ok", "doc_id": test_doc, "write_probe": "ok", "vertex": "ok"}
\ No newline at end of file
+    return {
+        "status": "ok", "doc_id": test_doc, "write_probe": "ok", "vertex": "ok",
+        "checks": {**docs, "vertex": vertex},
+    }
@@ -0,0 +1,49 @@
+# src/api/jobs.py
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException
+
+from src.logging_conf import get_logger
+from src.settings import get_settings
+from src.domain.schemas import TestimonyRequest
+from src.orchestration.job_queue import get_job_queue
+from src.orchestration.scheduler import tenant_of
+
+logger = get_logger(__name__)
+settings = get_settings()
+router = APIRouter()
+
+
+@router.post(
+    "/jobs",
+    status_code=202,
+    summary="Encola un testimonio para que lo procese un worker (python -m src.worker)",
+)
+def enqueue_testimony_job(payload: TestimonyRequest):
+    """
+    Solo persiste el job en la cola durable y responde de inmediato.
+    Si viene `request_id`, se usa como job_id (re-enviar el mismo request no duplica el job).
+    Clase por defecto: webhook (`priority: "backfill"` para cargas masivas); los workers
+    toman los jobs por clase y reparten entre tenants (ver job_queue.lease).
+    Handlers `def` (no async): FastAPI los corre en su threadpool y el SQLite de la cola
+    no bloquea el event loop.
+    """
+    queue = get_job_queue()
+    payload.priority = payload.priority or "webhook"
+    job_id = queue.enqueue(payload.model_dump(mode="json"), job_id=payload.request_id,
+                           priority=payload.priority, tenant=tenant_of(payload))
+    logger.info("📥 Job encolado: %s", job_id, extra={"case_id": payload.case_id, "job_id": job_id})
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}", summary="Estado/resultado de un job encolado")
+def get_testimony_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} no existe.")
+    return job.public()
+
+
+@router.get("/jobs", summary="Conteo de jobs por estado (y por clase de prioridad)")
+def job_stats():
+    return get_job_queue().stats()
@@ -1,11 +1,32 @@
-from fastapi import Request
 from fastapi.responses import JSONResponse
 import logging
 logger = logging.getLogger(__name__)
 
-async def unhandled_exception_middleware(request: Request, call_next):
-    try:
-        return await call_next(request)
-    except Exception as e:
-        logger.exception("Unhandled error")
-        return JSONResponse(status_code=500, content={"detail": str(e)})
\ No newline at end of file
+class UnhandledExceptionMiddleware:
+    """
+    Error no manejado → 500 JSON. Middleware ASGI puro (no http-middleware/BaseHTTPMiddleware):
+    no envuelve `receive`, así el endpoint sigue viendo la desconexión del cliente
+    (request.is_disconnected(), src/deadline.py).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = False
+
+        async def _send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        except Exception as e:
+            logger.exception("Unhandled error")
+            if started:
+                raise
+            await JSONResponse(status_code=500, content={"detail": str(e)})(scope, receive, send)
@@ -1,13 +1,19 @@
 # src/api/testimonios.py
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from src.deadline import Deadline, parse_timeout, run_until_disconnect, use_deadline
 from src.logging_conf import bootstrap_logging_from_env, get_logger
 from src.settings import get_settings
-from src.domain.schemas import TestimonyRequest, TestimonyResponse
+from src.domain.schemas import PdfTestimonyRequest, TestimonyRequest, TestimonyResponse
 
 # Importamos la función principal del runner
-from src.orchestration.runner import run_testimony
+from src.orchestration.runner import arun_testimony, run_pdf_testimony, run_testimony
+from src.profiling import RequestProfile, should_profile
 
 bootstrap_logging_from_env()
 logger = get_logger(__name__)
@@ -20,33 +26,92 @@ router = APIRouter()
     response_model=TestimonyResponse,
     summary="Endpoint manual/directo para generar testimonios",
 )
-async def generate_testimony_endpoint(payload: TestimonyRequest):
+async def generate_testimony_endpoint(
+    payload: TestimonyRequest,
+    request: Request,
+    response: Response,
+    x_profile: Optional[str] = Header(default=None),
+    x_request_timeout: Optional[str] = Header(default=None),
+):
     """
     Endpoint estándar.
+    Clase de prioridad por defecto: interactive (paralegales esperando la respuesta).
+    Deadline: `X-Request-Timeout` / `timeout_s` (ver src/deadline.py); si vence o el cliente
+    se desconecta, el trabajo se corta (504 / 499).
+    Con `X-Profile: <ADMIN_TOKEN>` (o por PROFILE_SAMPLE_RATE) corre `run_testimony` en un hilo
+    bajo el profiler; el id queda en el header `X-Profile-Id` (ver /admin/profiles/{id}).
     """
+    payload.priority = payload.priority or "interactive"
     try:
-        return run_testimony(payload)
+        deadline = Deadline(parse_timeout(x_request_timeout, payload.timeout_s))
+        if should_profile(x_profile):
+            profile = RequestProfile("generate-testimony", meta={"case_id": payload.case_id})
+            response.headers["X-Profile-Id"] = profile.id
+            try:
+                with use_deadline(deadline):
+                    return await run_until_disconnect(
+                        request, asyncio.to_thread(profile.call, run_testimony, payload), deadline)
+            except HTTPException as e:
+                e.headers = {**(e.headers or {}), "X-Profile-Id": profile.id}
+                raise
+        with use_deadline(deadline):
+            return await run_until_disconnect(request, arun_testimony(payload), deadline)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Error en /generate-testimony", extra={"case_id": payload.case_id})
         raise HTTPException(status_code=500, detail="Error interno inesperado.")
 
+@router.post(
+    "/generate-testimony/pdf",
+    response_model=TestimonyResponse,
+    summary="PDF en Drive → chunks en GCS → map-reduce → Doc de salida",
+)
+async def generate_pdf_testimony_endpoint(
+    payload: PdfTestimonyRequest,
+    request: Request,
+    x_request_timeout: Optional[str] = Header(default=None),
+):
+    """
+    Corta el PDF por páginas/tamaño (pool de procesos), sube los chunks en paralelo
+    y genera el testimonio con map-reduce. Corre en un hilo para no bloquear el event loop.
+    Con deadline vencido o cliente desconectado no se lanzan más chunks ni la escritura.
+    """
+    payload.priority = payload.priority or "interactive"
+    try:
+        deadline = Deadline(parse_timeout(x_request_timeout, payload.timeout_s))
+        with use_deadline(deadline):
+            return await run_until_disconnect(request, asyncio.to_thread(run_pdf_testimony, payload), deadline)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error en /generate-testimony/pdf", extra={"case_id": payload.case_id})
+        raise HTTPException(status_code=500, detail="Error interno inesperado.")
+
 @router.post(
     "/webhook/chain",
     response_model=TestimonyResponse,
     summary="Endpoint para encadenamiento automático (Llamado por el Transcriptor/Enqueuer)",
 )
-async def webhook_chain_endpoint(payload: TestimonyRequest):
+async def webhook_chain_endpoint(
+    payload: TestimonyRequest,
+    request: Request,
+    x_request_timeout: Optional[str] = Header(default=None),
+):
     """
     Recibe el payload combinado (Template de Apps Script + Resultado de Transcripción).
     Como el payload es plano, Pydantic lo parsea automáticamente a TestimonyRequest:
     - payload.transcription_doc_id: Se llena automáticamente.
     - payload.sheet_callback: Se llena automáticamente si viene en el JSON.
+    - payload.priority: 'webhook' si no viene (detrás de los requests interactivos).
+    - Deadline y desconexión: como /generate-testimony.
     """
-    logger.info(f"🔗 Webhook Chain recibido para Caso: {payload.case_id}")
+    payload.priority = payload.priority or "webhook"
+    logger.info("🔗 Webhook Chain recibido para Caso: %s", payload.case_id)
     try:
-        return run_testimony(payload)
+        deadline = Deadline(parse_timeout(x_request_timeout, payload.timeout_s))
+        with use_deadline(deadline):
+            return await run_until_disconnect(request, arun_testimony(payload), deadline)
     except HTTPException:
         raise
     except Exception as e:
@@ -4,6 +4,9 @@ import os
 import certifi
 os.environ["SSL_CERT_FILE"] = certifi.where()
 
+import threading
+import time
+from datetime import datetime, timezone
 from functools import lru_cache
 from typing import Iterable, Optional, Tuple
 
@@ -15,6 +18,7 @@ from google.auth.transport.requests import Request
 
 import vertexai
 
+from src import metrics
 from src.settings import get_settings
 from src.logging_conf import get_logger
 
@@ -22,7 +26,9 @@ logger = get_logger(__name__)
 
 # --- SCOPES GLOBALES ---
 # --- SCOPES GLOBALES ---
-DRIVE_SCOPES = ("https://www.googleapis.com/auth/drive.readonly",)
+# `drive` (no `drive.readonly`): los modos docx/html reemplazan el Doc con files.update + media,
+# que `documents` no autoriza. `drive.file` no alcanza: los Docs de salida no los creó la SA.
+DRIVE_SCOPES = ("https://www.googleapis.com/auth/drive",)
 DOCS_SCOPES = ("https://www.googleapis.com/auth/documents",)
 SHEETS_SCOPES = ("https://www.googleapis.com/auth/spreadsheets",)
 VERTEX_SCOPE = ("https://www.googleapis.com/auth/cloud-platform",)
@@ -39,7 +45,7 @@ def _scopes_tuple(scopes: Optional[Iterable[str]]) -> Tuple[str, ...]:
 def _from_service_account_file(path: str, scopes: Tuple[str, ...]) -> SACredentials:
     if not os.path.exists(path):
         raise FileNotFoundError(f"No se encontró el archivo de credenciales: {path}")
-    logger.debug(f"Usando Service Account JSON: {path}")
+    logger.debug("Usando Service Account JSON: %s", path)
     return SACredentials.from_service_account_file(path, scopes=list(scopes))
 
 def _adc_credentials(scopes: Tuple[str, ...]) -> BaseCredentials:
@@ -47,14 +53,161 @@ def _adc_credentials(scopes: Tuple[str, ...]) -> BaseCredentials:
     logger.debug("Usando credenciales Application Default Credentials (ADC).")
     return creds
 
+# --- REFRESH SINGLE-FLIGHT ---
+class _SingleFlightRefresh:
+    """
+    Reemplaza `creds.refresh` para que, si varios hilos ven el token vencido a la vez,
+    solo uno llame al endpoint de tokens; los demás esperan y reutilizan el resultado.
+    También registra la latencia y el instante del último refresh (métricas).
+    """
+
+    def __init__(self, creds: BaseCredentials) -> None:
+        self._creds = creds
+        self._refresh = creds.refresh  # método original (ligado)
+        self._lock = threading.Lock()
+        self.last_refresh_at: Optional[float] = None  # time.monotonic()
+        creds.refresh = self  # type: ignore[method-assign]
+
+    def __call__(self, request, *, source: str = "on_demand", force: bool = False,
+                 stale_token: Optional[str] = None) -> None:
+        with self._lock:
+            # Otro hilo pudo refrescar mientras esperábamos el lock
+            if not force and self._creds.valid and self.last_refresh_at is not None:
+                return
+            if stale_token is not None and self._creds.token != stale_token:
+                return  # el token rechazado ya fue reemplazado
+            t0 = time.perf_counter()
+            try:
+                self._refresh(request)
+            except Exception:
+                metrics.incr("auth.refresh_failures")
+                raise
+            elapsed = time.perf_counter() - t0
+            self.last_refresh_at = time.monotonic()
+        metrics.observe(f"auth.refresh_latency_s.{source}", elapsed)
+        logger.debug("🔑 Token renovado (%s) en %.3fs", source, elapsed)
+
+    def token_age_s(self) -> Optional[float]:
+        return None if self.last_refresh_at is None else time.monotonic() - self.last_refresh_at
+
+    def expires_in_s(self) -> Optional[float]:
+        expiry = getattr(self._creds, "expiry", None)
+        if expiry is None:
+            return None
+        # google-auth guarda `expiry` como UTC naive
+        return (expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+
 # --- CREDENCIALES CACHEADAS ---
 @lru_cache(maxsize=4)
 def get_workspace_credentials(scopes: Optional[Iterable[str]] = WORKSPACE_SCOPES) -> BaseCredentials:
     scopes_t = _scopes_tuple(scopes)
     # ✅ CAMBIO: sa_credentials_path (y no google_application_credentials)
     if settings.sa_credentials_path:
-        return _from_service_account_file(settings.sa_credentials_path, scopes_t)
-    return _adc_credentials(scopes_t)
+        creds = _from_service_account_file(settings.sa_credentials_path, scopes_t)
+    else:
+        creds = _adc_credentials(scopes_t)
+    _SingleFlightRefresh(creds)
+    return creds
+
+
+def _refresher(creds: BaseCredentials) -> _SingleFlightRefresh:
+    fn = creds.refresh
+    if not isinstance(fn, _SingleFlightRefresh):
+        raise TypeError("Credenciales sin refresh single-flight (no vienen de get_workspace_credentials).")
+    return fn
+
+
+def ensure_fresh_credentials(scopes: Optional[Iterable[str]] = WORKSPACE_SCOPES) -> BaseCredentials:
+    """Devuelve las credenciales compartidas con un token válido (refresca solo si hace falta)."""
+    creds = get_workspace_credentials(scopes)
+    if not creds.valid:
+        creds.refresh(_token_request())
+    return creds
+
+
+def force_refresh_credentials(rejected_token: Optional[str],
+                              scopes: Optional[Iterable[str]] = WORKSPACE_SCOPES) -> BaseCredentials:
+    """
+    Refresh forzado tras un 401 (token revocado/rotado antes de su expiry), por el camino
+    single-flight: el token compartido nunca queda vacío para otros hilos, y si varios reciben
+    el 401 a la vez solo uno renueva (los demás ven que `rejected_token` ya no es el actual).
+    """
+    creds = get_workspace_credentials(scopes)
+    _refresher(creds)(_token_request(), source="unauthorized", force=True, stale_token=rejected_token)
+    return creds
+
+
+@lru_cache(maxsize=1)
+def _token_request() -> Request:
+    # Una sesión HTTP reutilizable para hablar con el endpoint de tokens
+    return Request()
+
+
+class _BackgroundRefresher(threading.Thread):
+    """
+    Renueva las credenciales compartidas `margin_s` segundos antes de que venzan,
+    para que ningún request pague el refresh en su camino crítico.
+    """
+
+    def __init__(self, margin_s: float) -> None:
+        super().__init__(name="auth-refresher", daemon=True)
+        self.margin_s = margin_s
+        self._stop_evt = threading.Event()
+
+    def _next_wait(self, refresher: _SingleFlightRefresh) -> float:
+        expires_in = refresher.expires_in_s()
+        if expires_in is None:
+            return 0.0
+        return max(0.0, expires_in - self.margin_s)
+
+    def run(self) -> None:
+        backoff = 5.0
+        while not self._stop_evt.is_set():
+            try:
+                creds = get_workspace_credentials(WORKSPACE_SCOPES)
+                refresher = _refresher(creds)
+                wait_s = self._next_wait(refresher)
+                if wait_s > 0:
+                    if self._stop_evt.wait(wait_s):
+                        return
+                refresher(_token_request(), source="background", force=True)
+                backoff = 5.0
+            except Exception as e:
+                logger.warning("⚠️ Refresh de credenciales en background falló: %s (reintento en %.0fs)", e, backoff)
+                if self._stop_evt.wait(backoff):
+                    return
+                backoff = min(backoff * 2, 120.0)
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+
+_bg_lock = threading.Lock()
+_bg_refresher: Optional[_BackgroundRefresher] = None
+
+
+def start_credential_refresher(margin_s: Optional[float] = None) -> bool:
+    """Arranca (una vez por proceso) el hilo de refresh proactivo. False si está desactivado."""
+    global _bg_refresher
+    if not settings.auth_background_refresh:
+        return False
+    with _bg_lock:
+        if _bg_refresher is not None and _bg_refresher.is_alive():
+            return True
+        _bg_refresher = _BackgroundRefresher(settings.auth_refresh_margin_s if margin_s is None else margin_s)
+        _bg_refresher.start()
+
+    def _token_age() -> Optional[float]:
+        return _refresher(get_workspace_credentials(WORKSPACE_SCOPES)).token_age_s()
+
+    def _expires_in() -> Optional[float]:
+        return _refresher(get_workspace_credentials(WORKSPACE_SCOPES)).expires_in_s()
+
+    metrics.register_gauge("auth.token_age_s", _token_age)
+    metrics.register_gauge("auth.token_expires_in_s", _expires_in)
+    logger.info("🔑 Refresh proactivo de credenciales activo (margen=%.0fs).", _bg_refresher.margin_s)
+    return True
 
 
 # --- CLIENTES GOOGLE API ---
@@ -87,6 +240,25 @@ def build_docs_client():
     return build("docs", "v1", http=authed_http, cache_discovery=False)
 
 
+_thread_local = threading.local()
+
+
+def thread_authorized_http(timeout: int = 180):
+    """
+    AuthorizedHttp propio del hilo actual (httplib2 no es thread-safe), con las
+    credenciales compartidas. Para llamadas googleapiclient desde pools de hilos:
+    `request.http = thread_authorized_http()`.
+    """
+    authed = getattr(_thread_local, "http", None)
+    if authed is None:
+        from google_auth_httplib2 import AuthorizedHttp
+        import httplib2
+
+        base_http = httplib2.Http(timeout=timeout, ca_certs=certifi.where())
+        authed = _thread_local.http = AuthorizedHttp(get_workspace_credentials(WORKSPACE_SCOPES), http=base_http)
+    return authed
+
+
 @lru_cache(maxsize=4)
 def build_sheets_client():
     creds = get_workspace_credentials(WORKSPACE_SCOPES)
@@ -102,15 +274,15 @@ def init_vertex_ai() -> bool:
     # ✅ Nombres correctos de settings
     project = settings.project_id
     location = settings.vertex_location
-    logger.info(f"🤖 Inicializando Vertex AI (proyecto={project}, región={location})...")
+    logger.info("🤖 Inicializando Vertex AI (proyecto=%s, región=%s)...", project, location)
 
     try:
-        creds = get_workspace_credentials()
         try:
-            # Algunos tipos de credenciales no requieren refresh; ignora si falla
-            creds.refresh(Request())
+            # Reutiliza el token compartido; solo refresca si aún no hay uno válido
+            creds = ensure_fresh_credentials()
         except Exception:
-            pass
+            # Algunos tipos de credenciales no requieren refresh; ignora si falla
+            creds = get_workspace_credentials()
 
         # ✅ Una sola llamada a init
         vertexai.init(project=project, location=location, credentials=creds)
@@ -118,7 +290,7 @@ def init_vertex_ai() -> bool:
         return True
 
     except Exception as e:
-        logger.error(f"Error al inicializar Vertex AI: {e}")
+        logger.error("Error al inicializar Vertex AI: %s", e)
         raise
 
 def get_all_clients() -> dict:
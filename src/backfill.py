@@ -0,0 +1,425 @@
+# src/backfill.py
+"""
+Backfill masivo: ejecuta `run_testimony` para cada fila de un rango de Sheets o de un CSV.
+
+    python -m src.backfill --sheet 1SPREADSHEET --range "Hoja 1!A1:K" --concurrency 4 --rpm 30
+    python -m src.backfill --csv filas.csv --checkpoint backfill.ckpt.jsonl
+
+- La primera fila es el encabezado. Columnas reconocidas (renombrables con --map):
+  case_id, transcription_doc_id, transcription_link, output_doc_id, context, language,
+  client, witness, spreadsheet_id, sheet_name, row_index, testimony_doc_col, status_col.
+- Checkpoint JSONL: cada fila terminada se anota; al relanzar se saltan las ya hechas.
+- Imprime throughput y ETA a medida que avanza.
+- Corre con clase `backfill` (src/orchestration/scheduler.py): en este proceso las cuotas
+  VERTEX_RPM / DOCS_WRITE_RPM aplican igual. Para que compita por turno con el tráfico
+  interactivo del servicio, encolar las filas en POST /jobs con `priority: "backfill"`.
+- `--batch`: en vez de una llamada online por fila, renderiza todos los prompts, los envía
+  como UN job de Vertex batch prediction (src/clients/vertex_batch.py), espera el resultado
+  y recién ahí escribe cada Doc (+ callback a Sheets). No gasta la cuota online; tarda más.
+  Una línea del JSONL por salida del request (`<fila>#0` la principal, `#1`… sus `outputs`).
+
+    python -m src.backfill --csv filas.csv --batch --batch-dir ./batch-2024-06
+    python -m src.backfill --csv filas.csv --batch --batch-job projects/…/batchPredictionJobs/123  # retomar
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from src.logging_conf import bootstrap_logging_from_env, get_logger
+
+logger = get_logger(__name__)
+
+FIELDS = (
+    "case_id", "transcription_doc_id", "transcription_link", "output_doc_id", "context", "language",
+    "client", "witness", "spreadsheet_id", "sheet_name", "row_index", "testimony_doc_col", "status_col",
+)
+
+
+@dataclass
+class BackfillRow:
+    key: str
+    row_number: int
+    values: Dict[str, str]
+
+
+# ---------------------------
+# Lectura de filas
+# ---------------------------
+
+def _normalize_header(h: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", (h or "").strip().lower()).strip("_")
+
+
+def _rows_from_table(table: List[List[str]], *, mapping: Dict[str, str], first_row: int) -> List[BackfillRow]:
+    if not table:
+        return []
+    header = [_normalize_header(h) for h in table[0]]
+    # mapping: campo → nombre de columna en el encabezado
+    col_for = {f: _normalize_header(mapping.get(f, f)) for f in FIELDS}
+    idx = {f: header.index(c) for f, c in col_for.items() if c in header}
+
+    rows: List[BackfillRow] = []
+    for offset, raw in enumerate(table[1:], start=1):
+        values = {f: (raw[i].strip() if i < len(raw) and raw[i] is not None else "") for f, i in idx.items()}
+        if not any(values.values()):
+            continue
+        row_number = first_row + offset
+        key = f"{row_number}:{values.get('case_id', '')}"
+        rows.append(BackfillRow(key=key, row_number=row_number, values=values))
+    return rows
+
+
+def read_csv_rows(path: str, *, mapping: Dict[str, str]) -> List[BackfillRow]:
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        table = list(csv.reader(fh))
+    return _rows_from_table(table, mapping=mapping, first_row=1)
+
+
+def read_sheet_rows(spreadsheet_id: str, range_a1: str, *, mapping: Dict[str, str]) -> List[BackfillRow]:
+    from src.clients.sheets_client import read_range
+
+    table = read_range(spreadsheet_id, range_a1)
+    # Fila de inicio del rango ("Hoja 1!A5:K" → 5) para conocer el row_index real
+    m = re.search(r"![A-Za-z]*(\d+)", range_a1)
+    first_row = int(m.group(1)) if m else 1
+    rows = _rows_from_table(table, mapping=mapping, first_row=first_row)
+    sheet_name = range_a1.split("!", 1)[0].strip("'") if "!" in range_a1 else "Hoja 1"
+    for r in rows:
+        r.values.setdefault("spreadsheet_id", spreadsheet_id)
+        r.values.setdefault("sheet_name", sheet_name)
+        r.values.setdefault("row_index", str(r.row_number))
+    return rows
+
+
+def build_request(row: BackfillRow, *, defaults: Dict[str, str]):
+    """Fila → TestimonyRequest (con sheet_callback si hay columnas de callback)."""
+    from src.domain.schemas import SheetCallbackConfig, TestimonyRequest
+
+    v = {**defaults, **{k: val for k, val in row.values.items() if val}}
+    callback = None
+    if v.get("spreadsheet_id") and v.get("row_index") and (v.get("testimony_doc_col") or v.get("status_col")):
+        callback = SheetCallbackConfig(
+            spreadsheet_id=v["spreadsheet_id"],
+            sheet_name=v.get("sheet_name") or "Hoja 1",
+            row_index=int(v["row_index"]),
+            testimony_doc_col=v.get("testimony_doc_col") or None,
+            status_col=v.get("status_col") or None,
+        )
+    return TestimonyRequest(
+        case_id=v.get("case_id") or f"ROW-{row.row_number}",
+        context=v.get("context") or "Witness",
+        language=(v.get("language") or "").lower() or None,
+        client=v.get("client") or None,
+        witness=v.get("witness") or None,
+        transcription_doc_id=v.get("transcription_doc_id") or None,
+        transcription_link=v.get("transcription_link") or None,
+        output_doc_id=v.get("output_doc_id", ""),
+        sheet_callback=callback,
+        request_id=f"backfill:{row.key}",
+        priority="backfill",
+    )
+
+
+# ---------------------------
+# Checkpoint
+# ---------------------------
+
+class Checkpoint:
+    """Archivo JSONL append-only: {"key", "status", ...} por fila terminada."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, str]:
+        state: Dict[str, str] = {}
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # línea truncada por un corte abrupto
+                state[rec["key"]] = rec["status"]
+        return state
+
+    def record(self, key: str, status: str, **info: Any) -> None:
+        line = json.dumps({"key": key, "status": status, "ts": time.time(), **info}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+# ---------------------------
+# Rate limit + progreso
+# ---------------------------
+
+class _RateLimiter:
+    """Espaciado mínimo entre arranques de filas (rpm = filas por minuto)."""
+
+    def __init__(self, rpm: float) -> None:
+        self._interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_s = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self._interval
+        if wait_s:
+            time.sleep(wait_s)
+
+
+class _Progress:
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.ok = 0
+        self.failed = 0
+        self._t0 = time.monotonic()
+
+    def line(self) -> str:
+        done = self.ok + self.failed
+        elapsed = time.monotonic() - self._t0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else float("inf")
+        eta_s = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        return (f"[{done}/{self.total}] ok={self.ok} fail={self.failed} "
+                f"{rate * 60:.1f} filas/min · ETA {eta_s}")
+
+
+# ---------------------------
+# Ejecución
+# ---------------------------
+
+def _completed(rows: List[BackfillRow], fn: Callable[[BackfillRow], Any],
+               concurrency: int) -> Iterator[Tuple[BackfillRow, Any, Optional[Exception]]]:
+    """`fn(row)` en un pool; entrega (fila, resultado, error) a medida que terminan."""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="backfill") as pool:
+        futures = {pool.submit(fn, r): r for r in rows}
+        remaining = set(futures)
+        while remaining:
+            done, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    yield futures[fut], fut.result(), None
+                except Exception as e:
+                    yield futures[fut], None, e
+
+
+def _record_failure(checkpoint: Checkpoint, row: BackfillRow, error: Exception) -> None:
+    detail = getattr(error, "detail", None) or str(error)
+    checkpoint.record(row.key, "failed", error=str(detail)[:500])
+    logger.error("❌ Fila %s falló: %s", row.key, detail)
+
+
+def _pending(rows: Iterable[BackfillRow], checkpoint: Checkpoint, retry_failed: bool) -> Tuple[List[BackfillRow], Set[str]]:
+    state = checkpoint.load()
+    skip: Set[str] = {k for k, st in state.items() if st == "done" or (st == "failed" and not retry_failed)}
+    if skip:
+        print(f"↪️ Reanudando: {len(skip)} filas ya procesadas en {checkpoint.path}", file=sys.stderr)
+    return [r for r in rows if r.key not in skip], skip
+
+
+def run_backfill(rows: Iterable[BackfillRow], *, checkpoint: Checkpoint, concurrency: int = 2,
+                 rpm: float = 0.0, retry_failed: bool = False, defaults: Optional[Dict[str, str]] = None,
+                 runner=None) -> Dict[str, int]:
+    if runner is None:
+        from src.orchestration.runner import run_testimony as runner
+
+    pending, skip = _pending(rows, checkpoint, retry_failed)
+    progress = _Progress(len(pending))
+    limiter = _RateLimiter(rpm)
+    defaults = defaults or {}
+
+    def _one(row: BackfillRow) -> Dict[str, Any]:
+        limiter.acquire()
+        req = build_request(row, defaults=defaults)
+        t0 = time.perf_counter()
+        resp = runner(req)
+        return {"elapsed_s": round(time.perf_counter() - t0, 2), "doc_link": resp.get("output_doc_link")}
+
+    for row, info, error in _completed(pending, _one, concurrency):
+        if error is not None:
+            progress.failed += 1
+            _record_failure(checkpoint, row, error)
+        else:
+            progress.ok += 1
+            checkpoint.record(row.key, "done", **info)
+        print(progress.line(), file=sys.stderr, flush=True)
+
+    return {"total": progress.total, "ok": progress.ok, "failed": progress.failed, "skipped": len(skip)}
+
+
+def run_batch_backfill(rows: Iterable[BackfillRow], *, checkpoint: Checkpoint, workdir: str,
+                       backend=None, job_name: Optional[str] = None, concurrency: int = 2,
+                       retry_failed: bool = False, defaults: Optional[Dict[str, str]] = None,
+                       runner=None, prompt_builder=None) -> Dict[str, Any]:
+    """
+    Backfill con un solo job de batch prediction:
+      1) prompts de todas las filas pendientes → <workdir>/input.jsonl, uno por salida con key
+         `<fila>#<i>` (lectura de fuentes en paralelo)
+      2) envío del job y espera (BATCH_POLL_S, hasta BATCH_MAX_WAIT_S)
+      3) predicciones de cada fila → run_testimony(req, generated=[...]) (Docs + callback a Sheets), en paralelo
+    Con `job_name` se salta 1) y 2a): se retoma la espera de un job ya enviado (mismo workdir).
+    """
+    from src.clients.vertex_batch import collect_results, get_batch_backend, request_line
+    from src.settings import get_settings
+
+    if runner is None:
+        from src.orchestration.runner import run_testimony as runner
+    if prompt_builder is None:
+        from src.orchestration.runner import build_testimony_prompts as prompt_builder
+
+    settings = get_settings()
+    backend = backend or get_batch_backend(workdir=workdir)
+    defaults = defaults or {}
+    pending, skip = _pending(rows, checkpoint, retry_failed)
+    os.makedirs(workdir, exist_ok=True)
+    input_path = os.path.join(workdir, "input.jsonl")
+    failed = 0
+    n_outputs: Dict[str, int] = {}  # fila → cuántas salidas (líneas) tiene en el JSONL
+
+    if job_name:
+        with open(input_path, encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    row_key = json.loads(line)["key"].rpartition("#")[0]
+                    n_outputs[row_key] = n_outputs.get(row_key, 0) + 1
+        rendered = [r for r in pending if r.key in n_outputs]
+        job = backend.resume(job_name)
+    else:
+        rendered = []
+        progress = _Progress(len(pending))
+        with open(input_path, "w", encoding="utf-8") as fh:
+            # Los prompts van directo al archivo a medida que salen: no se juntan en memoria
+            for row, prompts, error in _completed(pending, lambda r: prompt_builder(build_request(r, defaults=defaults)),
+                                                  concurrency):
+                if error is not None:
+                    progress.failed += 1
+                    _record_failure(checkpoint, row, error)
+                else:
+                    progress.ok += 1
+                    for i, prompt in enumerate(prompts):
+                        fh.write(request_line(f"{row.key}#{i}", prompt) + "\n")
+                    n_outputs[row.key] = len(prompts)
+                    rendered.append(row)
+                print(f"🧾 prompts {progress.line()}", file=sys.stderr, flush=True)
+        failed = progress.failed
+        if not rendered:
+            return {"total": len(pending), "ok": 0, "failed": failed, "skipped": len(skip), "batch_job": None}
+        job = backend.submit(input_path, f"{os.path.basename(os.path.abspath(workdir))}-{int(time.time())}")
+        print(f"🛰️ Job de batch: {job.name} (si se corta: --batch-job {job.name} --batch-dir {workdir})",
+              file=sys.stderr, flush=True)
+
+    job = backend.wait(job, poll_s=settings.batch_poll_s, max_wait_s=settings.batch_max_wait_s)
+    results = collect_results(backend, job, input_path)
+
+    def _write(row: BackfillRow) -> Dict[str, Any]:
+        generated = []
+        for i in range(n_outputs[row.key]):
+            result = results.get(f"{row.key}#{i}")
+            if result is None:
+                raise RuntimeError(f"El job de batch no devolvió predicción para la salida {i} de esta fila.")
+            if isinstance(result, Exception):
+                raise result
+            generated.append(result)
+        resp = runner(build_request(row, defaults=defaults), generated=generated)
+        return {"doc_link": resp.get("output_doc_link"), "batch_job": job.name}
+
+    progress = _Progress(len(rendered))
+    for row, info, error in _completed(rendered, _write, concurrency):
+        if error is not None:
+            progress.failed += 1
+            _record_failure(checkpoint, row, error)
+        else:
+            progress.ok += 1
+            checkpoint.record(row.key, "done", **info)
+        print(progress.line(), file=sys.stderr, flush=True)
+
+    return {"total": len(pending), "ok": progress.ok, "failed": failed + progress.failed,
+            "skipped": len(skip), "batch_job": job.name}
+
+
+def _parse_map(spec: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        k, sep, v = item.partition("=")
+        if sep and k.strip() and v.strip():
+            out[k.strip()] = v.strip()
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.backfill", description="Backfill masivo de testimonios.")
+    src_group = parser.add_mutually_exclusive_group(required=True)
+    src_group.add_argument("--csv", help="CSV local con encabezado.")
+    src_group.add_argument("--sheet", help="spreadsheet_id a leer (requiere --range).")
+    parser.add_argument("--range", dest="range_a1", help="Rango A1 con encabezado, ej: \"Hoja 1!A1:K\".")
+    parser.add_argument("--map", default="", help="campo=Encabezado,... (ej: output_doc_id=Doc Salida)")
+    parser.add_argument("--checkpoint", default="backfill.ckpt.jsonl")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--rpm", type=float, default=0.0, help="Máx. filas iniciadas por minuto (0 = sin límite).")
+    parser.add_argument("--retry-failed", action="store_true", help="Reintenta filas marcadas failed en el checkpoint.")
+    parser.add_argument("--context", default="", help="Valor por defecto de context.")
+    parser.add_argument("--language", default="", help="Valor por defecto de language.")
+    parser.add_argument("--testimony-doc-col", default="", help="Columna de callback por defecto (link).")
+    parser.add_argument("--status-col", default="", help="Columna de callback por defecto (status).")
+    parser.add_argument("--batch", action="store_true",
+                        help="Generar con un job de Vertex batch prediction en vez de llamadas online.")
+    parser.add_argument("--batch-backend", default="", help="vertex | local (default BATCH_BACKEND).")
+    parser.add_argument("--batch-dir", default="backfill-batch", help="Directorio del JSONL de entrada (y salida local).")
+    parser.add_argument("--batch-job", default="", help="Retomar la espera de un job ya enviado (con el mismo --batch-dir).")
+    args = parser.parse_args(argv)
+
+    bootstrap_logging_from_env()
+    mapping = _parse_map(args.map)
+    if args.csv:
+        rows = read_csv_rows(args.csv, mapping=mapping)
+    else:
+        if not args.range_a1:
+            parser.error("--sheet requiere --range")
+        rows = read_sheet_rows(args.sheet, args.range_a1, mapping=mapping)
+
+    defaults = {k: v for k, v in {
+        "context": args.context, "language": args.language,
+        "testimony_doc_col": args.testimony_doc_col, "status_col": args.status_col,
+    }.items() if v}
+
+    if args.batch or args.batch_job:
+        from src.clients.vertex_batch import get_batch_backend
+
+        summary = run_batch_backfill(
+            rows, checkpoint=Checkpoint(args.checkpoint), workdir=args.batch_dir,
+            backend=get_batch_backend(args.batch_backend or None, workdir=args.batch_dir),
+            job_name=args.batch_job or None, concurrency=args.concurrency,
+            retry_failed=args.retry_failed, defaults=defaults,
+        )
+    else:
+        summary = run_backfill(
+            rows, checkpoint=Checkpoint(args.checkpoint), concurrency=args.concurrency,
+            rpm=args.rpm, retry_failed=args.retry_failed, defaults=defaults,
+        )
+    from src.orchestration.stages import drain_background
+
+    drain_background(timeout=None)  # callbacks de status a la Sheet aún en vuelo
+    print(json.dumps(summary), flush=True)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# src/clients/docs_render.py
+"""
+Render local del Markdown de salida a DOCX o HTML, para reemplazar el contenido del Doc
+con UNA subida de Drive con conversión (ver drive_client.replace_file_content), en vez de
+cientos de operaciones batchUpdate.
+
+Parte del mismo modelo intermedio que el writer nativo (gdocs_client._parse_markdown),
+así ambos writers soportan exactamente el mismo subset de Markdown.
+"""
+from __future__ import annotations
+
+import html
+from io import BytesIO
+from typing import List, Tuple
+
+from src.clients.gdocs_client import _MONO_FONT, _NO_STYLE, _Block, _InlineStyle, _Para, _parse_markdown
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+HTML_MIME = "text/html"
+
+_LINK_COLOR = "1155CC"
+_HR_COLOR = "999999"
+
+
+def _segments(para: _Para) -> List[Tuple[str, _InlineStyle]]:
+    """Texto del párrafo partido por runs de estilo (los offsets de runs van en UTF-16)."""
+    u16 = para.text.encode("utf-16-le")
+
+    def _slice(a: int, b: int) -> str:
+        return u16[a * 2:b * 2].decode("utf-16-le")
+
+    out: List[Tuple[str, _InlineStyle]] = []
+    cursor = 0
+    for a, b, style in para.runs:
+        if a > cursor:
+            out.append((_slice(cursor, a), _NO_STYLE))
+        out.append((_slice(a, b), style))
+        cursor = b
+    if cursor < len(u16) // 2:
+        out.append((_slice(cursor, len(u16) // 2), _NO_STYLE))
+    return out
+
+
+# ----------------------------
+# HTML
+# ----------------------------
+
+def _html_inline(para: _Para) -> str:
+    parts: List[str] = []
+    for text, (bold, italic, link, mono) in _segments(para):
+        chunk = html.escape(text)
+        if mono:
+            chunk = f'<span style="font-family:\'{_MONO_FONT}\'">{chunk}</span>'
+        if italic:
+            chunk = f"<i>{chunk}</i>"
+        if bold:
+            chunk = f"<b>{chunk}</b>"
+        if link:
+            chunk = f'<a href="{html.escape(link, quote=True)}">{chunk}</a>'
+        parts.append(chunk)
+    return "".join(parts) or "<br>"  # párrafo vacío: sin <br> la conversión lo descarta
+
+
+def _html_block(block: _Block) -> str:
+    first = block[0]
+    if first.list_kind:
+        tag = "ol" if first.list_kind == "ordered" else "ul"
+        items = "".join(f"<li>{_html_inline(p)}</li>" for p in block)
+        return f"<{tag}>{items}</{tag}>"
+    if first.hr:
+        return "<hr>"
+    if first.style.startswith("HEADING_"):
+        level = first.style.rsplit("_", 1)[1]
+        return f"<h{level}>{_html_inline(first)}</h{level}>"
+    return f"<p>{_html_inline(first)}</p>"
+
+
+def render_html(markdown_text: str) -> bytes:
+    body = "\n".join(_html_block(b) for b in _parse_markdown(markdown_text) if b)
+    return f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"></head><body>\n{body}\n</body></html>\n'.encode("utf-8")
+
+
+# ----------------------------
+# DOCX (python-docx)
+# ----------------------------
+
+def _docx_restart_numbering(doc, style_name: str) -> int:
+    """Nueva instancia de numeración (empieza en 1) para una lista numerada que no continúa la anterior."""
+    numbering = doc.part.numbering_part.element
+    style_num_id = doc.styles[style_name].element.pPr.numPr.numId.val
+    abstract_id = numbering.num_having_numId(style_num_id).abstractNumId.val
+    num = numbering.add_num(abstract_id)
+    num.add_lvlOverride(ilvl=0).add_startOverride(1)
+    return num.numId
+
+
+def _docx_hr(paragraph) -> None:
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    border = OxmlElement("w:pBdr")
+    bottom = OxmlElement("w:bottom")
+    for attr, value in (("w:val", "single"), ("w:sz", "6"), ("w:space", "1"), ("w:color", _HR_COLOR)):
+        bottom.set(qn(attr), value)
+    border.append(bottom)
+    paragraph._p.get_or_add_pPr().append(border)
+
+
+def _docx_runs(paragraph, para: _Para) -> None:
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    from docx.shared import RGBColor
+
+    for text, (bold, italic, link, mono) in _segments(para):
+        run = paragraph.add_run(text)
+        run.bold = bold or None
+        run.italic = italic or None
+        if mono:
+            run.font.name = _MONO_FONT
+        if link:
+            # python-docx no expone hipervínculos: <w:hyperlink r:id=...> envolviendo el run
+            run.font.underline = True
+            run.font.color.rgb = RGBColor.from_string(_LINK_COLOR)
+            r_id = paragraph.part.relate_to(link, RT.HYPERLINK, is_external=True)
+            hyperlink = OxmlElement("w:hyperlink")
+            hyperlink.set(qn("r:id"), r_id)
+            run._r.addprevious(hyperlink)
+            hyperlink.append(run._r)
+
+
+def render_docx(markdown_text: str) -> bytes:
+    import docx  # python-docx
+
+    doc = docx.Document()
+    for block in _parse_markdown(markdown_text):
+        if not block:
+            continue
+        first = block[0]
+        if first.list_kind:
+            style = "List Number" if first.list_kind == "ordered" else "List Bullet"
+            num_id = _docx_restart_numbering(doc, style) if first.list_kind == "ordered" else None
+            for para in block:
+                p = doc.add_paragraph(style=style)
+                if num_id is not None:
+                    p._p.get_or_add_pPr().get_or_add_numPr().get_or_add_numId().val = num_id
+                _docx_runs(p, para)
+            continue
+        if first.style.startswith("HEADING_"):
+            p = doc.add_paragraph(style=f"Heading {first.style.rsplit('_', 1)[1]}")
+        else:
+            p = doc.add_paragraph()
+        if first.hr:
+            _docx_hr(p)
+        _docx_runs(p, first)
+
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+RENDERERS = {"docx": (render_docx, DOCX_MIME), "html": (render_html, HTML_MIME)}
+
+
+def render_markdown(markdown_text: str, fmt: str) -> Tuple[bytes, str]:
+    """(contenido, mimeType) para subir con conversión a Google Doc."""
+    try:
+        render, mime = RENDERERS[fmt]
+    except KeyError:
+        raise ValueError(f"Formato de render inválido: {fmt}. Usa uno de {set(RENDERERS)}")
+    return render(markdown_text), mime
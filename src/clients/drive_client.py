@@ -3,12 +3,13 @@ from __future__ import annotations
 
 import re
 from io import BytesIO
-from typing import Optional, Dict, Any
+from typing import Any, BinaryIO, Callable, Dict, Optional, Sequence
 
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 
-from src.auth import build_drive_client, build_docs_client
+from src.auth import build_drive_client, build_docs_client, thread_authorized_http
+from src.clients.google_batch import BatchItem, execute_batch
 from src.logging_conf import get_logger
 
 logger = get_logger(__name__)
@@ -53,7 +54,7 @@ def assert_sa_has_access(file_id: str, *, use_docs_api: bool = True) -> None:
             docs.documents().get(documentId=file_id).execute()
             return
         except HttpError as e:
-            logger.error(f"[Docs Access] SA no puede acceder a {file_id}: {e}")
+            logger.error("[Docs Access] SA no puede acceder a %s: %s", file_id, e)
             raise
 
     drive = build_drive_client()
@@ -64,9 +65,25 @@ def assert_sa_has_access(file_id: str, *, use_docs_api: bool = True) -> None:
             supportsAllDrives=True,
         ).execute()
     except HttpError as e:
-        logger.error(f"[Drive Access] SA no puede acceder a {file_id}: {e}")
+        logger.error("[Drive Access] SA no puede acceder a %s: %s", file_id, e)
         raise
 
+def batch_get_files(file_ids: Sequence[str], *, fields: str = "id,name,mimeType,webViewLink") -> Dict[str, BatchItem]:
+    """
+    `files.get` de varios archivos en un solo round trip (batch HTTP de Drive).
+    Devuelve {file_id: BatchItem}; un 403/404 de un archivo no afecta a los demás.
+    """
+    drive = build_drive_client()
+    requests = {
+        fid: drive.files().get(fileId=fid, fields=fields, supportsAllDrives=True)
+        for fid in dict.fromkeys(file_ids)  # sin duplicados, conserva orden
+    }
+    items = execute_batch(drive, requests)
+    for fid, item in items.items():
+        if not item.ok:
+            logger.error("[Drive Access] SA no puede acceder a %s: %s", fid, item.error)
+    return items
+
 def grant_editor_to_sa(file_id: str, sa_email: str) -> None:
     """
     Otorga rol de editor a la SA sobre un archivo específico (si el caller tiene permisos).
@@ -80,7 +97,7 @@ def grant_editor_to_sa(file_id: str, sa_email: str) -> None:
         sendNotificationEmail=False,
         supportsAllDrives=True,
     ).execute()
-    logger.info(f"🔐 Se otorgó 'writer' a {sa_email} sobre {file_id}.")
+    logger.info("🔐 Se otorgó 'writer' a %s sobre %s.", sa_email, file_id)
 
 # ------- Utilidades para PDFs/Drive --------
 
@@ -92,6 +109,44 @@ def parse_drive_url_to_id(url: str) -> str | None:
     m = re.search(r"/file/d/([a-zA-Z0-9_-]+)/", url)
     return m.group(1) if m else None
 
+def download_file_to(
+    file_id: str,
+    fd: BinaryIO,
+    *,
+    chunk_size: int = 8 * 1024 * 1024,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> int:
+    """
+    Descarga un archivo de Drive en streaming hacia `fd` (cualquier objeto con `.write`),
+    de a `chunk_size` bytes: la memoria usada no depende del tamaño del archivo.
+    Seguro desde hilos (usa un http por hilo). Devuelve los bytes escritos.
+    """
+    drive = build_drive_client()
+    request = drive.files().get_media(fileId=file_id, supportsAllDrives=True)
+    request.http = thread_authorized_http()
+    downloader = MediaIoBaseDownload(fd=fd, request=request, chunksize=chunk_size)
+    done = False
+    written = 0
+    while not done:
+        status, done = downloader.next_chunk(num_retries=3)
+        written = status.resumable_progress
+        if on_progress is not None:
+            on_progress(written, status.total_size)
+    return written
+
+def replace_file_content(file_id: str, data: bytes, mime_type: str, *,
+                         fields: str = "id,webViewLink,modifiedTime") -> Dict[str, Any]:
+    """
+    Reemplaza el contenido de un archivo existente con UNA subida (files.update + media).
+    Si el archivo es un Google Doc y `mime_type` es DOCX/HTML, Drive lo convierte:
+    mismo fileId, mismo link.
+    """
+    drive = build_drive_client()
+    media = MediaIoBaseUpload(BytesIO(data), mimetype=mime_type, resumable=False)
+    return drive.files().update(
+        fileId=file_id, media_body=media, fields=fields, supportsAllDrives=True,
+    ).execute(num_retries=3)
+
 def download_file_bytes(file_id: str) -> bytes:
     """
     Descarga un archivo (binario) de Drive por fileId (útil para PDFs).
@@ -128,7 +183,7 @@ def create_google_doc_in_folder(folder_id: str, title: str) -> Dict[str, Any]:
         fields="id,name,webViewLink,driveId",
         supportsAllDrives=True,
     ).execute()
-    logger.info(f"🆕 Doc creado: {file['name']} ({file['id']}) en folder {folder_id}")
+    logger.info("🆕 Doc creado: %s (%s) en folder %s", file['name'], file['id'], folder_id)
     return file
 
 # src/clients/drive_client.py
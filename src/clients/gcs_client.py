@@ -1,12 +1,363 @@
 # src/clients/gcs_client.py
-from google.cloud import storage
+from __future__ import annotations
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple, Union
 from uuid import uuid4
-from datetime import datetime
-
-def upload_bytes(bucket_name: str, data: bytes, suffix: str = ".pdf") -> str:
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    path = f"uploads/{datetime.utcnow():%Y/%m/%d}/{uuid4()}{suffix}"
-    blob = bucket.blob(path)
-    blob.upload_from_string(data, content_type="application/pdf")
-    return f"gs://{bucket_name}/{path}"
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud import storage
+
+from src.logging_conf import get_logger
+from src.metrics import incr
+from src.settings import get_settings
+from src.shared_cache import get_shared_cache
+
+logger = get_logger(__name__)
+
+# Las subidas resumables de GCS exigen chunks múltiplos de 256 KiB
+_GCS_CHUNK_ALIGN = 256 * 1024
+
+
+@lru_cache(maxsize=1)
+def get_storage_client() -> storage.Client:
+    # Un cliente por proceso: reutiliza sesión HTTP y token (es thread-safe)
+    return storage.Client()
+
+
+def _new_object_path(suffix: str) -> str:
+    return f"uploads/{datetime.now(timezone.utc):%Y/%m/%d}/{uuid4()}{suffix}"
+
+
+# ----------------------------
+# Subidas direccionadas por contenido (CAS)
+# ----------------------------
+#
+# Objeto = <GCS_CAS_PREFIX>/<sha256[:2]>/<sha256><suffix>: los mismos bytes (p.ej. el mismo
+# anexo en varios casos relacionados) se suben una sola vez.
+# - Índice hash → URI: LRU del proceso + cache compartido entre workers (src/shared_cache.py);
+#   evita incluso el round trip a GCS en hits recientes.
+# - Cada uso "toca" `customTime` del objeto; una regla de lifecycle del bucket borra los
+#   objetos CAS sin uso en GCS_CAS_TTL_DAYS días (daysSinceCustomTime).
+
+# Cada cuánto re-tocar un objeto ya indexado (debe ser < 1 día, la granularidad del lifecycle)
+_CAS_RETOUCH_S = 6 * 3600
+_HASH_BLOCK = 1024 * 1024
+
+
+class _CasIndex:
+    """LRU acotado {bucket/sha256+suffix: (gs_uri, último touch monotonic)}; thread-safe."""
+
+    def __init__(self, max_entries: int) -> None:
+        self._max = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                uri, touched = entry
+                if time.monotonic() - touched <= _CAS_RETOUCH_S:
+                    self._entries.move_to_end(key)
+                    return uri
+                # Hay que confirmar que sigue existiendo (y extender su vida)
+                del self._entries[key]
+        # Otro worker de la instancia pudo haberlo subido/tocado (vence a los _CAS_RETOUCH_S)
+        uri = get_shared_cache().get("gcs_cas", key)
+        if uri:
+            self._put_local(key, uri)
+        return uri
+
+    def put(self, key: str, uri: str) -> None:
+        self._put_local(key, uri)
+        get_shared_cache().set("gcs_cas", key, uri, _CAS_RETOUCH_S)
+
+    def _put_local(self, key: str, uri: str) -> None:
+        with self._lock:
+            self._entries[key] = (uri, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def get_cas_index() -> _CasIndex:
+    return _CasIndex(get_settings().gcs_cas_index_size)
+
+
+def _cas_object_path(digest: str, suffix: str) -> str:
+    return f"{get_settings().gcs_cas_prefix}/{digest[:2]}/{digest}{suffix}"
+
+
+@lru_cache(maxsize=32)
+def ensure_cas_lifecycle(bucket_name: str) -> bool:
+    """
+    Agrega (una vez por bucket y proceso) la regla Delete por daysSinceCustomTime sobre el prefijo CAS.
+    Sin permiso storage.buckets.update solo se avisa: la regla se puede crear a mano (ver README).
+    """
+    s = get_settings()
+    if s.gcs_cas_ttl_days <= 0:
+        return False
+    prefix = f"{s.gcs_cas_prefix}/"
+    try:
+        bucket = get_storage_client().get_bucket(bucket_name)
+        for rule in bucket.lifecycle_rules:
+            cond = rule.get("condition", {})
+            if (rule.get("action", {}).get("type") == "Delete"
+                    and cond.get("daysSinceCustomTime") == s.gcs_cas_ttl_days
+                    and cond.get("matchesPrefix") == [prefix]):
+                return True
+        bucket.add_lifecycle_delete_rule(days_since_custom_time=s.gcs_cas_ttl_days, matches_prefix=[prefix])
+        bucket.patch()
+        logger.info("♻️ Lifecycle CAS en gs://%s/%s: borrar tras %s días sin uso.", bucket_name, prefix, s.gcs_cas_ttl_days)
+        return True
+    except Exception as e:
+        logger.warning("⚠️ No se pudo asegurar el lifecycle CAS en %s: %s", bucket_name, e)
+        return False
+
+
+def _touch(blob: storage.Blob) -> bool:
+    """Marca uso (customTime = ahora) en un solo PATCH. False si el objeto no existe."""
+    blob.custom_time = datetime.now(timezone.utc)
+    try:
+        blob.patch()
+        return True
+    except NotFound:
+        return False
+
+
+def _cas_upload(bucket_name: str, digest: str, size: int, suffix: str, upload) -> str:
+    """`upload(blob)` sube el contenido solo si el objeto no existe (ni en el índice ni en GCS)."""
+    path = _cas_object_path(digest, suffix)
+    uri = f"gs://{bucket_name}/{path}"
+    index = get_cas_index()
+    key = f"{bucket_name}/{path}"
+    if index.get(key):
+        incr("gcs.cas_index_hits")
+        incr("gcs.cas_bytes_saved", size)
+        return uri
+
+    ensure_cas_lifecycle(bucket_name)
+    blob = get_storage_client().bucket(bucket_name).blob(path)
+    if _touch(blob):
+        incr("gcs.cas_hits")
+        incr("gcs.cas_bytes_saved", size)
+        logger.info("♻️ GCS CAS hit (%.1f MB no re-subidos) → %s", size / 1e6, uri)
+    else:
+        blob.custom_time = datetime.now(timezone.utc)
+        try:
+            # if_generation_match=0: si otro proceso lo subió entre medio, no se pisa
+            upload(blob)
+            incr("gcs.cas_misses")
+        except PreconditionFailed:
+            incr("gcs.cas_hits")
+    index.put(key, uri)
+    return uri
+
+
+def _sha256_file(local_path: str) -> Tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    with open(local_path, "rb") as fh:
+        for block in iter(lambda: fh.read(_HASH_BLOCK), b""):
+            h.update(block)
+            size += len(block)
+    return h.hexdigest(), size
+
+
+def upload_bytes(bucket_name: str, data: bytes, suffix: str = ".pdf", *,
+                 content_type: str = "application/pdf") -> str:
+    """Sube bytes con nombre por contenido; si ya existen en el bucket, no se re-suben."""
+    digest = hashlib.sha256(data).hexdigest()
+    return _cas_upload(
+        bucket_name, digest, len(data), suffix,
+        lambda blob: blob.upload_from_string(data, content_type=content_type, if_generation_match=0),
+    )
+
+
+def upload_file(bucket_name: str, local_path: str, *, object_path: Optional[str] = None,
+                content_type: str = "application/pdf") -> str:
+    """
+    Sube un archivo local (streaming desde disco, resumable si es grande).
+    Sin `object_path`, el nombre es por contenido (CAS) y un archivo ya subido no se re-sube.
+    """
+    if object_path:
+        get_storage_client().bucket(bucket_name).blob(object_path).upload_from_filename(
+            local_path, content_type=content_type)
+        return f"gs://{bucket_name}/{object_path}"
+    digest, size = _sha256_file(local_path)
+    return _cas_upload(
+        bucket_name, digest, size, os.path.splitext(local_path)[1] or ".bin",
+        lambda blob: blob.upload_from_filename(local_path, content_type=content_type, if_generation_match=0),
+    )
+
+
+# ----------------------------
+# Drive → GCS en streaming
+# ----------------------------
+
+@dataclass
+class TransferResult:
+    file_id: str
+    gcs_uri: str
+    bytes: int
+    seconds: float
+
+    @property
+    def bytes_per_s(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+class _ChunkPipe:
+    """
+    Puente productor/consumidor con cola acotada: el hilo de descarga hace `write(chunk)`
+    y se bloquea si el upload va atrás. Memoria máxima ≈ (depth + 1) chunks.
+    """
+
+    _EOF = object()
+
+    def __init__(self, depth: int) -> None:
+        self._q: "queue.Queue[object]" = queue.Queue(maxsize=depth)
+        self.error: Optional[BaseException] = None
+        self.aborted = threading.Event()
+
+    def write(self, data: bytes) -> int:
+        while True:
+            if self.aborted.is_set():
+                raise RuntimeError("Transferencia abortada por el lado del upload.")
+            try:
+                self._q.put(bytes(data), timeout=1.0)
+                return len(data)
+            except queue.Full:
+                continue
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        while True:
+            try:
+                self._q.put(self._EOF, timeout=1.0)
+                return
+            except queue.Full:
+                if self.aborted.is_set():
+                    return
+
+    def chunks(self):
+        while True:
+            item = self._q.get()
+            if item is self._EOF:
+                return
+            yield item
+
+
+def _discard_partial(writer, blob) -> None:
+    """Un BlobWriter se finaliza al cerrarse (incluso por GC): cerrar y borrar el objeto truncado."""
+    try:
+        writer.close()
+        blob.delete()
+    except Exception as e:
+        logger.debug("No se pudo descartar el upload parcial %s: %s", blob.name, e)
+
+
+def stream_drive_to_gcs(
+    file_id: str,
+    bucket_name: str,
+    *,
+    object_path: Optional[str] = None,
+    suffix: str = ".pdf",
+    content_type: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    depth: int = 2,
+) -> TransferResult:
+    """
+    Copia un archivo de Drive a GCS sin tenerlo completo en memoria:
+    descarga por chunks (hilo productor) → cola acotada → subida resumable (BlobWriter).
+    La descarga y la subida se solapan; memoria ≈ (depth + 2) * chunk_size.
+    """
+    from src.clients.drive_client import download_file_to
+
+    settings = get_settings()
+    chunk = chunk_size or settings.transfer_chunk_mb * 1024 * 1024
+    chunk = max(_GCS_CHUNK_ALIGN, (chunk // _GCS_CHUNK_ALIGN) * _GCS_CHUNK_ALIGN)
+
+    path = object_path or _new_object_path(suffix)
+    blob = get_storage_client().bucket(bucket_name).blob(path)
+    pipe = _ChunkPipe(depth)
+
+    def _produce() -> None:
+        try:
+            download_file_to(file_id, pipe, chunk_size=chunk)
+        except BaseException as e:
+            pipe.close(e)
+        else:
+            pipe.close()
+
+    t0 = time.perf_counter()
+    # El writer se abre antes de arrancar la descarga: si falla, no queda un productor
+    # bloqueado en la cola (y con la descarga de Drive abierta) sin nadie que consuma
+    writer = blob.open("wb", chunk_size=chunk, content_type=content_type or "application/pdf")
+    producer = threading.Thread(target=_produce, name=f"drive-dl-{file_id[:8]}", daemon=True)
+    producer.start()
+    total = 0
+    try:
+        for data in pipe.chunks():
+            writer.write(data)
+            total += len(data)
+        if pipe.error is not None:
+            raise pipe.error
+        writer.close()  # último chunk + finaliza la sesión resumable
+    except BaseException:
+        pipe.aborted.set()
+        producer.join(timeout=5)
+        _discard_partial(writer, blob)
+        raise
+    producer.join()
+
+    elapsed = time.perf_counter() - t0
+    result = TransferResult(file_id=file_id, gcs_uri=f"gs://{bucket_name}/{path}", bytes=total, seconds=elapsed)
+    logger.info(
+        "📦 Drive→GCS %s: %.1f MB en %.1fs (%.1f MB/s) → %s",
+        file_id, total / 1e6, elapsed, result.bytes_per_s / 1e6, result.gcs_uri,
+        extra={"transfer_bytes": total, "transfer_bytes_per_s": round(result.bytes_per_s)},
+    )
+    return result
+
+
+def stream_many_drive_to_gcs(
+    file_ids: Sequence[str],
+    bucket_name: str,
+    *,
+    max_workers: Optional[int] = None,
+    suffix: str = ".pdf",
+) -> Dict[str, Union[TransferResult, Exception]]:
+    """
+    Varias transferencias Drive→GCS en paralelo (cada una en streaming).
+    Devuelve {file_id: TransferResult | Exception}; un fallo no cancela las demás.
+    """
+    workers = max_workers or get_settings().transfer_concurrency
+    out: Dict[str, Union[TransferResult, Exception]] = {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="drive2gcs") as pool:
+        futures = {fid: pool.submit(stream_drive_to_gcs, fid, bucket_name, suffix=suffix) for fid in dict.fromkeys(file_ids)}
+        for fid, fut in futures.items():
+            try:
+                out[fid] = fut.result()
+            except Exception as e:
+                logger.error("❌ Drive→GCS %s falló: %s", fid, e)
+                out[fid] = e
+
+    elapsed = time.perf_counter() - t0
+    moved = sum(r.bytes for r in out.values() if isinstance(r, TransferResult))
+    logger.info("📦 %s transferencias (%s con error): %.1f MB en %.1fs (%.1f MB/s agregados).",
+                len(out), sum(1 for r in out.values() if isinstance(r, Exception)),
+                moved / 1e6, elapsed, (moved / elapsed / 1e6) if elapsed > 0 else 0.0)
+    return out
@@ -6,8 +6,11 @@ import socket
 import ssl
 import json
 import re
+import difflib
+import asyncio
+from dataclasses import dataclass
 
-from typing import Any, Dict, List, Optional, TypedDict, cast, Iterator, Tuple
+from typing import Any, Callable, Dict, Generator, List, Optional, TypedDict, cast, Iterator, Tuple
 from http.client import IncompleteRead
 
 
@@ -15,7 +18,12 @@ from googleapiclient.errors import HttpError
 from googleapiclient.http import HttpRequest
 from src.auth import build_docs_client
 from src.clients.drive_client import create_google_doc_in_folder  # ✅ nuevo import
+from src import metrics
+from src.deadline import check_deadline
 from src.logging_conf import get_logger
+from src.orchestration.scheduler import get_rate_limiter
+from src.settings import get_settings
+from src.shared_cache import get_shared_cache
 
 logger = get_logger(__name__)
 
@@ -42,7 +50,7 @@ def insert_text_into_empty_document(document_id: str, text: str) -> None:
         body = {"requests": [{"insertText": {"location": {"index": 1}, "text": chunk}}]}
         req: HttpRequest = docs.documents().batchUpdate(documentId=document_id, body=body)
         _execute_with_retries(req)
-        logger.info(f"✍️ Insertado chunk {part} ({len(chunk)} chars)")
+        logger.info("✍️ Insertado chunk %s (%s chars)", part, len(chunk))
         start += MAX_CHARS
         part += 1
         time.sleep(0.15)
@@ -78,7 +86,8 @@ class Document(TypedDict, total=False):
 
 def _extract_reason(err: HttpError) -> str:
     try:
-        data = err.error_details or err.content or b""
+        # El cuerpo JSON de Google (error_details es solo `details` o, sin él, el mensaje)
+        data = err.content or b""
         if isinstance(data, bytes):
             data = data.decode("utf-8", errors="ignore")
         j = json.loads(data)
@@ -105,9 +114,10 @@ def _execute_with_retries(request: HttpRequest, *, max_retries: int = 6) -> Opti
             # Errores de transporte (incluye TLS/EOF)
             if attempt == max_retries:
                 raise
+            check_deadline("reintento Docs")
             sleep = delay + random.uniform(0, delay * 0.5)
             kind = "SSL/EOF" if isinstance(e, ssl.SSLError) or _is_ssl_eof(e) else "RED"
-            logger.warning(f"🔁 Retry {attempt}/{max_retries} por {kind}: {e}. Esperando {sleep:.1f}s…")
+            logger.warning("🔁 Retry %s/%s por %s: %s. Esperando %.1fs…", attempt, max_retries, kind, e, sleep)
             time.sleep(sleep)
             delay = min(delay * 2, 20)
             # ⚠️ Para intentos altos, re-crea el cliente (por si la sesión quedó “sucia”)
@@ -119,8 +129,9 @@ def _execute_with_retries(request: HttpRequest, *, max_retries: int = 6) -> Opti
         except HttpError as e:
             status = getattr(e, "status_code", None) or getattr(e.resp, "status", None)
             if status in _RETRY_STATUSES and attempt < max_retries:
+                check_deadline("reintento Docs")
                 sleep = delay + random.uniform(0, delay * 0.5)
-                logger.warning(f"🔁 Retry {attempt}/{max_retries} por HttpError {status}: {e}. Esperando {sleep:.1f}s…")
+                logger.warning("🔁 Retry %s/%s por HttpError %s: %s. Esperando %.1fs…", attempt, max_retries, status, e, sleep)
                 time.sleep(sleep)
                 delay = min(delay * 2, 20)
                 continue
@@ -227,7 +238,7 @@ def write_to_document(document_id: str, text: str) -> None:
             insert_body = {"requests": [{"insertText": {"location": {"index": 1}, "text": chunk}}]}
             insert_req: HttpRequest = docs.documents().batchUpdate(documentId=document_id, body=insert_body)
             _execute_with_retries(insert_req)
-            logger.info(f"✍️ Insertado chunk {part} ({len(chunk)} chars)")
+            logger.info("✍️ Insertado chunk %s (%s chars)", part, len(chunk))
             start += MAX_CHARS
             part += 1
             time.sleep(0.15)  # ⬅️ 150ms para no “aplanar” el backend
@@ -247,185 +258,155 @@ _OL_RE     = re.compile(r"^(\s*)(\d+)[.)]\s+(.*)$")
 _CODEFENCE_RE = re.compile(r"^```")
 
 # ----------------------------
-# Lotes para batchUpdate
+# Reescritura: borrado seguro (conserva \n final) + inserción
 # ----------------------------
 
-def _flush_requests(docs, document_id: str, requests: List[Dict[str, Any]]):
-    if not requests:
-        return
-    body = {"requests": requests}
-    req: HttpRequest = docs.documents().batchUpdate(documentId=document_id, body=body)
-    _execute_with_retries(req)
-    requests.clear()
+def _rewrite_plan(doc: Dict[str, Any], blocks: List[_Block]) -> List[Dict[str, Any]]:
+    """Borrado (conserva \n final) + inserción de todos los bloques, en un solo plan."""
+    requests: List[Dict[str, Any]] = []
+    delete_end = max(1, _get_end_index(cast(Document, doc)) - 1)
+    if delete_end > 1:
+        requests.append({"deleteContentRange": {"range": {"startIndex": 1, "endIndex": delete_end}}})
+    cursor = 1
+    for block in blocks:
+        block_reqs, cursor = _block_requests(block, cursor)
+        requests.extend(block_reqs)
+    return requests
+
 
 # ----------------------------
-# Borrado seguro (conserva \n final)
+# Modelo intermedio: Markdown → párrafos
 # ----------------------------
+# El render pasa por una lista de bloques de párrafos (_Para). Así la reescritura
+# completa y el modo diff generan EXACTAMENTE el mismo documento, y el diff puede
+# comparar lo que se va a escribir con lo que ya hay en el Doc.
 
-def _clear_document_keep_trailing_newline(docs, document_id: str):
-    get_req: HttpRequest = docs.documents().get(documentId=document_id)
-    doc_raw: Optional[Dict[str, Any]] = _execute_with_retries(get_req)
-    doc = cast(Dict[str, Any], doc_raw)
-    end_index: int = _get_end_index(doc)
-    delete_end = max(1, end_index - 1)
-    if delete_end > 1:
-        del_req: HttpRequest = docs.documents().batchUpdate(
-            documentId=document_id,
-            body={
-                "requests": [
-                    {"deleteContentRange": {"range": {"startIndex": 1, "endIndex": delete_end}}}
-                ]
-            },
-        )
-        _execute_with_retries(del_req)
-    # devolvemos el índice actual para empezar a insertar
-    return 1  # insert at beginning
+_MONO_FONT = "Roboto Mono"
+_TEXT_STYLE_FIELDS = "bold,italic,link,weightedFontFamily"
 
-# ----------------------------
-# Helpers de estilos inline
-# ----------------------------
+# Estilo inline de un tramo: (bold, italic, link_url, monospace)
+_InlineStyle = Tuple[bool, bool, Optional[str], bool]
+_NO_STYLE: _InlineStyle = (False, False, None, False)
 
-def _apply_inline_styles(docs, document_id: str, base_index: int, paragraph_text: str, requests: List[Dict[str, Any]]):
-    """
-    Aplica negritas, cursivas y links sobre el texto recién insertado.
-    base_index: índice de inicio del párrafo (en el doc) justo antes del insert de este párrafo.
-    Retorna length total del texto insertado (para avanzar el cursor).
-    """
-    # Primero convertimos [texto](url) a "texto" y guardamos rangos
-    link_spans: List[Tuple[int, int, str]] = []
-    out = []
-    i = 0
-    for m in _LINK_RE.finditer(paragraph_text):
-        start, end = m.span()
-        text_label, url = m.group(1), m.group(2)
-        # texto previo
-        out.append(paragraph_text[i:start])
-        # el texto visible
-        link_start = sum(len(x) for x in out)
-        out.append(text_label)
-        link_end = link_start + len(text_label)
-        link_spans.append((link_start, link_end, url))
-        i = end
-    out.append(paragraph_text[i:])
-    normalized = "".join(out)
-
-    # Detectamos negritas y cursivas sobre "normalized"
-    # Guardamos y luego quitamos los marcadores para calcular rangos limpios
-    spans_bold: List[Tuple[int,int]] = []
-    spans_italic: List[Tuple[int,int]] = []
-
-    def _collect_spans(pattern: re.Pattern, text: str) -> Tuple[str, List[Tuple[int,int]]]:
-        spans = []
-        result = []
-        shift = 0
-        last = 0
-        for m in pattern.finditer(text):
-            s, e = m.span()
-            content = m.group(1)
-            # previo
-            result.append(text[last:s])
-            start_idx = sum(len(x) for x in result)
-            result.append(content)
-            end_idx = start_idx + len(content)
-            spans.append((start_idx, end_idx))
-            last = e
-        result.append(text[last:])
-        return "".join(result), spans
-
-    normalized, spans_bold = _collect_spans(_BOLD_RE, normalized)
-    normalized, spans_italic = _collect_spans(_ITALIC_RE, normalized)
-
-    # Insertamos el texto ya limpio de marcadores + salto de línea
-    text_with_newline = normalized + "\n"
-    requests.append({"insertText": {"location": {"index": base_index}, "text": text_with_newline}})
-    # Rango del párrafo insertado (sin contar el \n al estilizar inline)
-    start_idx = base_index
-    end_idx = base_index + len(normalized)
-
-    # Links
-    for (ls, le, url) in link_spans:
-        requests.append({
-            "updateTextStyle": {
-                "range": {"startIndex": start_idx + ls, "endIndex": start_idx + le},
-                "textStyle": {"link": {"url": url}},
-                "fields": "link"
-            }
-        })
+# Regla horizontal = párrafo vacío con borde inferior (la Docs API no inserta <hr>)
+_HR_BORDER = {
+    "color": {"color": {"rgbColor": {"red": 0.6, "green": 0.6, "blue": 0.6}}},
+    "width": {"magnitude": 1, "unit": "PT"},
+    "padding": {"magnitude": 1, "unit": "PT"},
+    "dashStyle": "SOLID",
+}
 
-    # Negritas
-    for (bs, be) in spans_bold:
-        requests.append({
-            "updateTextStyle": {
-                "range": {"startIndex": start_idx + bs, "endIndex": start_idx + be},
-                "textStyle": {"bold": True},
-                "fields": "bold"
-            }
-        })
 
-    # Cursivas
-    for (is_, ie) in spans_italic:
-        requests.append({
-            "updateTextStyle": {
-                "range": {"startIndex": start_idx + is_, "endIndex": start_idx + ie},
-                "textStyle": {"italic": True},
-                "fields": "italic"
-            }
-        })
+def _u16len(s: str) -> int:
+    """Longitud en unidades UTF-16: así cuenta índices la Docs API (un emoji = 2)."""
+    return len(s.encode("utf-16-le")) // 2
 
-    # devolvemos el avance total (texto + \n)
-    return len(text_with_newline)
 
-# ----------------------------
-# Listas (bullets / números)
-# ----------------------------
+@dataclass(frozen=True)
+class _Para:
+    """Párrafo renderizado o leído del Doc. Offsets de `runs` en unidades UTF-16."""
+    text: str
+    style: str = "NORMAL_TEXT"       # namedStyleType
+    list_kind: Optional[str] = None  # "ordered" | "bullet"
+    hr: bool = False
+    runs: Tuple[Tuple[int, int, _InlineStyle], ...] = ()
 
-def _apply_list_bullets(requests: List[Dict[str, Any]], list_start_idx: int, list_end_idx: int, ordered: bool):
-    preset = "NUMBERED_DECIMAL_ALPHA_ROMAN" if ordered else "BULLET_DISC_CIRCLE_SQUARE"
-    requests.append({
-        "createParagraphBullets": {
-            "range": {"startIndex": list_start_idx, "endIndex": list_end_idx},
-            "bulletPreset": preset
-        }
-    })
+    @property
+    def size(self) -> int:
+        return _u16len(self.text) + 1  # + "\n"
 
-# ----------------------------
-# Encabezados
-# ----------------------------
 
-def _apply_heading_style(requests: List[Dict[str, Any]], start_idx: int, end_idx: int, level: int):
-    level = max(1, min(level, 6))
-    requests.append({
-        "updateParagraphStyle": {
-            "range": {"startIndex": start_idx, "endIndex": end_idx},
-            "paragraphStyle": {"namedStyleType": f"HEADING_{level}"},
-            "fields": "namedStyleType"
-        }
-    })
+_Block = Tuple[_Para, ...]
 
-# ----------------------------
-# Escribir Markdown → Google Doc
-# ----------------------------
 
-def write_markdown_to_document(document_id: str, markdown_text: str) -> None:
+def _strip_markers(text: str, pattern: re.Pattern) -> Tuple[str, List[Tuple[int, int, re.Match]], Any]:
+    """
+    Quita los marcadores de `pattern` (el grupo 1 es el contenido visible).
+    Devuelve (texto_limpio, spans_nuevos, remap) donde remap traduce índices
+    del texto original al limpio (para reubicar spans de pasadas anteriores).
     """
-    Convierte un subset útil de Markdown a formato nativo de Google Docs:
+    pieces: List[str] = []
+    found: List[Tuple[int, int, re.Match]] = []
+    shifts: List[Tuple[int, int]] = []  # (índice original, removidos acumulados desde ahí)
+    removed = 0
+    last = 0
+    for m in pattern.finditer(text):
+        s, e = m.span()
+        cs, ce = m.span(1)
+        pieces.append(text[last:s])
+        pieces.append(text[cs:ce])
+        removed += cs - s
+        shifts.append((cs, removed))
+        found.append((cs - removed, ce - removed, m))
+        removed += e - ce
+        shifts.append((e, removed))
+        last = e
+    pieces.append(text[last:])
+
+    def remap(i: int) -> int:
+        r = 0
+        for threshold, cum in shifts:
+            if i < threshold:
+                break
+            r = cum
+        return i - r
+
+    return "".join(pieces), found, remap
+
+
+def _runs_from_spans(text: str, spans: List[Tuple[int, int, str, Any]], *, mono: bool = False) -> Tuple[Tuple[int, int, _InlineStyle], ...]:
+    n = len(text)
+    points = sorted({0, n, *(s for s, _, _, _ in spans), *(e for _, e, _, _ in spans)})
+    merged: List[List[Any]] = []
+    for a, b in zip(points, points[1:]):
+        if a >= b or b > n:
+            continue
+        bold = any(at == "bold" and s <= a and b <= e for s, e, at, _ in spans)
+        italic = any(at == "italic" and s <= a and b <= e for s, e, at, _ in spans)
+        link = next((v for s, e, at, v in spans if at == "link" and s <= a and b <= e), None)
+        style: _InlineStyle = (bold, italic, link, mono)
+        if merged and merged[-1][2] == style and merged[-1][1] == a:
+            merged[-1][1] = b
+        else:
+            merged.append([a, b, style])
+
+    astral = _u16len(text) != n
+    runs = []
+    for a, b, style in merged:
+        if style == _NO_STYLE:
+            continue
+        if astral:
+            a, b = _u16len(text[:a]), _u16len(text[:b])
+        runs.append((a, b, style))
+    return tuple(runs)
+
+
+def _parse_inline(text: str) -> Tuple[str, Tuple[Tuple[int, int, _InlineStyle], ...]]:
+    """
+    [texto](url), **negritas** y *cursivas* → (texto sin marcadores, runs de estilo).
+    Cada pasada reubica los spans de las anteriores, así los rangos quedan
+    correctos aunque se combinen estilos en la misma línea.
+    """
+    spans: List[Tuple[int, int, str, Any]] = []
+    for pattern, attr in ((_LINK_RE, "link"), (_BOLD_RE, "bold"), (_ITALIC_RE, "italic")):
+        text, found, remap = _strip_markers(text, pattern)
+        spans = [(remap(s), remap(e), at, v) for s, e, at, v in spans]
+        spans += [(s, e, attr, m.group(2) if attr == "link" else True) for s, e, m in found]
+    return text, _runs_from_spans(text, spans)
+
+
+def _parse_markdown(markdown_text: str) -> List[_Block]:
+    """
+    Subset útil de Markdown → bloques de párrafos:
     - #..###### → HEADING_X
-    - listas -,*,+ → bullets
-    - listas numeradas 1. 2. → numbered
+    - listas -,*,+ / 1. 2. → un bloque por lista contigua
     - **bold**, *italic*, [link](url)
     - --- / *** → horizontal rule
-    - párrafos normales
-    Maneja lotes y respeta newline terminal del doc.
+    - ``` → líneas en monoespaciado
+    - párrafos normales (incluye líneas vacías)
     """
-    docs = build_docs_client()
-    cursor = _clear_document_keep_trailing_newline(docs, document_id)
-
-    # Normalización básica
     lines = markdown_text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
-    requests: List[Dict[str, Any]] = []
-    batch_size = 0
-    BATCH_LIMIT = 180  # operaciones por flush (ajusta si hace falta)
-
+    blocks: List[_Block] = []
     i = 0
     N = len(lines)
 
@@ -434,90 +415,642 @@ def write_markdown_to_document(document_id: str, markdown_text: str) -> None:
 
         # 1) Regla horizontal
         if _HR_RE.match(line.strip()):
-            requests.append({"insertHorizontalRule": {"location": {"index": cursor}}})
-            # \n de separación para que el siguiente párrafo no se pegue
-            requests.append({"insertText": {"location": {"index": cursor}}, "text": "\n"})
-            cursor += 1
-            batch_size += 2
+            blocks.append((_Para("", hr=True),))
 
-        # 2) Fenced code blocks: por simplicidad los pegamos como texto monoespaciado
+        # 2) Fenced code blocks: una línea = un párrafo monoespaciado
         elif _CODEFENCE_RE.match(line.strip()):
             i += 1
-            code_lines = []
             while i < N and not _CODEFENCE_RE.match(lines[i].strip()):
-                code_lines.append(lines[i])
+                code = lines[i]
+                runs = ((0, _u16len(code), (False, False, None, True)),) if code else ()
+                blocks.append((_Para(code, runs=runs),))
                 i += 1
-            code_text = "\n".join(code_lines)
-
-            # Insertamos el bloque y luego aplicamos fuente monoespaciada
-            text_len = len(code_text) + 1  # +\n
-            requests.append({"insertText": {"location": {"index": cursor}, "text": code_text + "\n"}})
-            requests.append({
-                "updateTextStyle": {
-                    "range": {"startIndex": cursor, "endIndex": cursor + len(code_text)},
-                    "textStyle": {"weightedFontFamily": {"fontFamily": "Roboto Mono"}},
-                    "fields": "weightedFontFamily"
-                }
-            })
-            cursor += text_len
-            batch_size += 2
 
         # 3) Encabezados ATX
         elif (m := _ATX_H_RE.match(line)):
-            hashes, title = m.group(1), m.group(2).strip()
-            level = len(hashes)
-            # insert + estilo heading
-            inserted = _apply_inline_styles(docs, document_id, cursor, title, requests)
-            _apply_heading_style(requests, cursor, cursor + inserted - 1, level)  # -1 para no incluir \n
-            cursor += inserted
-            batch_size += 2 + 10  # aprox (inline styles generan varias ops)
+            level = max(1, min(len(m.group(1)), 6))
+            text, runs = _parse_inline(m.group(2).strip())
+            blocks.append((_Para(text, style=f"HEADING_{level}", runs=runs),))
 
         # 4) Listas (bloque contiguo UL/OL)
         elif _UL_RE.match(line) or _OL_RE.match(line):
-            # Detecta el bloque completo de lista
-            list_lines: List[Tuple[str, bool]] = []  # (texto, ordered?)
-            ordered_block = bool(_OL_RE.match(line))
+            items: List[Tuple[str, Tuple[Tuple[int, int, _InlineStyle], ...]]] = []
+            ordered_block = False
             j = i
-            while j < N and ( _UL_RE.match(lines[j]) or _OL_RE.match(lines[j]) ):
+            while j < N and (_UL_RE.match(lines[j]) or _OL_RE.match(lines[j])):
                 lm = _UL_RE.match(lines[j])
-                if lm:
-                    text_item = lm.group(3).strip()
-                    list_lines.append((text_item, False))
-                else:
+                if not lm:
                     lm = _OL_RE.match(lines[j])
-                    text_item = lm.group(3).strip()
-                    list_lines.append((text_item, True))
+                    ordered_block = True
+                items.append(_parse_inline(lm.group(3).strip()))
                 j += 1
+            kind = "ordered" if ordered_block else "bullet"
+            blocks.append(tuple(_Para(t, list_kind=kind, runs=r) for t, r in items))
+            i = j - 1  # -1 porque al final del loop haremos i += 1
 
-            list_start_idx = cursor
-            # insertamos cada ítem como un párrafo (luego se convierte a bullet/numbered)
-            for (item_text, is_ordered) in list_lines:
-                inserted = _apply_inline_styles(docs, document_id, cursor, item_text, requests)
-                cursor += inserted
-                batch_size += 1 + 8  # aproximado
-                ordered_block = ordered_block or is_ordered
+        # 5) Párrafo normal (incluye líneas vacías → saltos)
+        else:
+            text, runs = _parse_inline(line if line.strip() != "" else "")
+            blocks.append((_Para(text, runs=runs),))
 
-            list_end_idx = cursor - 1  # antes del \n final del último item
-            _apply_list_bullets(requests, list_start_idx, list_end_idx, ordered=ordered_block)
-            batch_size += 1
+        i += 1
 
-            i = j - 1  # -1 porque al final del loop haremos i += 1
+    return blocks
 
-        # 5) Párrafo normal (incluye líneas vacías → saltos)
+# ----------------------------
+# Párrafos → requests de batchUpdate
+# ----------------------------
+
+def _apply_list_bullets(requests: List[Dict[str, Any]], list_start_idx: int, list_end_idx: int, ordered: bool):
+    preset = "NUMBERED_DECIMAL_ALPHA_ROMAN" if ordered else "BULLET_DISC_CIRCLE_SQUARE"
+    requests.append({
+        "createParagraphBullets": {
+            "range": {"startIndex": list_start_idx, "endIndex": list_end_idx},
+            "bulletPreset": preset
+        }
+    })
+
+
+def _apply_paragraph_style(requests: List[Dict[str, Any]], para: _Para, start_idx: int, *, reset: bool):
+    """
+    namedStyleType (HEADING_X / NORMAL_TEXT) y borde de regla horizontal.
+    Con reset=True también limpia bullets/bordes heredados del párrafo vecino
+    (necesario al insertar en medio de un Doc con contenido).
+    """
+    end_idx = start_idx + para.size
+    if not (reset or para.hr or para.style != "NORMAL_TEXT"):
+        return
+    style: Dict[str, Any] = {"namedStyleType": para.style}
+    fields = ["namedStyleType"]
+    if para.hr:
+        style["borderBottom"] = _HR_BORDER
+        fields.append("borderBottom")
+    elif reset:
+        fields.append("borderBottom")
+    requests.append({
+        "updateParagraphStyle": {
+            "range": {"startIndex": start_idx, "endIndex": end_idx},
+            "paragraphStyle": style,
+            "fields": ",".join(fields),
+        }
+    })
+    if reset and not para.list_kind:
+        requests.append({"deleteParagraphBullets": {"range": {"startIndex": start_idx, "endIndex": end_idx}}})
+
+
+def _apply_text_runs(requests: List[Dict[str, Any]], para: _Para, start_idx: int, *, reset: bool):
+    """Negritas, cursivas, links y monoespaciado sobre el texto del párrafo (sin el \\n)."""
+    text_len = para.size - 1
+    if reset and text_len > 0:
+        requests.append({
+            "updateTextStyle": {
+                "range": {"startIndex": start_idx, "endIndex": start_idx + text_len},
+                "textStyle": {},
+                "fields": _TEXT_STYLE_FIELDS,
+            }
+        })
+    for a, b, (bold, italic, link, mono) in para.runs:
+        style: Dict[str, Any] = {}
+        if link:
+            style["link"] = {"url": link}
+        if bold:
+            style["bold"] = True
+        if italic:
+            style["italic"] = True
+        if mono:
+            style["weightedFontFamily"] = {"fontFamily": _MONO_FONT}
+        requests.append({
+            "updateTextStyle": {
+                "range": {"startIndex": start_idx + a, "endIndex": start_idx + b},
+                "textStyle": style,
+                "fields": ",".join(style),
+            }
+        })
+
+
+def _block_requests(block: _Block, index: int, *, reset: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+    """Inserta un bloque en `index`. Devuelve (requests, índice siguiente)."""
+    requests: List[Dict[str, Any]] = []
+    cursor = index
+    for para in block:
+        requests.append({"insertText": {"location": {"index": cursor}, "text": para.text + "\n"}})
+        _apply_paragraph_style(requests, para, cursor, reset=reset)
+        _apply_text_runs(requests, para, cursor, reset=reset)
+        cursor += para.size
+    if block and block[0].list_kind:
+        _apply_list_bullets(requests, index, cursor - 1, ordered=block[0].list_kind == "ordered")
+    return requests, cursor
+
+
+# ----------------------------
+# Pasos de I/O de una escritura
+# ----------------------------
+# La lógica de escritura (plan, lotes, checkpoint, conflictos de revisión) es un generador
+# que emite estos pasos; _run_write_steps (cliente síncrono) y _arun_write_steps (google_async)
+# los ejecutan y le devuelven el resultado, o le lanzan la excepción, en el punto del `yield`.
+
+@dataclass
+class _GetDoc:
+    pass
+
+
+@dataclass
+class _BatchUpdate:
+    """Un batchUpdate: espera un token de DOCS_WRITE_RPM (la cuota de Docs cuenta requests)."""
+    requests: List[Dict[str, Any]]
+    revision: Optional[str]
+
+
+@dataclass
+class _Upload:
+    """Reemplazo del contenido con una subida de Drive (también gasta un token de DOCS_WRITE_RPM)."""
+    data: bytes
+    mime: str
+
+
+@dataclass
+class _Blocking:
+    """Cache compartido (SQLite) o CPU: en el driver async corre en un hilo."""
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...] = ()
+
+
+@dataclass
+class _Pause:
+    seconds: float
+
+
+_WriteSteps = Generator[Any, Any, Dict[str, Any]]
+
+
+def _flush_steps(requests: List[Dict[str, Any]], *, batch_limit: int, required_revision_id: Optional[str] = None,
+                 start_batch: int = 0, checkpoint: Optional["_WriteCheckpoint"] = None) -> Generator[Any, Any, int]:
+    """
+    Envía `requests` en lotes secuenciales (desde el lote `start_batch`). Devuelve cuántos
+    batchUpdate se hicieron. Con `checkpoint`, cada lote aplicado queda anotado (ver _WriteCheckpoint).
+    Con el deadline del request vencido (o el cliente desconectado) no se envían los lotes que faltan.
+    """
+    calls = 0
+    revision = required_revision_id
+    for start in range(start_batch * batch_limit, len(requests), batch_limit):
+        check_deadline(f"Docs batchUpdate {start_batch + calls + 1}")
+        resp = (yield _BatchUpdate(requests[start:start + batch_limit], revision)) or {}
+        revision = resp.get("writeControl", {}).get("requiredRevisionId") if revision else None
+        calls += 1
+        if checkpoint is not None:
+            yield _Blocking(checkpoint.advance, (start_batch + calls, revision))
+        if start + batch_limit < len(requests):
+            yield _Pause(0.1)
+    return calls
+
+
+# ----------------------------
+# Escritura reanudable (checkpoint por lote)
+# ----------------------------
+# Con `checkpoint` (clave estable del request), antes del primer batchUpdate se guardan en el
+# cache compartido el plan completo y el Markdown (una vez), y después de cada lote solo el
+# número de lotes aplicados y el revisionId que devolvió Docs (entrada aparte, chica). Si la
+# escritura se corta (p.ej. tras 6 de 9 lotes), el reintento sigue desde el lote 7 con
+# writeControl.requiredRevisionId: si el Doc cambió entre medio (edición, o un lote que sí se
+# aplicó pero cuya respuesta se perdió), Docs lo rechaza y se re-planifica desde el estado
+# actual. Al terminar se borra. Sin cache compartido (SHARED_CACHE_PATH vacío; get_shared_cache
+# lo avisa al arrancar) o con WRITE_CHECKPOINT_TTL_S=0 no se guarda nada: la escritura corre
+# igual, pero un corte obliga a regenerar y reescribir todo.
+
+_CHECKPOINT_NS = "doc_write"
+_PROGRESS_NS = "doc_write_progress"
+
+
+def load_write_checkpoint(key: str) -> Optional[Dict[str, Any]]:
+    """Escritura pendiente guardada con `key` ({"doc", "text", "meta", "applied", ...}) o None."""
+    cache = get_shared_cache()
+    plan = cache.get(_CHECKPOINT_NS, key)
+    if not plan:
+        return None
+    return {**plan, **(cache.get(_PROGRESS_NS, key) or {})}
+
+
+class _WriteCheckpoint:
+    def __init__(self, key: str, document_id: str, text: str, meta: Optional[Dict[str, Any]]) -> None:
+        self.key = key
+        self.state: Dict[str, Any] = {"doc": document_id, "text": text, "meta": meta or {}}
+
+    def pending(self) -> Optional[Dict[str, Any]]:
+        """Plan a medio aplicar para este mismo Doc y texto (y con revisión para validarlo)."""
+        state = load_write_checkpoint(self.key)
+        if not state or state.get("doc") != self.state["doc"] or state.get("text") != self.state["text"]:
+            return None
+        if not state.get("requests") or not state.get("revision"):
+            return None
+        return state
+
+    def start(self, mode: str, requests: List[Dict[str, Any]], batch_limit: int, revision: Optional[str]) -> None:
+        self.state.update(mode=mode, requests=requests, batch_limit=batch_limit)
+        get_shared_cache().set(_CHECKPOINT_NS, self.key, self.state, ttl_s=get_settings().write_checkpoint_ttl_s)
+        self.advance(0, revision)
+
+    def advance(self, applied: int, revision: Optional[str]) -> None:
+        # Por lote solo el progreso: el plan y el texto ya quedaron guardados en start()
+        get_shared_cache().set(_PROGRESS_NS, self.key, {"applied": applied, "revision": revision},
+                               ttl_s=get_settings().write_checkpoint_ttl_s)
+
+    def clear(self) -> None:
+        cache = get_shared_cache()
+        cache.delete(_CHECKPOINT_NS, self.key)
+        cache.delete(_PROGRESS_NS, self.key)
+
+
+def _batches(requests: List[Dict[str, Any]], batch_limit: int) -> int:
+    return -(-len(requests) // batch_limit)
+
+
+def _resume_steps(document_id: str, checkpoint: _WriteCheckpoint) -> Generator[Any, Any, Optional[Dict[str, Any]]]:
+    """Aplica los lotes que faltan de una escritura cortada. None → no había, o el Doc cambió."""
+    state = yield _Blocking(checkpoint.pending)
+    if state is None:
+        return None
+    requests, batch_limit, applied = state["requests"], state["batch_limit"], state["applied"]
+    logger.info("⏯️ Reanudando escritura de %s: lote %s de %s.", document_id, applied + 1, _batches(requests, batch_limit))
+    checkpoint.state = state
+    try:
+        calls = yield from _flush_steps(requests, batch_limit=batch_limit, required_revision_id=state["revision"],
+                                        start_batch=applied, checkpoint=checkpoint)
+    except HttpError as e:
+        if not is_revision_conflict(e):
+            raise
+        metrics.incr("docs.write_resume_conflicts")
+        logger.warning("⚠️ El Doc %s cambió desde el lote %s (%s): se re-planifica.", document_id, applied, e)
+        return None
+    yield _Blocking(checkpoint.clear)
+    metrics.incr("docs.write_resumed")
+    return {"mode": state["mode"], "requests": len(requests), "batch_updates": calls, "resumed_from_batch": applied + 1}
+
+# ----------------------------
+# Doc existente → párrafos (para el diff)
+# ----------------------------
+
+def _doc_list_kind(doc: Dict[str, Any], bullet: Dict[str, Any]) -> str:
+    lst = doc.get("lists", {}).get(bullet.get("listId", ""), {})
+    levels = lst.get("listProperties", {}).get("nestingLevels", [])
+    level = levels[bullet.get("nestingLevel", 0)] if levels else {}
+    glyph = level.get("glyphType")
+    return "ordered" if glyph and glyph not in ("GLYPH_TYPE_UNSPECIFIED", "NONE") else "bullet"
+
+
+def _doc_para(doc: Dict[str, Any], para: Dict[str, Any], start: int, end: int) -> _Para:
+    parts: List[str] = []
+    raw_runs: List[Tuple[int, int, _InlineStyle]] = []
+    text_len = end - start - 1
+    for el in para.get("elements", []):
+        tr = el.get("textRun")
+        if tr is None:
+            parts.append("￼")  # objeto no textual: nunca coincide con lo renderizado
+            continue
+        parts.append(tr.get("content", ""))
+        ts = tr.get("textStyle", {})
+        style: _InlineStyle = (
+            bool(ts.get("bold")),
+            bool(ts.get("italic")),
+            (ts.get("link") or {}).get("url"),
+            (ts.get("weightedFontFamily") or {}).get("fontFamily") == _MONO_FONT,
+        )
+        a = max(0, int(el.get("startIndex", start)) - start)
+        b = min(text_len, int(el.get("endIndex", end)) - start)
+        if a < b:
+            if raw_runs and raw_runs[-1][2] == style and raw_runs[-1][1] == a:
+                raw_runs[-1] = (raw_runs[-1][0], b, style)
+            else:
+                raw_runs.append((a, b, style))
+
+    text = "".join(parts)
+    if text.endswith("\n"):
+        text = text[:-1]
+    pstyle = para.get("paragraphStyle", {})
+    bullet = para.get("bullet")
+    border = (pstyle.get("borderBottom") or {}).get("width", {}).get("magnitude", 0)
+    return _Para(
+        text=text,
+        style=pstyle.get("namedStyleType", "NORMAL_TEXT"),
+        list_kind=_doc_list_kind(doc, bullet) if bullet else None,
+        hr=bool(border) and text == "",
+        runs=tuple(r for r in raw_runs if r[2] != _NO_STYLE),
+    )
+
+
+@dataclass
+class _DocBlock:
+    paras: _Block
+    start: int
+    end: int
+
+
+def _read_doc_blocks(doc: Dict[str, Any]) -> Optional[Tuple[List[_DocBlock], int]]:
+    """
+    Agrupa los párrafos del body en bloques (lista contigua = un bloque).
+    Devuelve (bloques, índice del párrafo final) o None si el Doc tiene
+    estructuras que el diff no maneja (tablas, TOC) o un párrafo final no vacío.
+    """
+    paras: List[Tuple[_Para, int, int, Optional[str]]] = []
+    for elem in doc.get("body", {}).get("content", []):
+        if "table" in elem or "tableOfContents" in elem:
+            return None
+        para = elem.get("paragraph")
+        if para is None:
+            continue  # sectionBreak inicial
+        start, end = int(elem.get("startIndex", 1)), int(elem["endIndex"])
+        list_id = (para.get("bullet") or {}).get("listId")
+        paras.append((_doc_para(doc, para, start, end), start, end, list_id))
+
+    if not paras:
+        return None
+    anchor, anchor_start, _, _ = paras[-1]
+    if anchor.text or anchor.list_kind or anchor.hr:
+        return None
+
+    blocks: List[_DocBlock] = []
+    prev_list: Optional[str] = None
+    for p, start, end, list_id in paras[:-1]:
+        if list_id and list_id == prev_list and blocks:
+            last = blocks[-1]
+            blocks[-1] = _DocBlock(last.paras + (p,), last.start, end)
         else:
-            text_line = line if line.strip() != "" else ""
-            inserted = _apply_inline_styles(docs, document_id, cursor, text_line, requests)
-            cursor += inserted
-            batch_size += 1 + 6  # aprox
+            blocks.append(_DocBlock((p,), start, end))
+        prev_list = list_id
+    return blocks, anchor_start
 
-        # Flush si excede el límite
-        if batch_size >= BATCH_LIMIT:
-            _flush_requests(docs, document_id, requests)
-            batch_size = 0
-            time.sleep(0.1)
 
-        i += 1
+def _block_key(block: _Block) -> Tuple[Any, ...]:
+    """Clave de alineación: solo texto y tipo de bloque (el estilo se compara aparte)."""
+    return (block[0].list_kind is not None, block[0].hr) + tuple(p.text for p in block)
+
 
-    # Flush final
-    _flush_requests(docs, document_id, requests)
+def _restyle_requests(old: _DocBlock, new: _Block) -> List[Dict[str, Any]]:
+    requests: List[Dict[str, Any]] = []
+    cursor = old.start
+    for old_p, new_p in zip(old.paras, new):
+        if old_p != new_p:
+            _apply_paragraph_style(requests, new_p, cursor, reset=True)
+            _apply_text_runs(requests, new_p, cursor, reset=True)
+        cursor += new_p.size
+    old_kind, new_kind = old.paras[0].list_kind, new[0].list_kind
+    if new_kind and old_kind != new_kind:
+        requests.append({"deleteParagraphBullets": {"range": {"startIndex": old.start, "endIndex": old.end}}})
+        _apply_list_bullets(requests, old.start, old.end - 1, ordered=new_kind == "ordered")
+    return requests
+
+
+def _plan_markdown_diff(doc: Dict[str, Any], blocks: List[_Block]) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, int]]]:
+    """
+    Compara el render nuevo con el Doc actual (bloque a bloque) y planifica solo
+    delete/insert/restyle de lo que cambió. Las ediciones van de abajo hacia
+    arriba para que los índices leídos sigan siendo válidos.
+    Devuelve None si el Doc no es apto para diff (el caller reescribe completo).
+    """
+    parsed = _read_doc_blocks(doc)
+    if parsed is None:
+        return None
+    old_blocks, anchor_start = parsed
+
+    matcher = difflib.SequenceMatcher(
+        a=[_block_key(b.paras) for b in old_blocks],
+        b=[_block_key(b) for b in blocks],
+        autojunk=False,
+    )
+    requests: List[Dict[str, Any]] = []
+    stats = {"kept": 0, "restyled": 0, "deleted": 0, "inserted": 0}
+
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            for old_b, new_b in zip(old_blocks[i1:i2], blocks[j1:j2]):
+                if old_b.paras == new_b:
+                    stats["kept"] += len(new_b)
+                else:
+                    requests.extend(_restyle_requests(old_b, new_b))
+                    stats["restyled"] += sum(1 for o, n in zip(old_b.paras, new_b) if o != n)
+            continue
+
+        at = old_blocks[i1].start if i1 < len(old_blocks) else anchor_start
+        if i2 > i1:
+            requests.append({"deleteContentRange": {"range": {
+                "startIndex": old_blocks[i1].start, "endIndex": old_blocks[i2 - 1].end,
+            }}})
+            stats["deleted"] += sum(len(b.paras) for b in old_blocks[i1:i2])
+        cursor = at
+        for block in blocks[j1:j2]:
+            block_reqs, cursor = _block_requests(block, cursor, reset=True)
+            requests.extend(block_reqs)
+            stats["inserted"] += len(block)
+    return requests, stats
+
+
+# writeControl.requiredRevisionId que ya no es la revisión actual: 400 con FAILED_PRECONDITION
+# (un request mal armado es INVALID_ARGUMENT, aunque su mensaje mencione la revisión)
+_REVISION_CONFLICT_REASONS = {"failedPrecondition", "FAILED_PRECONDITION"}
+
+
+def is_revision_conflict(e: Exception) -> bool:
+    """El Doc cambió desde la revisión requerida (editado entre la lectura y la escritura)."""
+    if not isinstance(e, HttpError):
+        return False
+    status = getattr(e, "status_code", None) or getattr(e.resp, "status", None)
+    return status == 400 and _extract_reason(e) in _REVISION_CONFLICT_REASONS
+
+
+def _log_diff_stats(stats: Dict[str, int], requests: List[Dict[str, Any]], calls: int) -> None:
+    logger.info(
+        "✅ Diff aplicado: %s párrafos intactos, %s re-estilizados, %s borrados, %s insertados (%s ops, %s llamadas).",
+        stats["kept"], stats["restyled"], stats["deleted"], stats["inserted"], len(requests), calls,
+    )
+
+
+def _diff_steps(document_id: str, doc: Dict[str, Any], plan: Tuple[List[Dict[str, Any]], Dict[str, int]], *,
+                batch_limit: int, checkpoint: Optional[_WriteCheckpoint] = None) -> Generator[Any, Any, Optional[Dict[str, Any]]]:
+    """Aplica el diff planificado sobre `doc` (ver _plan_markdown_diff). None → el Doc cambió: reescribir."""
+    requests, stats = plan
+    if checkpoint is not None:
+        yield _Blocking(checkpoint.start, ("diff", requests, batch_limit, doc.get("revisionId")))
+    try:
+        calls = yield from _flush_steps(requests, batch_limit=batch_limit, required_revision_id=doc.get("revisionId"),
+                                        checkpoint=checkpoint)
+    except HttpError as e:
+        if is_revision_conflict(e):
+            # Alguien editó el Doc entre la lectura y la escritura: índices inválidos
+            logger.warning("⚠️ El Doc %s cambió durante el diff (%s).", document_id, e)
+            return None
+        raise
+
+    _log_diff_stats(stats, requests, calls)
+    return {"mode": "diff", **stats, "requests": len(requests), "batch_updates": calls}
+
+
+WRITE_MODES = ("rewrite", "diff", "docx", "html")
+UPLOAD_MODES = ("docx", "html")
+BATCH_LIMIT = 180  # operaciones por batchUpdate (ajusta si hace falta)
+
+
+def _upload_stats(mode: str, data: bytes, started: float) -> Dict[str, Any]:
+    logger.info("✅ Doc reemplazado con una subida %s (%.1f KB, %.2fs).", mode.upper(), len(data) / 1024,
+                time.perf_counter() - started)
+    return {"mode": mode, "bytes": len(data), "requests": 1, "batch_updates": 0}
+
+
+def _write_steps(document_id: str, markdown_text: str, mode: str,
+                 ckpt: Optional[_WriteCheckpoint]) -> _WriteSteps:
+    if mode in UPLOAD_MODES:
+        from src.clients.docs_render import render_markdown
+
+        t0 = time.perf_counter()
+        # CPU (armar el DOCX/HTML de una carta larga): en async, fuera del event loop
+        data, mime = yield _Blocking(render_markdown, (markdown_text, mode))
+        yield _Upload(data, mime)
+        return _upload_stats(mode, data, t0)
+
+    if ckpt is not None:
+        stats = yield from _resume_steps(document_id, ckpt)
+        if stats is not None:
+            return stats
+    blocks = _parse_markdown(markdown_text)
+    doc = yield _GetDoc()
+
+    if mode == "diff":
+        plan = _plan_markdown_diff(doc, blocks)
+        if plan is not None:
+            stats = yield from _diff_steps(document_id, doc, plan, batch_limit=BATCH_LIMIT, checkpoint=ckpt)
+            if stats is not None:
+                if ckpt is not None:
+                    yield _Blocking(ckpt.clear)
+                return stats
+            doc = yield _GetDoc()  # el diff pudo aplicar lotes antes del conflicto
+        logger.info("↩️ Doc %s no apto para diff; reescritura completa.", document_id)
+
+    # Borrado + inserción en un solo plan, encadenado por revisionId: si alguien edita el Doc
+    # a mitad de la escritura, se re-lee y se re-planifica una vez en vez de dejar índices corridos
+    for attempt in (1, 2):
+        requests = _rewrite_plan(doc, blocks)
+        if ckpt is not None:
+            yield _Blocking(ckpt.start, ("rewrite", requests, BATCH_LIMIT, doc.get("revisionId")))
+        try:
+            calls = yield from _flush_steps(requests, batch_limit=BATCH_LIMIT,
+                                            required_revision_id=doc.get("revisionId"), checkpoint=ckpt)
+            break
+        except HttpError as e:
+            if attempt == 2 or not is_revision_conflict(e):
+                raise
+            logger.warning("⚠️ El Doc %s cambió durante la reescritura (%s); se re-planifica.", document_id, e)
+            doc = yield _GetDoc()
+    if ckpt is not None:
+        yield _Blocking(ckpt.clear)
     logger.info("✅ Markdown renderizado con formato nativo de Google Docs.")
+    return {
+        "mode": "rewrite",
+        "inserted": sum(len(b) for b in blocks),
+        "requests": len(requests),
+        "batch_updates": calls,
+    }
+
+
+def _run_write_steps(steps: _WriteSteps, document_id: str, priority: Optional[str]) -> Dict[str, Any]:
+    """Ejecuta los pasos con los clientes síncronos (googleapiclient)."""
+    limiter = get_rate_limiter("docs")
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            if isinstance(step, _GetDoc):
+                value = _execute_with_retries(build_docs_client().documents().get(documentId=document_id)) or {}
+            elif isinstance(step, _BatchUpdate):
+                limiter.acquire(priority)
+                body: Dict[str, Any] = {"requests": step.requests}
+                if step.revision:
+                    body["writeControl"] = {"requiredRevisionId": step.revision}
+                value = _execute_with_retries(
+                    build_docs_client().documents().batchUpdate(documentId=document_id, body=body))
+            elif isinstance(step, _Upload):
+                from src.clients.drive_client import replace_file_content
+
+                limiter.acquire(priority)
+                replace_file_content(document_id, step.data, step.mime)
+            elif isinstance(step, _Blocking):
+                value = step.fn(*step.args)
+            else:
+                time.sleep(step.seconds)
+        except Exception as e:
+            error = e
+
+
+async def _arun_write_steps(steps: _WriteSteps, document_id: str, priority: Optional[str]) -> Dict[str, Any]:
+    """Los mismos pasos con el cliente asyncio (src/clients/google_async.py)."""
+    from src.clients.google_async import get_async_google_client
+
+    client = get_async_google_client()
+    limiter = get_rate_limiter("docs")
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            if isinstance(step, _GetDoc):
+                value = await client.documents_get(document_id)
+            elif isinstance(step, _BatchUpdate):
+                await limiter.aacquire(priority)
+                value = await client.documents_batch_update(document_id, step.requests,
+                                                            required_revision_id=step.revision)
+            elif isinstance(step, _Upload):
+                await limiter.aacquire(priority)
+                await client.files_update_media(document_id, step.data, step.mime)
+            elif isinstance(step, _Blocking):
+                value = await asyncio.to_thread(step.fn, *step.args)
+            else:
+                await asyncio.sleep(step.seconds)
+        except Exception as e:
+            error = e
+
+
+def write_markdown_to_document(document_id: str, markdown_text: str, *, mode: str = "rewrite",
+                               checkpoint: Optional[str] = None,
+                               checkpoint_meta: Optional[Dict[str, Any]] = None,
+                               priority: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Convierte un subset útil de Markdown a formato nativo de Google Docs
+    (ver _parse_markdown). Maneja lotes y respeta newline terminal del doc.
+
+    mode:
+    - "rewrite": borra todo y re-inserta con estilos frescos.
+    - "diff": compara con el contenido actual y aplica solo los cambios
+      (conserva comentarios anclados en párrafos intactos). Si el Doc no es
+      apto (tablas, edición concurrente, etc.) cae a "rewrite".
+    - "docx" / "html": render local + una sola subida de Drive con conversión
+      (mismo fileId y link; no conserva comentarios ni historial de estilos).
+    `checkpoint`: clave del request para retomar una escritura cortada (ver _WriteCheckpoint);
+    `checkpoint_meta` viaja con el texto guardado (el runner guarda ahí los datos del modelo).
+    Cuota: cada batchUpdate (o la subida) espera un token de DOCS_WRITE_RPM con la clase `priority`.
+    Devuelve estadísticas de la escritura.
+    """
+    ckpt = _WriteCheckpoint(checkpoint, document_id, markdown_text, checkpoint_meta) if checkpoint else None
+    return _run_write_steps(_write_steps(document_id, markdown_text, mode, ckpt), document_id, priority)
+
+
+async def aget_document_content(document_id: str) -> str:
+    """Versión async de get_document_content."""
+    from src.clients.google_async import get_async_google_client
+
+    doc = await get_async_google_client().documents_get(document_id)
+    return "".join(_iter_text(cast(Document, doc)))
+
+
+async def awrite_markdown_to_document(document_id: str, markdown_text: str, *, mode: str = "rewrite",
+                                      checkpoint: Optional[str] = None,
+                                      checkpoint_meta: Optional[Dict[str, Any]] = None,
+                                      priority: Optional[str] = None) -> Dict[str, Any]:
+    """Versión async de write_markdown_to_document (mismos pasos; solo cambia el I/O)."""
+    ckpt = _WriteCheckpoint(checkpoint, document_id, markdown_text, checkpoint_meta) if checkpoint else None
+    return await _arun_write_steps(_write_steps(document_id, markdown_text, mode, ckpt), document_id, priority)
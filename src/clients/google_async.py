@@ -0,0 +1,171 @@
+# src/clients/google_async.py
+"""
+Cliente asyncio nativo (httpx) para las operaciones Google que usamos:
+
+- Docs:   documents.get, documents.batchUpdate
+- Drive:  files.get, files.update (media)
+- Sheets: values.update, values.batchUpdate
+
+- Auth compartida con src.auth (mismas credenciales + refresh single-flight/background).
+- Un `httpx.AsyncClient` por event loop: pool de conexiones keep-alive reutilizado
+  por todas las corutinas del loop (cientos de requests en vuelo sin un hilo por job).
+- Errores: se lanza `googleapiclient.errors.HttpError`, igual que el cliente síncrono,
+  para que el manejo de errores del runner/worker no cambie.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import weakref
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httplib2
+import httpx
+from googleapiclient.errors import HttpError
+
+from src.auth import WORKSPACE_SCOPES, ensure_fresh_credentials, force_refresh_credentials, get_workspace_credentials
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+DOCS_URL = "https://docs.googleapis.com/v1"
+DRIVE_URL = "https://www.googleapis.com/drive/v3"
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3"
+SHEETS_URL = "https://sheets.googleapis.com/v4"
+
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def _http_error(status: int, content: bytes, uri: str) -> HttpError:
+    return HttpError(httplib2.Response({"status": str(status)}), content, uri=uri)
+
+
+class AsyncGoogleClient:
+    def __init__(self, *, max_connections: int = 100, timeout_s: float = 180.0, max_retries: int = 6) -> None:
+        self.max_retries = max_retries
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout_s, connect=20.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    # ---------- Transporte ----------
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        creds = get_workspace_credentials(WORKSPACE_SCOPES)
+        if not creds.valid:
+            # Refresh bloqueante (raro: el hilo de background lo hace antes de vencer) fuera del loop
+            await asyncio.to_thread(ensure_fresh_credentials)
+        headers: Dict[str, str] = {}
+        creds.apply(headers)
+        return headers
+
+    async def _request(self, method: str, url: str, *, params: Optional[Dict[str, Any]] = None,
+                       body: Optional[Dict[str, Any]] = None, content: Optional[bytes] = None,
+                       content_type: Optional[str] = None) -> Dict[str, Any]:
+        delay = 1.0
+        refreshed = False
+        for attempt in range(1, self.max_retries + 1):
+            headers = await self._auth_headers()
+            if content_type:
+                headers["Content-Type"] = content_type
+            try:
+                resp = await self._http.request(method, url, params=params, json=body, content=content, headers=headers)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                sleep = delay + random.uniform(0, delay * 0.5)
+                logger.warning("🔁 Retry %s/%s por RED (%s): %s. Esperando %.1fs…",
+                               attempt, self.max_retries, type(e).__name__, e, sleep)
+                await asyncio.sleep(sleep)
+                delay = min(delay * 2, 20)
+                continue
+
+            if resp.status_code < 400:
+                return resp.json() if resp.content else {}
+            if resp.status_code == 401 and not refreshed:
+                # Token revocado/rotado antes de su expiry: un refresh forzado (single-flight) y reintento
+                refreshed = True
+                rejected = headers.get("authorization", "").removeprefix("Bearer ") or None
+                await asyncio.to_thread(force_refresh_credentials, rejected)
+                continue
+            if resp.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                sleep = delay + random.uniform(0, delay * 0.5)
+                logger.warning("🔁 Retry %s/%s por HTTP %s en %s. Esperando %.1fs…",
+                               attempt, self.max_retries, resp.status_code, url, sleep)
+                await asyncio.sleep(sleep)
+                delay = min(delay * 2, 20)
+                continue
+            raise _http_error(resp.status_code, resp.content, str(resp.request.url))
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    # ---------- Docs ----------
+
+    async def documents_get(self, document_id: str, *, fields: Optional[str] = None) -> Dict[str, Any]:
+        params = {"fields": fields} if fields else None
+        return await self._request("GET", f"{DOCS_URL}/documents/{document_id}", params=params)
+
+    async def documents_batch_update(self, document_id: str, requests: List[Dict[str, Any]], *,
+                                     required_revision_id: Optional[str] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"requests": requests}
+        if required_revision_id:
+            body["writeControl"] = {"requiredRevisionId": required_revision_id}
+        return await self._request("POST", f"{DOCS_URL}/documents/{document_id}:batchUpdate", body=body)
+
+    # ---------- Drive ----------
+
+    async def files_get(self, file_id: str, *, fields: str = "id,name,mimeType,webViewLink") -> Dict[str, Any]:
+        params = {"fields": fields, "supportsAllDrives": "true"}
+        return await self._request("GET", f"{DRIVE_URL}/files/{file_id}", params=params)
+
+    async def files_update_media(self, file_id: str, data: bytes, mime_type: str, *,
+                                 fields: str = "id,webViewLink,modifiedTime") -> Dict[str, Any]:
+        """Reemplaza el contenido con una subida simple (Drive convierte DOCX/HTML si es un Google Doc)."""
+        params = {"uploadType": "media", "fields": fields, "supportsAllDrives": "true"}
+        return await self._request("PATCH", f"{DRIVE_UPLOAD_URL}/files/{file_id}", params=params,
+                                   content=data, content_type=mime_type)
+
+    # ---------- Sheets ----------
+
+    async def values_update(self, spreadsheet_id: str, range_a1: str, values: List[List[Any]], *,
+                            value_input_option: str = "USER_ENTERED") -> Dict[str, Any]:
+        url = f"{SHEETS_URL}/spreadsheets/{spreadsheet_id}/values/{quote(range_a1, safe='')}"
+        return await self._request(
+            "PUT", url, params={"valueInputOption": value_input_option},
+            body={"range": range_a1, "values": values},
+        )
+
+    async def values_batch_update(self, spreadsheet_id: str, data: List[Dict[str, Any]], *,
+                                  value_input_option: str = "USER_ENTERED") -> Dict[str, Any]:
+        return await self._request(
+            "POST", f"{SHEETS_URL}/spreadsheets/{spreadsheet_id}/values:batchUpdate",
+            body={"valueInputOption": value_input_option, "data": data},
+        )
+
+
+# Un cliente por event loop: el pool de httpx no se puede compartir entre loops.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGoogleClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_google_client() -> AsyncGoogleClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        s = get_settings()
+        client = AsyncGoogleClient(
+            max_connections=s.google_async_max_connections,
+            timeout_s=s.google_async_timeout_s,
+        )
+        _clients[loop] = client
+        logger.info("⚡ Cliente Google async inicializado (pool=%s).", s.google_async_max_connections)
+    return client
+
+
+async def close_async_google_client() -> None:
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,113 @@
+# src/clients/google_batch.py
+"""
+Batch HTTP (multipart) de googleapiclient: varias llamadas independientes en un solo round trip.
+
+- Un batch solo puede contener llamadas de la MISMA API (Drive, Docs o Sheets por separado);
+  Google retiró el endpoint global de batch.
+- Cada sub-request conserva su propio resultado o error (`BatchItem`).
+- Sub-requests con 408/429/5xx se reintentan en un nuevo batch con backoff.
+"""
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from src.logging_conf import get_logger
+
+logger = get_logger(__name__)
+
+# Drive acepta hasta 100 llamadas por batch; Docs/Sheets más, usamos el mínimo común.
+MAX_BATCH_SIZE = 100
+
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class BatchItem:
+    key: str
+    response: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def result(self) -> Dict[str, Any]:
+        """Devuelve la respuesta o relanza el error propio de este sub-request."""
+        if self.error is not None:
+            raise self.error
+        return self.response or {}
+
+
+def _status(e: Exception) -> Optional[int]:
+    if isinstance(e, HttpError):
+        return getattr(e, "status_code", None) or getattr(e.resp, "status", None)
+    return None
+
+
+def _is_retryable(e: Exception) -> bool:
+    status = _status(e)
+    return status in _RETRY_STATUSES if status is not None else isinstance(e, (OSError, TimeoutError))
+
+
+def execute_batch(service, requests: Mapping[str, HttpRequest], *, max_retries: int = 4) -> Dict[str, BatchItem]:
+    """
+    Ejecuta `requests` ({clave: HttpRequest}) agrupadas en batches de `service`.
+    Nunca lanza por un sub-request: los errores quedan en `BatchItem.error`.
+    """
+    results: Dict[str, BatchItem] = {}
+    pending: Dict[str, HttpRequest] = dict(requests)
+    delay = 1.0
+
+    for attempt in range(1, max_retries + 1):
+        retry: Dict[str, HttpRequest] = {}
+        keys = list(pending)
+
+        for i in range(0, len(keys), MAX_BATCH_SIZE):
+            chunk = keys[i:i + MAX_BATCH_SIZE]
+
+            if len(chunk) == 1:
+                # Sin overhead multipart para una sola llamada
+                key = chunk[0]
+                try:
+                    results[key] = BatchItem(key, response=pending[key].execute(num_retries=0))
+                except Exception as e:
+                    results[key] = BatchItem(key, error=e)
+            else:
+                def _callback(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+                    results[request_id] = BatchItem(request_id, response=response, error=exception)
+
+                batch = service.new_batch_http_request(callback=_callback)
+                for key in chunk:
+                    batch.add(pending[key], request_id=key)
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # Falla del batch completo (transporte): todas sus claves comparten el error
+                    for key in chunk:
+                        results.setdefault(key, BatchItem(key, error=e))
+
+            for key in chunk:
+                item = results[key]
+                if item.error is not None and _is_retryable(item.error) and attempt < max_retries:
+                    retry[key] = pending[key]
+
+        if not retry:
+            break
+        sleep = delay + random.uniform(0, delay * 0.5)
+        logger.warning("🔁 Batch retry %s/%s: %s sub-requests. Esperando %.1fs…",
+                       attempt, max_retries, len(retry), sleep)
+        time.sleep(sleep)
+        delay = min(delay * 2, 20)
+        for key in retry:
+            results.pop(key, None)
+        pending = retry
+
+    failed = sum(1 for it in results.values() if it.error is not None)
+    logger.debug("📦 Batch: %s sub-requests, %s con error.", len(results), failed)
+    return results
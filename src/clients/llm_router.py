@@ -0,0 +1,369 @@
+# src/clients/llm_router.py
+"""
+Capa de backends LLM detrás de `generate_text`.
+
+- Backends: Vertex AI (por modelo + región) y Gemini API (API key).
+- Ruteo: por contexto (LLM_CONTEXT_MODELS) y por tamaño de prompt (LLM_LONG_PROMPT_CHARS → VERTEX_MODEL_LONG).
+- Failover: ante 429/5xx/timeout pasa al siguiente candidato (otras regiones / modelos).
+- Hedging opcional: si el primer intento supera el p95 observado, se lanza un segundo
+  intento en el siguiente candidato; gana el primero y el otro se cancela (asyncio).
+
+Las llamadas corren en un event loop dedicado (hilo de fondo) para poder cancelar
+de verdad el RPC perdedor; `generate()` es el wrapper síncrono para el runner.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from src.auth import init_vertex_ai
+from src.deadline import current_deadline
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+# Códigos que justifican probar otro candidato (cuota / capacidad regional / timeouts)
+_FAILOVER_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    location: str
+    backend: str
+    latency_s: float
+    hedged: bool = False
+    cached: bool = False  # servido desde el cache compartido (src/shared_cache.py)
+
+
+class LLMBackendError(RuntimeError):
+    """Todos los candidatos fallaron."""
+
+
+def _is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    code = getattr(e, "code", None)
+    if callable(code):  # grpc.RpcError.code()
+        try:
+            code = code()
+        except Exception:
+            code = None
+    if isinstance(code, int):
+        return code in _FAILOVER_STATUSES
+    # grpc StatusCode (RESOURCE_EXHAUSTED / UNAVAILABLE / DEADLINE_EXCEEDED / INTERNAL)
+    name = getattr(code, "name", "") or ""
+    return name in {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"}
+
+
+# ---------------------------
+# Backends
+# ---------------------------
+
+class LLMBackend:
+    """Interfaz mínima: un backend genera texto para (modelo, región)."""
+
+    kind = "base"
+
+    def __init__(self, model: str, location: str = "") -> None:
+        self.model = model
+        self.location = location
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.model}@{self.location or '-'}"
+
+    async def agenerate(self, prompt: str) -> str:  # pragma: no cover - interfaz
+        raise NotImplementedError
+
+
+class VertexBackend(LLMBackend):
+    kind = "vertex"
+
+    async def agenerate(self, prompt: str) -> str:
+        from vertexai.preview.generative_models import GenerativeModel
+
+        init_vertex_ai()
+        project = get_settings().project_id
+        # Nombre de recurso completo → la región sale del propio nombre (no de vertexai.init)
+        resource = f"projects/{project}/locations/{self.location}/publishers/google/models/{self.model}"
+        model = GenerativeModel(resource if project else self.model)
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+
+class GeminiApiBackend(LLMBackend):
+    kind = "gemini_api"
+
+    async def agenerate(self, prompt: str) -> str:
+        try:
+            import google.generativeai as genai
+        except ImportError as e:
+            raise LLMBackendError("google-generativeai no está instalado (requerido para LLM_BACKEND=gemini_api).") from e
+
+        api_key = get_settings().gemini_api_key
+        if not api_key:
+            raise LLMBackendError("GEMINI_API_KEY no está configurado.")
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(self.model)
+        response = await model.generate_content_async(prompt)
+        return response.text
+
+
+# ---------------------------
+# Latencias (p95 por candidato)
+# ---------------------------
+
+class _LatencyTracker:
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Dict[str, Deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self._window)).append(seconds)
+
+    def p95(self, key: str, *, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        out: Dict[str, Dict[str, float]] = {}
+        for key in list(self._samples):
+            samples = sorted(self._samples[key])
+            if samples:
+                out[key] = {
+                    "n": len(samples),
+                    "p50_s": round(samples[len(samples) // 2], 3),
+                    "p95_s": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+                }
+        return out
+
+
+# ---------------------------
+# Event loop dedicado
+# ---------------------------
+
+class _LoopThread:
+    """Event loop en un hilo daemon para correr corutinas desde código síncrono."""
+
+    def __init__(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-router-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> "concurrent.futures.Future":
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Espera el resultado; con deadline del request (src/deadline.py) la llamada se cancela al cortarse."""
+        fut = self.submit(coro)
+        deadline = current_deadline()
+        unregister = deadline.on_cancel(fut.cancel) if deadline is not None else None
+        try:
+            return fut.result(timeout=deadline.timeout(timeout) if deadline is not None else timeout)
+        except BaseException:
+            fut.cancel()
+            if deadline is not None and deadline.done:
+                deadline.cancel()
+                raise deadline.error("llm") from None
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+
+
+@lru_cache(maxsize=1)
+def _get_loop_thread() -> _LoopThread:
+    return _LoopThread()
+
+
+# ---------------------------
+# Router
+# ---------------------------
+
+def _parse_kv(spec: str) -> Dict[str, str]:
+    """'Witness=gemini-2.5-pro,Reference Letter=gemini-2.5-flash' → dict (claves en minúscula)."""
+    out: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        k, sep, v = item.partition("=")
+        if sep and k.strip() and v.strip():
+            out[k.strip().lower()] = v.strip()
+    return out
+
+
+def _parse_list(spec: str) -> List[str]:
+    return [x.strip() for x in (spec or "").split(",") if x.strip()]
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        *,
+        backend: str,
+        model: str,
+        location: str,
+        long_model: str = "",
+        long_prompt_chars: int = 0,
+        context_models: Optional[Dict[str, str]] = None,
+        fallback_locations: Sequence[str] = (),
+        fallback_models: Sequence[str] = (),
+        gemini_api_fallback: bool = False,
+        request_timeout_s: Optional[float] = None,
+        hedge_enabled: bool = False,
+        hedge_after_s: Optional[float] = None,
+    ) -> None:
+        self.backend = backend
+        self.model = model
+        self.location = location
+        self.long_model = long_model
+        self.long_prompt_chars = long_prompt_chars
+        self.context_models = context_models or {}
+        self.fallback_locations = list(fallback_locations)
+        self.fallback_models = list(fallback_models)
+        self.gemini_api_fallback = gemini_api_fallback
+        self.request_timeout_s = request_timeout_s
+        self.hedge_enabled = hedge_enabled
+        self.hedge_after_s = hedge_after_s
+        self.latencies = _LatencyTracker()
+
+    # ----- Ruteo -----
+
+    def choose_model(self, prompt_chars: int, context: Optional[str] = None) -> str:
+        if context:
+            by_ctx = self.context_models.get(context.strip().lower())
+            if by_ctx:
+                return by_ctx
+        if self.long_model and self.long_prompt_chars and prompt_chars >= self.long_prompt_chars:
+            return self.long_model
+        return self.model
+
+    def candidates(self, prompt_chars: int, context: Optional[str] = None) -> List[LLMBackend]:
+        primary_model = self.choose_model(prompt_chars, context)
+        out: List[LLMBackend] = []
+        seen: set = set()
+
+        def _add(b: LLMBackend) -> None:
+            if b.key not in seen:
+                seen.add(b.key)
+                out.append(b)
+
+        if self.backend == "gemini_api":
+            for m in [primary_model, *self.fallback_models]:
+                _add(GeminiApiBackend(m))
+            return out
+
+        for loc in [self.location, *self.fallback_locations]:
+            _add(VertexBackend(primary_model, loc))
+        for m in self.fallback_models:
+            _add(VertexBackend(m, self.location))
+        if self.gemini_api_fallback and get_settings().gemini_api_key:
+            _add(GeminiApiBackend(primary_model))
+        return out
+
+    # ----- Ejecución -----
+
+    async def _call(self, b: LLMBackend, prompt: str) -> Tuple[str, float]:
+        t0 = time.perf_counter()
+        coro = b.agenerate(prompt)
+        text = await (asyncio.wait_for(coro, self.request_timeout_s) if self.request_timeout_s else coro)
+        elapsed = time.perf_counter() - t0
+        self.latencies.observe(b.key, elapsed)
+        return text, elapsed
+
+    def _hedge_delay(self, b: LLMBackend) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        return self.hedge_after_s if self.hedge_after_s else self.latencies.p95(b.key)
+
+    async def agenerate(self, prompt: str, *, context: Optional[str] = None) -> LLMResult:
+        cands = self.candidates(len(prompt), context)
+        errors: List[str] = []
+        i = 0
+        while i < len(cands):
+            primary = cands[i]
+            hedge = cands[i + 1] if i + 1 < len(cands) else None
+            delay = self._hedge_delay(primary) if hedge else None
+
+            tasks: Dict[asyncio.Task, LLMBackend] = {
+                asyncio.ensure_future(self._call(primary, prompt)): primary
+            }
+            if delay is not None:
+                done, _ = await asyncio.wait(list(tasks), timeout=delay)
+                if not done:
+                    logger.info("⏱️ Hedge: %s superó %.2fs, lanzando %s", primary.key, delay, hedge.key)
+                    tasks[asyncio.ensure_future(self._call(hedge, prompt))] = hedge
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    b = tasks[t]
+                    exc = t.exception()
+                    if exc is None:
+                        for loser in pending:
+                            loser.cancel()
+                        text, elapsed = t.result()
+                        logger.info(
+                            "🤖 LLM %s respondió en %.2fs", b.key, elapsed,
+                            extra={"llm_model": b.model, "llm_location": b.location, "llm_latency_s": round(elapsed, 3)},
+                        )
+                        return LLMResult(
+                            text=text, model=b.model, location=b.location, backend=b.kind,
+                            latency_s=elapsed, hedged=len(tasks) > 1,
+                        )
+                    errors.append(f"{b.key}: {exc}")
+                    if not _is_retryable(exc):
+                        for loser in pending:
+                            loser.cancel()
+                        logger.error("Error no recuperable en %s: %s", b.key, exc)
+                        raise exc
+                    logger.warning("🔁 Failover: %s falló (%s)", b.key, exc)
+
+            # Se consumieron los candidatos lanzados en esta vuelta
+            i += len(tasks)
+
+        raise LLMBackendError("Todos los backends LLM fallaron: " + " | ".join(errors))
+
+    def generate(self, prompt: str, *, context: Optional[str] = None) -> LLMResult:
+        return _get_loop_thread().run(self.agenerate(prompt, context=context))
+
+    async def agenerate_from_any_loop(self, prompt: str, *, context: Optional[str] = None) -> LLMResult:
+        """
+        Para corutinas de OTRO event loop (p.ej. FastAPI): la llamada corre en el loop
+        del router (donde viven los canales gRPC) y se espera sin bloquear el loop actual.
+        Cancelar la corutina que espera cancela también la llamada al modelo.
+        """
+        return await asyncio.wrap_future(_get_loop_thread().submit(self.agenerate(prompt, context=context)))
+
+
+@lru_cache(maxsize=1)
+def get_llm_router() -> LLMRouter:
+    s = get_settings()
+    return LLMRouter(
+        backend=s.llm_backend,
+        model=s.model_id,
+        location=s.vertex_location,
+        long_model=s.vertex_model_long,
+        long_prompt_chars=s.llm_long_prompt_chars,
+        context_models=_parse_kv(s.llm_context_models),
+        fallback_locations=_parse_list(s.vertex_fallback_locations),
+        fallback_models=_parse_list(s.vertex_fallback_models),
+        gemini_api_fallback=s.llm_gemini_api_fallback,
+        request_timeout_s=s.llm_request_timeout_s or None,
+        hedge_enabled=s.llm_hedge_enabled,
+        hedge_after_s=s.llm_hedge_after_s or None,
+    )
@@ -0,0 +1,195 @@
+# src/clients/sheet_row_index.py
+"""
+Índice clave → fila para callbacks a Sheets sin `row_index` (`key_col` + `key`/case_id).
+
+- La columna clave se lee una vez por (spreadsheet, pestaña, columna) y se indexa en memoria.
+- Búsquedas concurrentes sobre la misma hoja se juntan durante SHEET_INDEX_BATCH_WINDOW_MS
+  y se resuelven juntas:
+    1) hits del índice → se verifican en un solo values.batchGet (1 celda por clave):
+       si alguien insertó/reordenó filas, la celda ya no coincide;
+    2) claves que faltan → se lee solo la cola de la columna (filas nuevas al final);
+    3) solo si hubo desfase (un hit que ya no coincide, o la cola trae claves ya indexadas:
+       se insertaron filas más arriba) → una relectura completa de la columna.
+  Una clave que sigue faltando es RowNotFound, y se recuerda SHEET_INDEX_MISS_TTL_S: los
+  reintentos de esa clave no vuelven a leer la columna.
+- Nunca se lee la hoja completa: solo la columna clave (y, en el caso normal, ni eso).
+
+El índice es por proceso (LRU de SHEET_INDEX_MAX_SHEETS hojas).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.auth import build_sheets_client
+from src.logging_conf import get_logger
+from src.metrics import incr
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+
+class RowNotFound(LookupError):
+    """La clave no aparece en la columna clave de la hoja."""
+
+
+def _norm(value: object) -> str:
+    return str(value).strip()
+
+
+class SheetRowIndex:
+    def __init__(self, spreadsheet_id: str, sheet_name: str, key_col: str, *, window_s: float,
+                 miss_ttl_s: float = 0.0) -> None:
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.key_col = key_col
+        self.window_s = window_s
+        self.miss_ttl_s = miss_ttl_s
+        self.rows: Dict[str, int] = {}
+        self._misses: Dict[str, float] = {}  # clave ausente → hasta cuándo (monotonic) no se busca
+        self.scanned = 0  # última fila leída de la columna (1-based)
+        self._lock = threading.Lock()          # pending / leader
+        self._resolve_lock = threading.Lock()  # estado del índice (una resolución a la vez)
+        self._pending: List[Tuple[str, Future]] = []
+        self._leader = False
+
+    # ---------- API ----------
+
+    def lookup(self, key: str) -> int:
+        """Fila (1-based) de `key`. Lanza RowNotFound si no está en la columna."""
+        fut: Future = Future()
+        with self._lock:
+            self._pending.append((_norm(key), fut))
+            lead = not self._leader
+            self._leader = True
+        incr("sheets.index_lookups")
+        if lead:
+            # El primero espera la ventana y resuelve por todos los que llegaron mientras tanto
+            if self.window_s > 0:
+                time.sleep(self.window_s)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._leader = False
+            try:
+                self._resolve(batch)
+            except Exception as e:
+                for _, f in batch:
+                    if not f.done():
+                        f.set_exception(e)
+        return fut.result()
+
+    # ---------- Resolución ----------
+
+    def _resolve(self, batch: List[Tuple[str, Future]]) -> None:
+        with self._resolve_lock:
+            now = time.monotonic()
+            keys = {k for k, _ in batch if self._misses.get(k, 0.0) <= now}
+            candidates = {k: self.rows[k] for k in keys if k in self.rows}
+            verified, stale = self._verify(candidates) if candidates else (set(), False)
+            found = {k: candidates[k] for k in verified}
+            missing = keys - set(found)
+            if missing and not stale:
+                stale = self._read_tail()
+                found.update({k: self.rows[k] for k in missing if k in self.rows})
+                missing = keys - set(found)
+            if stale:
+                self._read_full()
+                found.update({k: self.rows[k] for k in keys - set(found) if k in self.rows})
+                missing = keys - set(found)
+            if self.miss_ttl_s > 0:
+                self._misses = {k: t for k, t in self._misses.items() if t > now}
+                self._misses.update({k: now + self.miss_ttl_s for k in missing})
+        if len(batch) > 1:
+            logger.debug("🔎 %s búsquedas de fila resueltas juntas en %s", len(batch), self.sheet_name)
+        for key, fut in batch:
+            if key in found:
+                fut.set_result(found[key])
+            else:
+                fut.set_exception(RowNotFound(
+                    f"'{key}' no está en la columna {self.key_col} de {self.sheet_name} ({self.spreadsheet_id})."))
+
+    def _range(self, start: int, end: Optional[int] = None) -> str:
+        return f"{self.sheet_name}!{self.key_col}{start}:{self.key_col}{end if end else ''}"
+
+    def _verify(self, candidates: Dict[str, int]) -> Tuple[Set[str], bool]:
+        """Lee la celda clave de cada candidato en un solo batchGet. Devuelve (claves vigentes, hubo desfase)."""
+        keys = list(candidates)
+        resp = build_sheets_client().spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=[self._range(candidates[k], candidates[k]) for k in keys],
+            valueRenderOption="FORMATTED_VALUE",
+        ).execute()
+        incr("sheets.index_verify_reads")
+        ok: Set[str] = set()
+        for key, vr in zip(keys, resp.get("valueRanges", [])):
+            values = vr.get("values") or [[""]]
+            if _norm(values[0][0] if values[0] else "") == key:
+                ok.add(key)
+        stale = len(ok) < len(keys)
+        if stale:
+            logger.info("🔎 Índice de %s desfasado (filas insertadas/reordenadas): se relee la columna %s.",
+                        self.sheet_name, self.key_col)
+        return ok, stale
+
+    def _read_column(self, start: int) -> List[str]:
+        resp = build_sheets_client().spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=self._range(start),
+            majorDimension="COLUMNS",
+            valueRenderOption="FORMATTED_VALUE",
+        ).execute()
+        values = resp.get("values") or [[]]
+        return [_norm(v) for v in values[0]]
+
+    def _index(self, values: List[str], first_row: int) -> None:
+        for offset, value in enumerate(values):
+            if value:
+                self.rows.setdefault(value, first_row + offset)  # clave repetida: gana la primera fila
+
+    def _read_tail(self) -> bool:
+        """Lee las filas nuevas al final. True si la cola trae claves ya indexadas (filas corridas)."""
+        start = self.scanned + 1
+        values = self._read_column(start)
+        incr("sheets.index_tail_reads")
+        shifted = any(v in self.rows for v in values if v)
+        self._index(values, start)
+        self.scanned += len(values)
+        if shifted:
+            logger.info("🔎 Filas insertadas sobre la cola de %s: se relee la columna %s.", self.sheet_name, self.key_col)
+        return shifted
+
+    def _read_full(self) -> None:
+        values = self._read_column(1)
+        incr("sheets.index_full_reads")
+        self.rows = {}
+        self._index(values, 1)
+        self.scanned = len(values)
+        logger.info("🔎 Columna clave %s!%s indexada (%s filas).", self.sheet_name, self.key_col, self.scanned)
+
+
+_indexes_lock = threading.Lock()
+_indexes: "OrderedDict[Tuple[str, str, str], SheetRowIndex]" = OrderedDict()
+
+
+def get_row_index(spreadsheet_id: str, sheet_name: str, key_col: str) -> SheetRowIndex:
+    s = get_settings()
+    key = (spreadsheet_id, sheet_name, key_col.strip().upper())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SheetRowIndex(*key, window_s=s.sheet_index_batch_window_ms / 1000.0,
+                                                  miss_ttl_s=s.sheet_index_miss_ttl_s)
+        _indexes.move_to_end(key)
+        while len(_indexes) > max(1, s.sheet_index_max_sheets):
+            _indexes.popitem(last=False)
+    return index
+
+
+def resolve_callback_row(cb, default_key: str) -> int:
+    """Fila del callback: `row_index` si viene; si no, búsqueda por `key_col` (clave = `key` o el case_id)."""
+    if cb.row_index is not None:
+        return cb.row_index
+    return get_row_index(cb.spreadsheet_id, cb.sheet_name, cb.key_col).lookup(cb.key or default_key)
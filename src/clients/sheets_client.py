@@ -1,8 +1,10 @@
 # src/clients/sheets_client.py
-from typing import Dict, Any, List
+from collections import defaultdict
+from typing import Dict, Any, Iterable, List, Tuple
 from googleapiclient.errors import HttpError
 
 from src.auth import build_sheets_client
+from src.clients.google_batch import BatchItem, execute_batch
 from src.logging_conf import get_logger
 
 logger = get_logger(__name__)
@@ -26,12 +28,12 @@ def update_row_status(spreadsheet_id: str, sheet_name: str, row_index: int, col_
             body=body
         ).execute()
         
-        # logger.debug(f"Celda actualizada: {range_name} -> {value}")
+        # logger.debug("Celda actualizada: %s -> %s", range_name, value)
 
     except HttpError as e:
-        logger.error(f"❌ Error de API de Sheets al escribir en {range_name}: {e}")
+        logger.error("❌ Error de API de Sheets al escribir en %s: %s", range_name, e)
     except Exception as e:
-        logger.error(f"❌ Error inesperado en update_row_status: {e}")
+        logger.error("❌ Error inesperado en update_row_status: %s", e)
 
 def update_transcription_result(
     spreadsheet_id: str, 
@@ -82,9 +84,56 @@ def update_transcription_result(
             body=body
         ).execute()
         
-        logger.info(f"📊 Sheet actualizada (Batch) en fila {row_index} con {len(data_to_write)} campos.")
+        logger.info("📊 Sheet actualizada (Batch) en fila %s con %s campos.", row_index, len(data_to_write))
 
     except HttpError as e:
-        logger.error(f"❌ Error Batch Update en Sheets: {e}")
+        logger.error("❌ Error Batch Update en Sheets: %s", e)
     except Exception as e:
-        logger.error(f"❌ Error general en update_transcription_result: {e}")
\ No newline at end of file
+        logger.error("❌ Error general en update_transcription_result: %s", e)
+
+def read_range(spreadsheet_id: str, range_a1: str) -> List[List[str]]:
+    """
+    Lee un rango A1 (ej: "Hoja 1!A1:K") y devuelve las filas como listas de strings.
+    Las filas vacías al final no vienen en la respuesta de la API.
+    """
+    sheets = build_sheets_client()
+    resp = sheets.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=range_a1,
+        valueRenderOption="FORMATTED_VALUE",
+    ).execute()
+    values = resp.get("values", []) or []
+    logger.info("📥 Sheet leída: %s filas de %s", len(values), range_a1)
+    return [[str(c) for c in row] for row in values]
+
+
+def write_cells(writes: Iterable[Tuple[str, str, Any]]) -> Dict[str, BatchItem]:
+    """
+    Escribe celdas en una o varias hojas en un solo round trip.
+    `writes` = [(spreadsheet_id, "Hoja 1!H5", valor), ...]
+    - Por spreadsheet: un values.batchUpdate con todas sus celdas.
+    - Entre spreadsheets: batch HTTP de Sheets; el error de una hoja no afecta a las otras.
+    Devuelve {spreadsheet_id: BatchItem}.
+    """
+    by_sheet: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for spreadsheet_id, range_a1, value in writes:
+        if value is None or value == "":
+            continue
+        by_sheet[spreadsheet_id].append({"range": range_a1, "values": [[value]]})
+    if not by_sheet:
+        return {}
+
+    sheets = build_sheets_client()
+    requests = {
+        sid: sheets.spreadsheets().values().batchUpdate(
+            spreadsheetId=sid, body={"valueInputOption": "USER_ENTERED", "data": data}
+        )
+        for sid, data in by_sheet.items()
+    }
+    items = execute_batch(sheets, requests)
+    for sid, item in items.items():
+        if item.ok:
+            logger.info("📊 Sheet %s actualizada: %s celdas.", sid, len(by_sheet[sid]))
+        else:
+            logger.error("❌ Error escribiendo en Sheet %s: %s", sid, item.error)
+    return items
@@ -0,0 +1,238 @@
+# src/clients/vertex_batch.py
+"""
+Generación offline con Vertex AI batch prediction (backfills grandes).
+
+Cientos de `generate_content` online compiten con el tráfico interactivo por la cuota QPM.
+Un job de batch prediction procesa el lote completo fuera de esa cuota, con más throughput y
+menor costo, a cambio de latencia (minutos a horas):
+
+    prompts → JSONL (una línea por fila, con su `key`) → GCS → BatchPredictionJob
+            → predictions*.jsonl en GCS → {key: LLMResult | error}
+
+- VertexBatchBackend: el real (gs://GCS_BUCKET/BATCH_GCS_PREFIX/<run_id>/, modelo BATCH_MODEL
+  o MODEL_ID).
+- LocalBatchBackend: sustituto en proceso para pruebas. Procesa el mismo JSONL con
+  `generate(prompt) -> str` y deja las predicciones con el formato de salida de Vertex en un
+  directorio local: ejercita la misma escritura/lectura sin GCS ni Vertex.
+
+Las respuestas se emparejan por `key`; si la salida no la trae, por el hash del prompt que
+Vertex devuelve en `request`.
+"""
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Union
+
+from src.clients.llm_router import LLMResult
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+_PREDICTIONS_GLOB = "predictions*.jsonl"
+
+
+@dataclass
+class BatchJob:
+    name: str
+    model: str
+    submitted_at: float
+    output: str = ""  # gs://… o directorio local con las predicciones (se conoce al terminar)
+
+
+def request_line(key: str, prompt: str) -> str:
+    """Una línea del JSONL de entrada (formato GenerateContentRequest de Vertex)."""
+    return json.dumps({"key": key, "request": {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}},
+                      ensure_ascii=False)
+
+
+def _prompt_of(request: Dict) -> str:
+    try:
+        return "".join(p.get("text", "") for p in request["contents"][0]["parts"])
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _response_text(response: Dict) -> str:
+    candidates = (response or {}).get("candidates") or []
+    if not candidates:
+        raise RuntimeError(f"Predicción sin candidatos ({(response or {}).get('promptFeedback', 'sin detalle')}).")
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    text = "".join(p.get("text", "") for p in parts)
+    if not text.strip():
+        raise RuntimeError(f"Predicción vacía (finishReason={candidates[0].get('finishReason')}).")
+    return text
+
+
+def _prediction(key: str, request: Dict, *, text: Optional[str] = None, error: Optional[str] = None) -> str:
+    """Línea de salida con el mismo formato que escribe Vertex (para el backend local)."""
+    line = {"key": key, "request": request, "status": error or ""}
+    if text is not None:
+        line["response"] = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]},
+                                            "finishReason": "STOP"}]}
+    return json.dumps(line, ensure_ascii=False)
+
+
+class VertexBatchBackend:
+    name = "vertex-batch"
+
+    def __init__(self, bucket: str, prefix: str, model: str) -> None:
+        if not bucket:
+            raise RuntimeError("GCS_BUCKET no está configurado (requerido para batch prediction).")
+        self.bucket, self.prefix, self.model = bucket, prefix, model
+
+    def submit(self, input_path: str, run_id: str) -> BatchJob:
+        from vertexai.batch_prediction import BatchPredictionJob
+        from src.auth import init_vertex_ai
+        from src.clients.gcs_client import upload_file
+
+        init_vertex_ai()
+        base = f"{self.prefix}/{run_id}"
+        input_uri = upload_file(self.bucket, input_path, object_path=f"{base}/input.jsonl",
+                                content_type="application/jsonl")
+        job = BatchPredictionJob.submit(
+            source_model=self.model, input_dataset=input_uri,
+            output_uri_prefix=f"gs://{self.bucket}/{base}/output", job_display_name=f"testimonios-{run_id}",
+        )
+        logger.info("🛰️ Batch prediction enviado: %s (%s) ← %s", job.resource_name, self.model, input_uri)
+        return BatchJob(name=job.resource_name, model=self.model, submitted_at=time.time())
+
+    def resume(self, name: str) -> BatchJob:
+        return BatchJob(name=name, model=self.model, submitted_at=time.time())
+
+    def wait(self, job: BatchJob, *, poll_s: float, max_wait_s: float) -> BatchJob:
+        from vertexai.batch_prediction import BatchPredictionJob
+        from src.auth import init_vertex_ai
+
+        init_vertex_ai()
+        remote = BatchPredictionJob(job.name)
+        deadline = time.monotonic() + max_wait_s
+        while True:
+            remote.refresh()
+            if remote.has_ended:
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"El job {job.name} sigue en {remote.state.name} tras {max_wait_s:g}s.")
+            logger.info("⏳ Batch %s: %s", job.name, remote.state.name)
+            time.sleep(poll_s)
+        if not remote.has_succeeded:
+            raise RuntimeError(f"El job {job.name} terminó en {remote.state.name}: {remote.error}")
+        job.output = remote.output_location
+        return job
+
+    def iter_predictions(self, job: BatchJob) -> Iterator[Dict]:
+        from src.clients.gcs_client import get_storage_client
+
+        bucket, _, prefix = job.output.removeprefix("gs://").partition("/")
+        for blob in get_storage_client().list_blobs(bucket, prefix=prefix.rstrip("/") + "/"):
+            name = os.path.basename(blob.name)
+            if not (name.startswith("predictions") and name.endswith(".jsonl")):
+                continue
+            with blob.open("r", encoding="utf-8") as fh:  # streaming: no baja el archivo entero
+                for line in fh:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+class LocalBatchBackend:
+    """Sustituto de VertexBatchBackend: mismo JSONL, procesado en este proceso al enviarlo."""
+
+    name = "local-batch"
+
+    def __init__(self, workdir: str, generate: Optional[Callable[[str], str]] = None, model: str = "") -> None:
+        self.workdir = workdir
+        self.model = model or get_settings().model_id
+        self._generate = generate
+
+    def _output_dir(self, run_id: str) -> str:
+        return os.path.join(self.workdir, run_id, "output")
+
+    def submit(self, input_path: str, run_id: str) -> BatchJob:
+        generate = self._generate
+        if generate is None:
+            from src.clients.vertex_client import generate_text
+
+            generate = lambda prompt: generate_text(prompt, priority="backfill")  # noqa: E731
+        out_dir = self._output_dir(run_id)
+        os.makedirs(out_dir, exist_ok=True)
+        with open(input_path, encoding="utf-8") as src, \
+                open(os.path.join(out_dir, "predictions.jsonl"), "w", encoding="utf-8") as out:
+            for line in src:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                try:
+                    out.write(_prediction(item["key"], item["request"], text=generate(_prompt_of(item["request"]))) + "\n")
+                except Exception as e:  # como en Vertex: la línea queda con status y el lote sigue
+                    out.write(_prediction(item["key"], item["request"], error=str(e)) + "\n")
+        logger.info("🛰️ Batch local procesado: %s", out_dir)
+        return BatchJob(name=f"local:{run_id}", model=self.model, submitted_at=time.time())
+
+    def resume(self, name: str) -> BatchJob:
+        return BatchJob(name=name, model=self.model, submitted_at=time.time())
+
+    def wait(self, job: BatchJob, *, poll_s: float, max_wait_s: float) -> BatchJob:
+        job.output = self._output_dir(job.name.removeprefix("local:"))
+        return job
+
+    def iter_predictions(self, job: BatchJob) -> Iterator[Dict]:
+        for path in sorted(glob.glob(os.path.join(job.output, _PREDICTIONS_GLOB))):
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+BatchBackend = Union[VertexBatchBackend, LocalBatchBackend]
+
+
+def get_batch_backend(kind: Optional[str] = None, *, workdir: str = ".") -> BatchBackend:
+    s = get_settings()
+    kind = (kind or s.batch_backend).lower()
+    if kind == "local":
+        return LocalBatchBackend(workdir, model=s.batch_model)
+    if kind == "vertex":
+        return VertexBatchBackend(s.gcs_bucket, s.batch_gcs_prefix, s.batch_model or s.model_id)
+    raise ValueError(f"Backend de batch inválido: {kind}. Usa 'vertex' o 'local'.")
+
+
+def collect_results(backend: BatchBackend, job: BatchJob, input_path: str) -> Dict[str, Union[LLMResult, Exception]]:
+    """
+    Predicciones del job → {key: LLMResult | Exception}. `input_path` (el JSONL enviado) permite
+    emparejar por prompt las líneas que no traen `key`.
+    """
+    keys_by_prompt: Dict[str, str] = {}
+    with open(input_path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                item = json.loads(line)
+                keys_by_prompt[_prompt_hash(_prompt_of(item["request"]))] = item["key"]
+
+    latency = max(0.0, time.time() - job.submitted_at)
+    location = get_settings().vertex_location
+    results: Dict[str, Union[LLMResult, Exception]] = {}
+    for pred in backend.iter_predictions(job):
+        key = pred.get("key") or keys_by_prompt.get(_prompt_hash(_prompt_of(pred.get("request") or {})))
+        if key is None:
+            logger.warning("⚠️ Predicción sin key ni prompt conocido: se ignora.")
+            continue
+        try:
+            if pred.get("status"):
+                raise RuntimeError(pred["status"])
+            results[key] = LLMResult(text=_response_text(pred.get("response")), model=job.model,
+                                     location=location, backend=backend.name, latency_s=latency)
+        except Exception as e:
+            results[key] = e
+    ok = sum(1 for r in results.values() if isinstance(r, LLMResult))
+    logger.info("📥 Batch %s: %s predicciones (%s con error) de %s prompts.",
+                job.name, len(results), len(results) - ok, len(keys_by_prompt))
+    return results
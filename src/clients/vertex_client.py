@@ -1,58 +1,133 @@
 # src/clients/vertex_client.py
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+
 from vertexai.preview.generative_models import GenerativeModel, Part
 from src.auth import init_vertex_ai
+from src.clients.llm_router import LLMResult, get_llm_router
+from src.deadline import check_deadline, current_deadline, use_deadline
+from src.orchestration.scheduler import current_priority, get_rate_limiter
 from src.settings import get_settings
 from src.logging_conf import get_logger
+from src.shared_cache import cache_key, get_shared_cache
 
 logger = get_logger(__name__)
 settings = get_settings()
 
-def generate_text(prompt: str) -> str:
-    init_vertex_ai()
-    model_id = settings.vertex_model  # ✅ antes: vertex_model_id
-    logger.info(f"🤖 Solicitando respuesta a modelo {model_id}...")
+def _llm_cache_key(prompt: str, context: str | None) -> str:
+    # Mismo prompt + mismo modelo elegido → misma respuesta reutilizable entre procesos
+    router = get_llm_router()
+    return cache_key(router.backend, router.choose_model(len(prompt), context), context or "", prompt)
+
+def _from_cache(data: dict) -> LLMResult:
+    # Lo guardado lleva cached=True; quien la generó en este request usa su propio resultado
+    result = LLMResult(**data)
+    logger.info("♻️ Respuesta LLM desde cache compartido (%s).", result.model)
+    return result
+
+def generate_text(prompt: str, *, context: str | None = None, priority: str | None = None) -> str:
+    """
+    Genera texto vía la capa de backends (ruteo por tamaño/contexto, failover y hedging).
+    Ver src/clients/llm_router.py.
+    """
+    return generate_text_result(prompt, context=context, priority=priority).text
+
+def generate_text_result(prompt: str, *, context: str | None = None, priority: str | None = None) -> LLMResult:
+    """
+    Como generate_text, pero incluye modelo/región efectivos y latencia.
+    Solo las respuestas que no salen del cache gastan cuota (VERTEX_RPM, por clase `priority`).
+    """
+    router = get_llm_router()
+    logger.info("🤖 Solicitando respuesta (%s chars de prompt)...", len(prompt))
+    fresh = []
+
+    def _generate() -> dict:
+        get_rate_limiter("vertex").acquire(priority)
+        result = router.generate(prompt, context=context)
+        fresh.append(result)
+        return asdict(replace(result, cached=True))
+
     try:
-        model = GenerativeModel(model_id)
-        response = model.generate_content(prompt)
-        logger.debug(f"Respuesta generada ({len(response.text)} caracteres).")
-        return response.text
+        data = get_shared_cache().get_or_compute(
+            "llm", _llm_cache_key(prompt, context), _generate, ttl_s=settings.llm_cache_ttl_s,
+        )
+        result = fresh[0] if fresh else _from_cache(data)
+        logger.debug("Respuesta generada (%s caracteres).", len(result.text))
+        return result
     except Exception as e:
-        logger.error(f"Error al generar texto en Vertex AI: {e}")
+        logger.error("Error al generar texto con el backend LLM: %s", e)
         raise
 
-def generate_text_with_files(prompt: str, gcs_uris: list[str]) -> str:
+async def agenerate_text_result(prompt: str, *, context: str | None = None, priority: str | None = None) -> LLMResult:
+    """Versión async de generate_text_result (no bloquea el event loop del caller)."""
+    router = get_llm_router()
+    logger.info("🤖 Solicitando respuesta (%s chars de prompt)...", len(prompt))
+    fresh = []
+
+    async def _generate() -> dict:
+        await get_rate_limiter("vertex").aacquire(priority)
+        result = await router.agenerate_from_any_loop(prompt, context=context)
+        fresh.append(result)
+        return asdict(replace(result, cached=True))
+
+    try:
+        data = await get_shared_cache().aget_or_compute(
+            "llm", _llm_cache_key(prompt, context), _generate, ttl_s=settings.llm_cache_ttl_s,
+        )
+        return fresh[0] if fresh else _from_cache(data)
+    except Exception as e:
+        logger.error("Error al generar texto con el backend LLM: %s", e)
+        raise
+
+def generate_text_with_files(prompt: str, gcs_uris: list[str], *, priority: str | None = None) -> str:
     init_vertex_ai()
-    model_id = settings.vertex_model  # ✅
-    logger.info(f"🤖 Modelo {model_id} con {len(gcs_uris)} archivo(s) adjunto(s)...")
+    get_rate_limiter("vertex").acquire(priority)
+    # La llamada del SDK no se puede cancelar a mitad: el deadline se mira antes de lanzarla
+    check_deadline("llm con archivos")
+    model_id = settings.model_id
+    logger.info("🤖 Modelo %s con %s archivo(s) adjunto(s)...", model_id, len(gcs_uris))
     try:
         model = GenerativeModel(model_id)
         parts = [prompt] + [Part.from_uri(uri, mime_type="application/pdf") for uri in gcs_uris]
         response = model.generate_content(parts)
         return response.text
     except Exception as e:
-        logger.error(f"Error al generar texto con archivos en Vertex AI: {e}")
+        logger.error("Error al generar texto con archivos en Vertex AI: %s", e)
         raise
 
 
 # ✅ Nuevo: patrón Map-Reduce para PDFs grandes
 def generate_text_from_files_map_reduce(system_text: str, base_prompt: str,
-                                        chunk_uris: list[str], params: dict) -> str:
+                                        chunk_uris: list[str], params: dict,
+                                        *, max_workers: int = 1, priority: str | None = None) -> str:
     """
-    MAP: procesa cada chunk por separado (adjuntando su PDF).
+    MAP: procesa cada chunk por separado (adjuntando su PDF); con max_workers > 1
+    los chunks se procesan en paralelo (el orden de los parciales se conserva).
     REDUCE: consolida todos los parciales en una sola salida.
     """
-    partials: list[str] = []
     total = len(chunk_uris)
+    # Los hilos del MAP no heredan los contextvars: clase y deadline se fijan acá
+    priority = priority or current_priority()
+    deadline = current_deadline()
 
-    for i, uri in enumerate(chunk_uris, start=1):
+    def _map(i: int, uri: str) -> str:
         sub_prompt = (
             f"[SYSTEM]\n{system_text}\n\n"
             f"[PROMPT_BASE]\n{base_prompt}\n\n"
             f"[INPUT_CHUNK {i}/{total}]\n(Usa ÚNICAMENTE el PDF adjunto en esta parte)\n\n"
             f"[PARAMS]\n{params}\n"
         )
-        partial = generate_text_with_files(sub_prompt, [uri])
-        partials.append(f"### CHUNK {i}\n{partial}")
+        with use_deadline(deadline):
+            partial = generate_text_with_files(sub_prompt, [uri], priority=priority)
+        return f"### CHUNK {i}\n{partial}"
+
+    if max_workers > 1 and total > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, total), thread_name_prefix="llm-map") as pool:
+            partials = list(pool.map(_map, range(1, total + 1), chunk_uris))
+    else:
+        partials = [_map(i, uri) for i, uri in enumerate(chunk_uris, start=1)]
 
     reduce_prompt = (
         f"[SYSTEM]\n{system_text}\n\n"
@@ -61,4 +136,4 @@ def generate_text_from_files_map_reduce(system_text: str, base_prompt: str,
         "Instrucción: Fusiona y deduplica los resultados anteriores en una sola salida final, "
         "respetando formato y criterios de PROMPT_BASE/PARAMS. No inventes."
     )
-    return generate_text(reduce_prompt)
+    return generate_text(reduce_prompt, priority=priority)
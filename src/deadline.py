@@ -0,0 +1,216 @@
+# src/deadline.py
+"""
+Deadline por request y cancelación del trabajo abandonado.
+
+- El caller fija su presupuesto con el header `X-Request-Timeout: <segundos>` o el campo
+  `timeout_s` (si vienen ambos, el menor). Sin ninguno: REQUEST_TIMEOUT_S (0 = sin deadline).
+- El deadline viaja en un contextvar. StageGraph le da a cada etapa lo que queda como
+  timeout y no arranca etapas nuevas con el deadline vencido; la llamada al modelo en curso
+  se cancela en el loop del router; los batchUpdate de Docs pendientes no se envían; las
+  esperas de turno (scheduler, cuotas, cache compartido) no esperan más allá del deadline.
+- Si el cliente HTTP se desconecta, `run_until_disconnect` cancela el deadline y la task:
+  el trabajo se corta en vez de competir con el reintento del caller.
+- Los efectos en background (callback a Sheets) corren sin deadline: el Doc ya está escrito.
+
+- Cada corrida de StageGraph trabaja con un hijo del deadline (`child()`): mismo vencimiento,
+  pero cancelable aparte (ABORTED) cuando falla una etapa, sin marcar el request como vencido.
+
+Errores: DeadlineExceeded (504) y ClientDisconnected (499, nadie la lee). Son HTTPException:
+endpoints y worker los tratan como cualquier otro error HTTP.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from src import metrics
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+EXPIRED, DISCONNECTED, ABORTED = "deadline", "disconnect", "aborted"
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Se agotó el deadline del request.", status_code: int = 504) -> None:
+        super().__init__(status_code=status_code, detail=detail)
+
+
+class ClientDisconnected(DeadlineExceeded):
+    def __init__(self, detail: str = "El cliente se desconectó; trabajo cancelado.") -> None:
+        super().__init__(detail, status_code=499)
+
+
+class Deadline:
+    """Vencimiento (monotonic) + cancelación explícita. Seguro entre hilos."""
+
+    def __init__(self, timeout_s: Optional[float]) -> None:
+        self.timeout_s = timeout_s
+        self.expires_at = time.monotonic() + timeout_s if timeout_s else None
+        self._reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._parent: Optional[Deadline] = None
+        self._unlink: Callable[[], None] = lambda: None
+
+    def child(self) -> "Deadline":
+        """
+        Deadline con el mismo vencimiento que se cancela junto con este, pero que además se
+        puede cancelar solo (ABORTED) sin tocar el del request. `detach()` al terminar.
+        """
+        child = Deadline(None)
+        child.timeout_s, child.expires_at, child._parent = self.timeout_s, self.expires_at, self
+        child._unlink = self.on_cancel(lambda: child._set(self._reason))
+        return child
+
+    def detach(self) -> None:
+        """Des-registra el hijo del deadline padre (el hijo ya no se usa)."""
+        self._unlink()
+
+    def remaining(self) -> Optional[float]:
+        """Segundos que quedan (None = sin límite)."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def done(self) -> bool:
+        return self._reason is not None or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout para una espera: lo que queda, acotado por `cap` (None = sin límite)."""
+        if self._reason is not None:
+            return 0.0
+        left = self.remaining()
+        if left is None:
+            return cap
+        return left if cap is None else min(left, cap)
+
+    def error(self, what: str = "") -> DeadlineExceeded:
+        if self._reason == DISCONNECTED:
+            return ClientDisconnected()
+        if self._reason == ABORTED:
+            return DeadlineExceeded(f"Corrida cancelada por el error de otra etapa ({what}).")
+        where = f" ({what})" if what else ""
+        return DeadlineExceeded(f"Se agotó el deadline del request ({self.timeout_s:g}s){where}.")
+
+    def check(self, what: str = "") -> None:
+        if self.done:
+            self.cancel(EXPIRED)
+            raise self.error(what)
+
+    def cancel(self, reason: str = EXPIRED) -> None:
+        """Marca el deadline como terminado y dispara los callbacks (una sola vez)."""
+        if self._reason is not None:
+            return
+        if self._parent is not None and reason != ABORTED:
+            # Vencimiento o desconexión son del request: se cancela el padre y él avisa a este
+            self._parent.cancel(reason)
+            return
+        if self._set(reason):
+            metrics.incr(f"deadline.{reason}")
+
+    def _set(self, reason: Optional[str]) -> bool:
+        with self._lock:
+            if self._reason is not None:
+                return False
+            self._reason = reason or EXPIRED
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:  # un callback roto no impide cancelar el resto
+                logger.debug("Callback de cancelación falló: %s", e)
+        return True
+
+    def on_cancel(self, fn: Callable[[], Any]) -> Callable[[], None]:
+        """Registra `fn` (p.ej. cancelar un future); devuelve cómo des-registrarlo."""
+        with self._lock:
+            if self._reason is None:
+                self._callbacks.append(fn)
+                registered = True
+            else:
+                registered = False
+        if not registered:
+            fn()
+
+        def _remove() -> None:
+            with self._lock:
+                if fn in self._callbacks:
+                    self._callbacks.remove(fn)
+
+        return _remove
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check_deadline(what: str = "") -> None:
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(what)
+
+
+def remaining_timeout(cap: Optional[float] = None) -> Optional[float]:
+    deadline = _current.get()
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Fija el deadline del contexto actual (hilos de pools: no heredan el contextvar)."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def parse_timeout(header: Optional[str], field: Optional[float] = None) -> Optional[float]:
+    """Presupuesto en segundos: el menor entre header y campo; si no hay, REQUEST_TIMEOUT_S."""
+    values = [field] if field else []
+    if header:
+        try:
+            values.append(float(header))
+        except ValueError:
+            raise HTTPException(422, f"X-Request-Timeout inválido: {header!r} (segundos).")
+    values = [v for v in values if v > 0]
+    if values:
+        return min(values)
+    return get_settings().request_timeout_s or None
+
+
+async def run_until_disconnect(request: Any, awaitable: Awaitable[Any], deadline: Deadline) -> Any:
+    """
+    Espera `awaitable` mientras vigila la conexión (`request.is_disconnected()` cada
+    DISCONNECT_POLL_S). Si el cliente se va: cancela el deadline (el trabajo en hilos lo ve
+    en su próximo chequeo) y la task (lo async se corta de inmediato).
+    """
+    poll_s = get_settings().disconnect_poll_s
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s if poll_s > 0 else None)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.warning("🔌 Cliente desconectado: se cancela el trabajo en curso.")
+                deadline.cancel(DISCONNECTED)
+                task.cancel()
+                await asyncio.wait({task})
+                raise deadline.error()
+    finally:
+        if not task.done():
+            deadline.cancel(DISCONNECTED)
+            task.cancel()
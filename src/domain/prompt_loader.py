@@ -1,18 +1,39 @@
 # src/domain/prompt_loader.py
 from __future__ import annotations
 
+import os
+import threading
+import time
+from dataclasses import dataclass, field
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, Optional
 
-from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, meta, select_autoescape
 
 from src.logging_conf import get_logger
+from src.settings import get_settings
 
 logger = get_logger(__name__)
 
-@lru_cache(maxsize=2)
-def _get_env(templates_dir: str) -> Environment:
+# Variables que el runner entrega a TODAS las plantillas.
+PROMPT_VARIABLES: FrozenSet[str] = frozenset(
+    {"case_id", "client", "witness", "context", "extra", "transcript", "language"}
+)
+
+TEMPLATE_SUFFIXES = (".j2", ".jinja", ".jinja2")
+
+DEFAULT_TEMPLATES = {
+    "es": "testimony_prompt_spanish.md.j2",
+    "en": "testimony_prompt_english.md.j2",
+}
+
+# Marcador que ocupa el lugar del transcript al renderizar: la plantilla se
+# renderiza con metadatos pequeños y el transcript se inserta UNA sola vez al final.
+_TRANSCRIPT_SENTINEL = "\x00__TRANSCRIPT__\x00"
+
+
+def _build_env(templates_dir: str) -> Environment:
     # autoescape OFF para .md/.j2 (plantillas de texto)
     env = Environment(
         loader=FileSystemLoader(templates_dir),
@@ -20,36 +41,212 @@ def _get_env(templates_dir: str) -> Environment:
         trim_blocks=True,
         lstrip_blocks=True,
         undefined=StrictUndefined,  # falla si falta una variable → mejor que silencie
+        auto_reload=False,          # la recarga la controla PromptRegistry (por mtime)
     )
     return env
 
 
-def render_testimony_prompt(*, language: str, templates_dir: Path,
-                            transcript: str, req: Any) -> str:
+@dataclass
+class _CompiledTemplate:
+    name: str
+    template: Template
+    mtime: float
+    required: FrozenSet[str]
+    # Métricas de render (acumuladas en el proceso)
+    renders: int = 0
+    total_render_ms: float = 0.0
+    last_render_ms: float = 0.0
+    last_prompt_chars: int = 0
+    max_prompt_chars: int = 0
+
+
+@dataclass
+class RenderedPrompt:
     """
-    Renderiza el prompt usando Jinja2.
-    - Selección por idioma ('es'/'en') o por extra.template_name si viene.
-    - Variables disponibles en la plantilla:
-        {{ case_id }}, {{ client }}, {{ witness }}, {{ context }},
-        {{ extra | tojson }}, {{ transcript }}, {{ language }}
+    Prompt en 3 partes: prefix + transcript + suffix.
+    El transcript NO se copia al renderizar; `text` lo concatena una sola vez
+    (cuando el backend necesita un str) y lo memoiza.
     """
+    prefix: str
+    transcript: str
+    suffix: str
+    template_name: str
+    render_ms: float = 0.0
+    _text: Optional[str] = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.prefix) + len(self.transcript) + len(self.suffix)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join((self.prefix, self.transcript, self.suffix))
+        return self._text
+
+
+class PromptRegistry:
+    """
+    Registro de plantillas precompiladas de `templates_dir`.
+    - warm(): compila TODAS las plantillas al arranque (incluye variantes de extra.template_name).
+    - get(): recompila si cambió el mtime del archivo (revisión como máx. cada `reload_interval` s).
+    - Valida variables requeridas antes de renderizar.
+    """
+
+    def __init__(self, templates_dir: str, *, reload_interval: float = 2.0) -> None:
+        self.templates_dir = templates_dir
+        self.reload_interval = reload_interval
+        self._env = _build_env(templates_dir)
+        self._templates: Dict[str, _CompiledTemplate] = {}
+        self._last_check: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # ---------- Compilación ----------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.templates_dir, name)
+
+    def _compile(self, name: str) -> _CompiledTemplate:
+        source, filename, _ = self._env.loader.get_source(self._env, name)
+        ast = self._env.parse(source, name, filename)
+        required = frozenset(meta.find_undeclared_variables(ast))
+        unknown = required - PROMPT_VARIABLES
+        if unknown:
+            logger.warning(
+                "⚠️ Plantilla '%s' usa variables que el runner no provee: %s",
+                name, sorted(unknown),
+            )
+        code = self._env.compile(ast, name, filename)
+        template = self._env.template_class.from_code(self._env, code, self._env.make_globals(None), None)
+        mtime = os.path.getmtime(filename)
+        return _CompiledTemplate(name=name, template=template, mtime=mtime, required=required)
+
+    def warm(self) -> Dict[str, Any]:
+        """Precompila todas las plantillas del directorio. Devuelve un resumen."""
+        compiled, failed = [], {}
+        if not os.path.isdir(self.templates_dir):
+            logger.warning("⚠️ PROMPTS_DIR no existe: %s", self.templates_dir)
+            return {"compiled": compiled, "failed": failed}
+
+        for name in self._env.list_templates():
+            if not name.endswith(TEMPLATE_SUFFIXES):
+                continue
+            try:
+                entry = self._compile(name)
+            except Exception as e:
+                failed[name] = str(e)
+                logger.error("❌ No se pudo compilar la plantilla '%s': %s", name, e)
+                continue
+            with self._lock:
+                prev = self._templates.get(name)
+                if prev is not None:
+                    entry.renders, entry.total_render_ms = prev.renders, prev.total_render_ms
+                self._templates[name] = entry
+                self._last_check[name] = time.monotonic()
+            compiled.append(name)
+
+        logger.info("📝 Plantillas precompiladas: %s", len(compiled), extra={"templates": compiled})
+        return {"compiled": compiled, "failed": failed}
+
+    def get(self, name: str) -> _CompiledTemplate:
+        now = time.monotonic()
+        entry = self._templates.get(name)
+        if entry is not None and now - self._last_check.get(name, 0.0) < self.reload_interval:
+            return entry
+
+        with self._lock:
+            entry = self._templates.get(name)
+            self._last_check[name] = now
+            try:
+                mtime = os.path.getmtime(self._path(name))
+            except OSError:
+                if entry is not None:
+                    # El archivo desapareció: seguimos sirviendo la versión compilada
+                    return entry
+                raise
+            if entry is not None and mtime == entry.mtime:
+                return entry
+
+            fresh = self._compile(name)
+            if entry is not None:
+                fresh.renders, fresh.total_render_ms = entry.renders, entry.total_render_ms
+                logger.info("🔄 Plantilla recargada (mtime cambió): %s", name)
+            self._templates[name] = fresh
+            return fresh
+
+    # ---------- Render ----------
+
+    def render(self, name: str, ctx: Dict[str, Any]) -> RenderedPrompt:
+        entry = self.get(name)
+
+        missing = entry.required - ctx.keys()
+        if missing:
+            raise ValueError(f"Faltan variables para la plantilla '{name}': {sorted(missing)}")
+
+        transcript = ctx.get("transcript") or ""
+        t0 = time.perf_counter()
+        rendered = entry.template.render(**{**ctx, "transcript": _TRANSCRIPT_SENTINEL})
+        prefix, sep, suffix = rendered.partition(_TRANSCRIPT_SENTINEL)
+
+        if not sep or _TRANSCRIPT_SENTINEL in suffix:
+            # La plantilla no usa el transcript o lo usa más de una vez / transformado:
+            # render completo (camino lento pero correcto).
+            prefix, transcript, suffix = entry.template.render(**ctx), "", ""
+
+        render_ms = (time.perf_counter() - t0) * 1000
+        result = RenderedPrompt(
+            prefix=prefix, transcript=transcript, suffix=suffix,
+            template_name=name, render_ms=render_ms,
+        )
+
+        size = len(result)
+        entry.renders += 1
+        entry.total_render_ms += render_ms
+        entry.last_render_ms = render_ms
+        entry.last_prompt_chars = size
+        entry.max_prompt_chars = max(entry.max_prompt_chars, size)
+        logger.info(
+            "📝 Prompt renderizado con %s (%.2f ms, %s chars)", name, render_ms, size,
+            extra={"template": name, "render_ms": round(render_ms, 3), "prompt_chars": size},
+        )
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Render time y tamaño de prompt por plantilla."""
+        out: Dict[str, Dict[str, Any]] = {}
+        for name, e in sorted(self._templates.items()):
+            out[name] = {
+                "required": sorted(e.required),
+                "renders": e.renders,
+                "avg_render_ms": round(e.total_render_ms / e.renders, 3) if e.renders else None,
+                "last_render_ms": round(e.last_render_ms, 3) if e.renders else None,
+                "last_prompt_chars": e.last_prompt_chars,
+                "max_prompt_chars": e.max_prompt_chars,
+            }
+        return out
+
+
+@lru_cache(maxsize=2)
+def get_prompt_registry(templates_dir: str) -> PromptRegistry:
+    registry = PromptRegistry(templates_dir, reload_interval=get_settings().prompts_reload_interval)
+    registry.warm()
+    return registry
+
+
+def _template_name_for(language: str, extra: Dict[str, Any]) -> str:
     # Permite override por request: extra.template_name
-    extra = req.extra or {}
-    template_from_extra = extra.get("template_name")
+    return extra.get("template_name") or DEFAULT_TEMPLATES.get(language, DEFAULT_TEMPLATES["es"])
 
-    name_map = {
-        "es": "testimony_prompt_spanish.md.j2",
-        "en": "testimony_prompt_english.md.j2",
-    }
-    template_name = template_from_extra or name_map.get(language, name_map["es"])
 
-    env = _get_env(str(templates_dir))
-    try:
-        tmpl = env.get_template(template_name)
-    except Exception as e:
-        logger.error(f"No se encontró la plantilla '{template_name}' en {templates_dir}: {e}")
-        raise
+def render_testimony_prompt_parts(*, language: str, templates_dir: Path,
+                                  transcript: str, req: Any) -> RenderedPrompt:
+    """
+    Igual que render_testimony_prompt pero devuelve un RenderedPrompt
+    (prefix/transcript/suffix) sin copiar el transcript dentro del render.
+    """
+    extra = req.extra or {}
+    template_name = _template_name_for(language, extra)
 
+    registry = get_prompt_registry(str(templates_dir))
     ctx: Dict[str, Any] = {
         "case_id": req.case_id,
         "client": req.client,
@@ -59,4 +256,22 @@ def render_testimony_prompt(*, language: str, templates_dir: Path,
         "transcript": transcript,
         "language": language,
     }
-    return tmpl.render(**ctx)
+    try:
+        return registry.render(template_name, ctx)
+    except Exception as e:
+        logger.error("No se pudo renderizar la plantilla '%s' en %s: %s", template_name, templates_dir, e)
+        raise
+
+
+def render_testimony_prompt(*, language: str, templates_dir: Path,
+                            transcript: str, req: Any) -> str:
+    """
+    Renderiza el prompt usando Jinja2.
+    - Selección por idioma ('es'/'en') o por extra.template_name si viene.
+    - Variables disponibles en la plantilla:
+        {{ case_id }}, {{ client }}, {{ witness }}, {{ context }},
+        {{ extra | tojson }}, {{ transcript }}, {{ language }}
+    """
+    return render_testimony_prompt_parts(
+        language=language, templates_dir=templates_dir, transcript=transcript, req=req
+    ).text
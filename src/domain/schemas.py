@@ -1,18 +1,37 @@
 # src/domain/schemas.py
 from pydantic import BaseModel, Field, HttpUrl, field_validator, model_validator
-from typing import Optional, Dict, Any, Literal
+from typing import Optional, Dict, Any, List, Literal
 
 # --- 1. Configuración de Callback para Sheets ---
 class SheetCallbackConfig(BaseModel):
     """Configuración para escribir el resultado en Google Sheets"""
     spreadsheet_id: str = Field(..., description="ID de la hoja de cálculo")
     sheet_name: str = Field(default="Hoja 1", description="Nombre de la pestaña")
-    row_index: int = Field(..., description="Fila donde se escribirá el resultado")
-    
+    row_index: Optional[int] = Field(None, description="Fila donde se escribirá el resultado (si no, se busca por key_col)")
+
+    # Alternativa a row_index: buscar la fila por clave (robusto a filas insertadas/reordenadas)
+    key_col: Optional[str] = Field(None, description="Columna con la clave de cada fila (ej: 'A')")
+    key: Optional[str] = Field(None, description="Valor a buscar en key_col (por defecto, el case_id)")
+
     # Columnas específicas para este servicio
     testimony_doc_col: Optional[str] = Field(None, description="Columna para el link del Testimonio (ej: 'H')")
     status_col: Optional[str] = Field(None, description="Columna para status (ej: 'J')")
 
+    @model_validator(mode="after")
+    def _require_row_or_key(self):
+        if self.row_index is None and not self.key_col:
+            raise ValueError("sheet_callback necesita 'row_index' o 'key_col' (búsqueda de la fila por clave).")
+        return self
+
+# Clase de prioridad del scheduler (src/orchestration/scheduler.py). Si falta, la fija el endpoint.
+PriorityClass = Literal["interactive", "webhook", "backfill"]
+
+# Nivel de compactación del transcript (src/domain/transcript_compaction.py). Si falta: TRANSCRIPT_COMPACTION.
+CompactionLevel = Literal["off", "light", "standard", "aggressive"]
+
+# Destino de una salida y cómo escribirlo (mismo set que TestimonyRequest.write_mode)
+WriteMode = Literal["rewrite", "diff", "docx", "html"]
+
 # --- 2. Estructuras para el Webhook (Input del Transcriptor) ---
 class WebhookMetadata(BaseModel):
     """Datos que viajan dentro del campo 'metadata' del webhook del Transcriptor"""
@@ -32,6 +51,25 @@ class TranscriptionWebhookRequest(BaseModel):
     metadata: WebhookMetadata 
 
 # --- 3. Request Principal (Actualizado) ---
+class TestimonyOutput(BaseModel):
+    """Salida adicional del mismo transcript: lo que falte se toma del request principal."""
+    output_doc_id: str = Field(..., description="ID del Google Doc de esta salida.")
+    context: Optional[str] = Field(None, description="Si falta, el 'context' del request.")
+    language: Optional[Literal["es", "en"]] = Field(None, description="Si falta, el idioma del request.")
+    write_mode: Optional[WriteMode] = Field(None, description="Si falta, el 'write_mode' del request.")
+    testimony_doc_col: Optional[str] = Field(
+        None, description="Columna del callback para el link de esta salida. Si falta, el link se suma "
+                          "(una línea por salida) a sheet_callback.testimony_doc_col.",
+    )
+
+    @field_validator("output_doc_id", mode="before")
+    @classmethod
+    def _strip_and_require_output(cls, v: Optional[str]) -> Optional[str]:
+        if v is None: return v
+        s = str(v).strip()
+        if not s: raise ValueError("output_doc_id no puede ser vacío.")
+        return s
+
 class TestimonyRequest(BaseModel):
     # Identificación y contexto
     case_id: str = Field(..., description="ID del caso (obligatorio).")
@@ -50,10 +88,31 @@ class TestimonyRequest(BaseModel):
 
     # Destino
     output_doc_id: str = Field(..., description="ID del Google Doc de salida.")
+    write_mode: Optional[WriteMode] = Field(
+        None,
+        description="'rewrite' borra y re-escribe; 'diff' solo aplica párrafos cambiados; "
+                    "'docx'/'html' reemplazan el contenido con una sola subida a Drive. "
+                    "Si falta, se usa settings.docs_write_mode.",
+    )
 
     # Extras
     extra: Optional[Dict[str, Any]] = Field(default=None)
     request_id: Optional[str] = Field(default=None)
+    priority: Optional[PriorityClass] = Field(
+        None, description="'interactive' | 'webhook' | 'backfill'. Reparto justo por extra.tenant / client / case_id.",
+    )
+    timeout_s: Optional[float] = Field(
+        None, gt=0, description="Presupuesto del request en segundos (como X-Request-Timeout); vencido se corta el trabajo.",
+    )
+    compaction: Optional[CompactionLevel] = Field(
+        None, description="Limpieza del transcript antes del prompt (timestamps, etiquetas, muletillas, duplicados). "
+                          "Si falta, se usa settings.transcript_compaction.",
+    )
+    outputs: Optional[List[TestimonyOutput]] = Field(
+        None, max_length=10,
+        description="Salidas adicionales (otro idioma / context, cada una con su output_doc_id) del mismo "
+                    "transcript: se lee una sola vez y las salidas se generan y escriben en paralelo.",
+    )
 
     # ✅ NUEVO: Campo para recibir la configuración del Callback
     sheet_callback: Optional[SheetCallbackConfig] = Field(
@@ -80,6 +139,60 @@ class TestimonyRequest(BaseModel):
             )
         return self
 
+    @model_validator(mode="after")
+    def _unique_output_docs(self):
+        docs = [self.output_doc_id] + [o.output_doc_id for o in self.outputs or []]
+        if len(set(docs)) != len(docs):
+            raise ValueError("Cada salida necesita su propio output_doc_id (hay repetidos).")
+        return self
+
+# --- 4. Request PDF → Testimonio (map-reduce sobre chunks) ---
+class PdfTestimonyRequest(BaseModel):
+    case_id: str = Field(..., description="ID del caso (obligatorio).")
+    context: str = Field(..., description="Ej: 'Witness', 'Reference Letter' (obligatorio).")
+    language: Optional[Literal["es", "en"]] = Field(None)
+    client: Optional[str] = Field(None)
+    witness: Optional[str] = Field(None)
+
+    # Fuente: PDF en Drive (ID o link /file/d/<id>/)
+    pdf_file_id: Optional[str] = Field(None, description="fileId del PDF en Drive.")
+    pdf_link: Optional[str] = Field(None, description="Link de Drive al PDF.")
+
+    # Corte (si faltan, se usan PDF_PAGES_PER_CHUNK / PDF_MAX_CHUNK_MB)
+    pages_per_chunk: Optional[int] = Field(None, ge=1)
+    max_chunk_mb: Optional[float] = Field(None, ge=0)
+
+    # Destino
+    output_doc_id: str = Field(..., description="ID del Google Doc de salida.")
+    write_mode: Optional[WriteMode] = Field(None)
+    sheet_callback: Optional[SheetCallbackConfig] = Field(None)
+
+    extra: Optional[Dict[str, Any]] = Field(default=None)
+    request_id: Optional[str] = Field(default=None)
+    priority: Optional[PriorityClass] = Field(None)
+    timeout_s: Optional[float] = Field(None, gt=0)
+
+    @model_validator(mode="after")
+    def _require_pdf_source(self):
+        if not (self.pdf_file_id or self.pdf_link):
+            raise ValueError("Debes enviar 'pdf_file_id' o 'pdf_link'.")
+        return self
+
+class TranscriptCompaction(BaseModel):
+    """Lo que ahorró la compactación del transcript (tokens estimados)."""
+    level: CompactionLevel
+    tokens_before: int
+    tokens_after: int
+    tokens_saved: int
+
+class TestimonyOutputResult(BaseModel):
+    """Una salida escrita (TestimonyResponse.outputs)."""
+    doc_id: str
+    output_doc_link: str
+    model: str
+    language: str
+    context: str
+
 class TestimonyResponse(BaseModel):
     status: str
     message: str
@@ -88,4 +201,6 @@ class TestimonyResponse(BaseModel):
     model: str
     language: str
     case_id: str
-    request_id: Optional[str] = None
\ No newline at end of file
+    request_id: Optional[str] = None
+    compaction: Optional[TranscriptCompaction] = None
+    outputs: Optional[List[TestimonyOutputResult]] = None  # con `outputs` en el request: todas, la principal primero
\ No newline at end of file
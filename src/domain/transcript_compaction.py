@@ -0,0 +1,168 @@
+# src/domain/transcript_compaction.py
+"""
+Compactación del transcript antes de renderizar el prompt.
+
+Los transcripts salen de ASR y traen 20–40% de ruido (timestamps, la etiqueta del hablante
+repetida en cada línea, muletillas, líneas duplicadas) que el modelo descarta igual pero que
+se paga en tokens y en latencia de procesamiento del prompt. Niveles (acumulativos):
+
+- light:      timestamps y marcas de subtítulos (WEBVTT/SRT), decoración de las etiquetas
+              (`**Speaker 1** (00:01:02):` → `Speaker 1:`), espacios y líneas repetidas seguidas.
+- standard:   + une los turnos seguidos del mismo hablante, quita muletillas sin contenido
+              (eh, ehm, mmm, uh, um…) y tartamudeos de 3+ repeticiones ("que que que").
+- aggressive: + líneas repetidas en cualquier parte y repeticiones dobles ("y y").
+
+No cambia palabras con contenido ni reordena. Sin timestamps el modelo ya no puede citar el
+minuto en DUDAS PENDIENTES: por eso el default (TRANSCRIPT_COMPACTION) es "off".
+Los tokens son una estimación (~4 chars por token), la misma antes y después.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Tuple
+
+from src import metrics
+from src.domain.schemas import TranscriptCompaction
+from src.logging_conf import get_logger
+
+logger = get_logger(__name__)
+
+LEVELS = ("off", "light", "standard", "aggressive")
+_RANK = {level: i for i, level in enumerate(LEVELS)}
+_CHARS_PER_TOKEN = 4
+
+_TS = r"\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d{1,3})?"
+_TS_RANGE = rf"{_TS}(?:\s*(?:-->|[-–])\s*{_TS})?"
+_CUE_TIMING = re.compile(rf"^\s*{_TS}\s*-->\s*{_TS}.*$")
+_CUE_INDEX = re.compile(r"^\s*\d+\s*$")
+_VTT_HEADER = re.compile(r"^\s*WEBVTT\b")
+_TS_BRACKETED = re.compile(rf"[\[(]\s*{_TS_RANGE}\s*[\])]")
+# Sin corchetes solo al inicio de línea y con segundos/milisegundos: "a las 10:30" no es un timestamp
+_TS_LEADING = re.compile(r"^\s*(?:\d{1,2}:\d{2}:\d{2}(?:[.,]\d{1,3})?|\d{1,2}:\d{2}[.,]\d{1,3})\s+")
+_TS_ANY_LEADING = re.compile(rf"^\s*{_TS_RANGE}\s+")
+
+# Etiqueta de hablante: hasta 3 palabras en mayúscula inicial o números ("Speaker 1", "SPEAKER_00",
+# "Entrevistador", "María López"), con o sin viñeta, negritas o corchetes. "Y me dijo: ..." no lo es.
+_LABEL_WORD = r"(?:[A-ZÁÉÍÓÚÜÑ][\w'’.-]*|\d+)"
+_LABEL = rf"(?P<label>{_LABEL_WORD}(?:[ _]{_LABEL_WORD}){{0,2}})"
+_LABEL_LINE = re.compile(rf"^\s*(?:[-*•>]\s+)?[*_\[]*{_LABEL}[*_\]]*\s*:[*_]*\s*(?P<text>.*)$")
+# Encabezado de turno sin texto: "Speaker 1  0:03" (Otter/Zoom) o "**Entrevistador:**"
+_HEADER_LINE = re.compile(rf"^\s*(?:[-*•>]\s+)?[*_\[]*{_LABEL}[*_\]]*\s*(?:{_TS_RANGE}|:[*_]*)\s*$")
+
+_FILLER = re.compile(r"(?<![\w'’-])(?:e+h+m*|e+m+|m{2,}|h+m+|mhm|u+h+m*|u+m+|e+r+m+)(?![\w'’-])(?:\s*(?:,|…|\.{2,}))*", re.I)
+_STUTTER = {
+    "standard": re.compile(r"(?<!\w)([^\W\d_]+)(?:[\s,]+\1(?!\w)){2,}", re.I),
+    "aggressive": re.compile(r"(?<!\w)([^\W\d_]+)(?:[\s,]+\1(?!\w))+", re.I),
+}
+_EMPTY_MARKS = re.compile(r"¿\s*\?|¡\s*!|\(\s*\)|\[\s*\]")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([,.;:?!…])")
+_DUP_PUNCT = re.compile(r"([,;])(?:\s*[,;])+")
+_LEADING_PUNCT = re.compile(r"^[\s,;.…]+")
+_SPACES = re.compile(r"\s+")
+_DUP_KEY = re.compile(r"[\W_]+")
+_GLOBAL_DUP_MIN_CHARS = 20  # líneas cortas ("Sí.", "Claro.") se repiten de verdad
+
+Turn = List[Optional[str]]  # [hablante | None, texto]
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text or "") // _CHARS_PER_TOKEN)
+
+
+def _strip_timestamps(line: str) -> str:
+    line = _TS_BRACKETED.sub(" ", line)
+    rest = _TS_ANY_LEADING.sub("", line, count=1)
+    if rest != line and _LABEL_LINE.match(rest):
+        return rest
+    return _TS_LEADING.sub("", line, count=1)
+
+
+def _parse(transcript: str) -> List[Turn]:
+    turns: List[Turn] = []
+    lines = transcript.splitlines()
+    for i, raw in enumerate(lines):
+        if _VTT_HEADER.match(raw) or _CUE_TIMING.match(raw):
+            continue
+        # Un número solo es índice de cue únicamente antes de su timing (SRT/VTT): si no, es
+        # contenido ("¿Cuántos hijos tiene?" / "3")
+        if _CUE_INDEX.match(raw) and i + 1 < len(lines) and _CUE_TIMING.match(lines[i + 1]):
+            continue
+        header = _HEADER_LINE.match(raw)
+        if header:
+            turns.append([_SPACES.sub(" ", header["label"]), ""])
+            continue
+        line = _strip_timestamps(raw)
+        m = _LABEL_LINE.match(line)
+        if m:
+            turns.append([_SPACES.sub(" ", m["label"]), m["text"]])
+        elif line.strip():
+            turns.append([None, line])
+    return turns
+
+
+def _clean_text(text: str, level: str) -> str:
+    if _RANK[level] >= _RANK["standard"]:
+        text = _FILLER.sub(" ", text)
+        text = _STUTTER[level].sub(r"\1", text)
+        text = _EMPTY_MARKS.sub(" ", text)
+    text = _SPACES.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT.sub(r"\1", text)
+    text = _DUP_PUNCT.sub(r"\1", text)
+    return _LEADING_PUNCT.sub("", text).strip()
+
+
+def _dedupe(turns: List[Turn], level: str) -> List[Turn]:
+    out: List[Turn] = []
+    seen = set()
+    prev: Optional[Tuple[Optional[str], str]] = None
+    for speaker, text in turns:
+        key = _DUP_KEY.sub("", text.lower())
+        if key and (speaker, key) == prev:
+            continue
+        if level == "aggressive" and len(key) >= _GLOBAL_DUP_MIN_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        prev = (speaker, key)
+        out.append([speaker, text])
+    return out
+
+
+def _merge(turns: List[Turn]) -> List[Turn]:
+    """Turnos seguidos del mismo hablante (y líneas sin etiqueta) → un solo turno."""
+    out: List[Turn] = []
+    for speaker, text in turns:
+        if out and (speaker is None or speaker == out[-1][0]):
+            out[-1][1] = f"{out[-1][1]} {text}".strip()
+        else:
+            out.append([speaker, text])
+    return [t for t in out if t[1]]
+
+
+def _render(turns: List[Turn]) -> str:
+    return "\n".join(f"{speaker}: {text}".rstrip() if speaker else text for speaker, text in turns)
+
+
+def compact_transcript(transcript: str, level: str) -> Tuple[str, Optional[TranscriptCompaction]]:
+    """
+    Devuelve (transcript compactado, reporte). Con level "off" el texto sale intacto y sin reporte.
+    """
+    if level not in _RANK:
+        raise ValueError(f"Nivel de compactación inválido: {level}. Usa uno de {LEVELS}")
+    if level == "off" or not transcript:
+        return transcript, None
+
+    turns = [[speaker, _clean_text(text, level)] for speaker, text in _parse(transcript)]
+    turns = _dedupe([t for t in turns if t[0] or t[1]], level)
+    if _RANK[level] >= _RANK["standard"]:
+        turns = _merge(turns)
+    compacted = _render(turns)
+
+    before, after = estimate_tokens(transcript), estimate_tokens(compacted)
+    report = TranscriptCompaction(level=level, tokens_before=before, tokens_after=after,
+                                  tokens_saved=max(0, before - after))
+    metrics.incr("compaction.tokens_before", before)
+    metrics.incr("compaction.tokens_saved", report.tokens_saved)
+    logger.info("🗜️ Transcript compactado (%s): ~%s → ~%s tokens (-%s%%).", level, before, after,
+                round(100 * report.tokens_saved / before) if before else 0)
+    return compacted, report
@@ -0,0 +1,235 @@
+# src/health_probe.py
+"""
+Health checks caros fuera del camino de los requests.
+
+Un hilo de background ejecuta cada chequeo según su intervalo y guarda el último
+resultado; los endpoints de health solo leen ese cache (sin I/O):
+
+- credentials: token compartido válido (refresh si hace falta).
+- docs_read:   documents.get (solo documentId) sobre HEALTHCHECK_DOC_ID.
+- docs_write:  insert + delete reversible en HEALTHCHECK_DOC_ID (gasta cuota de escritura:
+               intervalo largo, HEALTH_WRITE_PROBE_INTERVAL_S).
+- vertex:      vertexai.init (sin generar).
+
+Un resultado vence a las `ttl_s` (3 intervalos): vencido = no listo.
+Con varios workers (src.serve) los resultados se comparten por el cache compartido
+(src/shared_cache.py): cada sonda corre una vez por intervalo en la instancia, no una por proceso.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.logging_conf import get_logger
+from src.settings import get_settings
+from src import metrics
+from src.shared_cache import get_shared_cache
+
+logger = get_logger(__name__)
+
+_STARTED_AT = time.time()
+
+
+@dataclass
+class CheckResult:
+    ok: bool
+    detail: str
+    checked_at: float  # epoch
+    latency_s: float
+
+    def age_s(self) -> float:
+        return time.time() - self.checked_at
+
+    def as_dict(self, ttl_s: float) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "fresh": self.age_s() <= ttl_s,
+            "detail": self.detail,
+            "age_s": round(self.age_s(), 1),
+            "latency_s": round(self.latency_s, 3),
+        }
+
+
+@dataclass
+class _Check:
+    name: str
+    fn: Callable[[], str]  # devuelve detalle; lanza si falla
+    interval_s: float
+    next_run: float = 0.0  # monotonic
+
+    @property
+    def ttl_s(self) -> float:
+        return self.interval_s * 3
+
+
+# ---------------------------
+# Sondas (bloqueantes; corren en el hilo del prober)
+# ---------------------------
+
+def probe_credentials() -> str:
+    from src.auth import ensure_fresh_credentials
+
+    creds = ensure_fresh_credentials()
+    return "token válido" if creds.valid else "token inválido"
+
+
+def probe_docs_read(doc_id: str) -> str:
+    from src.auth import build_docs_client
+
+    build_docs_client().documents().get(documentId=doc_id, fields="documentId").execute(num_retries=1)
+    return f"lectura ok ({doc_id})"
+
+
+def probe_docs_write(doc_id: str) -> str:
+    """Escritura reversible: insert + delete en la misma batch (el Doc queda igual)."""
+    from src.auth import build_docs_client
+
+    probe = "SA health-check ✔"
+    build_docs_client().documents().batchUpdate(
+        documentId=doc_id,
+        body={"requests": [
+            {"insertText": {"location": {"index": 1}, "text": probe}},
+            {"deleteContentRange": {"range": {"startIndex": 1, "endIndex": 1 + len(probe)}}},
+        ]},
+    ).execute()
+    return f"escritura ok ({doc_id})"
+
+
+def probe_vertex() -> str:
+    from src.auth import init_vertex_ai
+
+    init_vertex_ai()
+    return "vertex ok"
+
+
+# ---------------------------
+# Prober
+# ---------------------------
+
+class HealthProber(threading.Thread):
+    def __init__(self, checks: List[_Check]) -> None:
+        super().__init__(name="health-prober", daemon=True)
+        self._checks = {c.name: c for c in checks}
+        self._results: Dict[str, CheckResult] = {}
+        self._lock = threading.Lock()
+        self._stop_evt = threading.Event()
+
+    def _probe(self, check: _Check) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            result = CheckResult(True, check.fn(), time.time(), time.perf_counter() - t0)
+        except Exception as e:
+            result = CheckResult(False, f"{type(e).__name__}: {e}"[:500], time.time(), time.perf_counter() - t0)
+            logger.warning("🩺 Health check %s falló: %s", check.name, result.detail)
+            metrics.incr(f"health.{check.name}_failures")
+        metrics.observe(f"health.{check.name}_latency_s", result.latency_s)
+        return asdict(result)
+
+    def run_check(self, check: _Check) -> CheckResult:
+        # Si otro worker ya sondeó en este intervalo, se reutiliza su resultado
+        data = get_shared_cache().get_or_compute(
+            "health", check.name, lambda: self._probe(check),
+            ttl_s=lambda d: check.interval_s if d["ok"] else min(check.interval_s, 15.0),
+        )
+        result = CheckResult(**data)
+        with self._lock:
+            self._results[check.name] = result
+        return result
+
+    def run(self) -> None:
+        while not self._stop_evt.is_set():
+            now = time.monotonic()
+            for check in self._checks.values():
+                if now >= check.next_run:
+                    self.run_check(check)
+                    # Si falló, reintento antes (pero no en loop cerrado)
+                    ok = self._results[check.name].ok
+                    check.next_run = time.monotonic() + (check.interval_s if ok else min(check.interval_s, 15.0))
+            wait_s = max(0.5, min(c.next_run for c in self._checks.values()) - time.monotonic())
+            self._stop_evt.wait(wait_s)
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            results = dict(self._results)
+        out: Dict[str, Dict[str, Any]] = {}
+        for name, check in self._checks.items():
+            res = results.get(name)
+            out[name] = res.as_dict(check.ttl_s) if res else {"ok": False, "fresh": False, "detail": "pendiente"}
+        return out
+
+    def readiness(self) -> Tuple[bool, Dict[str, Dict[str, Any]]]:
+        checks = self.snapshot()
+        return all(c["ok"] and c["fresh"] for c in checks.values()), checks
+
+
+_lock = threading.Lock()
+_prober: Optional[HealthProber] = None
+
+
+def _default_checks() -> List[_Check]:
+    s = get_settings()
+    checks = [
+        _Check("credentials", probe_credentials, s.health_probe_interval_s),
+        _Check("vertex", probe_vertex, s.health_probe_interval_s * 5),
+    ]
+    if s.healthcheck_doc_id:
+        doc_id = s.healthcheck_doc_id
+        checks += [
+            _Check("docs_read", lambda: probe_docs_read(doc_id), s.health_probe_interval_s),
+            _Check("docs_write", lambda: probe_docs_write(doc_id), s.health_write_probe_interval_s),
+        ]
+    return checks
+
+
+def start_health_prober() -> bool:
+    """Arranca (una vez por proceso) el hilo de health checks. False si está desactivado."""
+    global _prober
+    if not get_settings().health_probe_enabled:
+        return False
+    with _lock:
+        if _prober is not None and _prober.is_alive():
+            return True
+        _prober = HealthProber(_default_checks())
+        _prober.start()
+    logger.info("🩺 Health prober iniciado (%s).", ", ".join(_prober.snapshot()))
+    return True
+
+
+def get_health_prober() -> Optional[HealthProber]:
+    return _prober
+
+
+def uptime_s() -> float:
+    return time.time() - _STARTED_AT
+
+
+# Chequeos ad-hoc (GET /health/sa?doc_id=...): cacheados por doc para que un polling no gaste cuota
+_adhoc_lock = threading.Lock()
+_adhoc: Dict[Tuple[str, str], CheckResult] = {}
+
+
+def adhoc_doc_checks(doc_id: str) -> Dict[str, CheckResult]:
+    s = get_settings()
+    out: Dict[str, CheckResult] = {}
+    for name, fn, ttl in (("docs_read", probe_docs_read, s.health_probe_interval_s),
+                          ("docs_write", probe_docs_write, s.health_write_probe_interval_s)):
+        key = (name, doc_id)
+        with _adhoc_lock:
+            cached = _adhoc.get(key)
+        if cached is None or cached.age_s() > ttl:
+            t0 = time.perf_counter()
+            try:
+                cached = CheckResult(True, fn(doc_id), time.time(), time.perf_counter() - t0)
+            except Exception as e:
+                cached = CheckResult(False, f"{type(e).__name__}: {e}"[:500], time.time(), time.perf_counter() - t0)
+            with _adhoc_lock:
+                _adhoc[key] = cached
+        out[name] = cached
+        if not cached.ok:
+            break  # sin lectura no tiene sentido probar la escritura
+    return out
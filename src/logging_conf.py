@@ -1,10 +1,23 @@
 # src/logging_config.py
+import atexit
 import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
+import time
 from typing import Optional, Dict, Any
 
+# Serializador rápido opcional: orjson si está instalado, si no json stdlib.
+try:
+    import orjson  # type: ignore
+    _HAS_ORJSON = True
+except Exception:  # pragma: no cover - depende del entorno
+    orjson = None  # opcional
+    _HAS_ORJSON = False
+
 _LEVELS = {
     "CRITICAL": logging.CRITICAL,
     "ERROR": logging.ERROR,
@@ -14,40 +27,147 @@ _LEVELS = {
 }
 
 _CONFIGURED = False
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+# Claves estándar de LogRecord: se calculan UNA vez (no en cada record).
+_RESERVED = frozenset(
+    set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__)
+    | {"message", "asctime", "taskName"}
+)
+
+# Encoder JSON preconstruido: json.dumps(...) con kwargs crea un encoder por llamada.
+_STDLIB_ENCODE = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    if _HAS_ORJSON:
+        return orjson.dumps(payload, default=str).decode("utf-8")
+    return _STDLIB_ENCODE(payload)
 
 
 class _JsonFormatter(logging.Formatter):
     """
     Formateador JSON line-delimited para logs estructurados.
     Respeta fields estándar (level, name, message) y mezcla 'extra'.
+    El timestamp se cachea por segundo y el set de claves reservadas es global.
     """
 
+    def __init__(self) -> None:
+        super().__init__()
+        self._time_sec = -1
+        self._time_str = ""
+
+    def _format_time(self, created: float) -> str:
+        sec = int(created)
+        if sec != self._time_sec:
+            self._time_str = time.strftime("%Y-%m-%dT%H:%M:%S%z", self.converter(created))
+            self._time_sec = sec
+        return self._time_str
+
     def format(self, record: logging.LogRecord) -> str:
         payload: Dict[str, Any] = {
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
-            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
-        }
-
-        # 'extra' se incrusta en record.__dict__ por logging; filtramos claves conocidas
-        # y adjuntamos las que parezcan contextuales.
-        reserved = {
-            "name", "msg", "args", "levelname", "levelno", "pathname", "filename",
-            "module", "exc_info", "exc_text", "stack_info", "lineno", "funcName",
-            "created", "msecs", "relativeCreated", "thread", "threadName",
-            "processName", "process", "message", "asctime"
+            "time": self._format_time(record.created),
         }
 
-        for k, v in record.__dict__.items():
-            if k not in reserved and not k.startswith("_"):
-                payload[k] = v
+        # 'extra' se incrusta en record.__dict__ por logging; solo las claves que
+        # no son estándar (normalmente 0-3 por record).
+        extras = record.__dict__.keys() - _RESERVED
+        for k in extras:
+            if not k.startswith("_"):
+                payload[k] = record.__dict__[k]
 
         # Adjunta rastro de excepción si existe
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+
+        return _dumps(payload)
+
+
+class _SamplingFilter(logging.Filter):
+    """
+    Muestreo por logger para líneas DEBUG ruidosas.
+    rates = {"src.clients.gdocs_client": 0.1} → deja pasar 1 de cada 10 DEBUG.
+    Determinista (contador) y aplicado ANTES de encolar, en el hilo del request.
+    INFO y superiores nunca se muestrean.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self._every: Dict[str, int] = {
+            name: max(1, round(1 / rate)) for name, rate in rates.items() if rate > 0
+        }
+        self._muted = frozenset(name for name, rate in rates.items() if rate <= 0)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rule_for(self, name: str) -> Optional[str]:
+        # Coincidencia por prefijo jerárquico: "src.clients" aplica a "src.clients.x"
+        while name:
+            if name in self._every or name in self._muted:
+                return name
+            name = name.rpartition(".")[0]
+        return None
 
-        return json.dumps(payload, ensure_ascii=False)
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rule = self._rule_for(record.name)
+        if rule is None:
+            return True
+        if rule in self._muted:
+            return False
+        with self._lock:
+            n = self._counters.get(rule, 0)
+            self._counters[rule] = n + 1
+        return n % self._every[rule] == 0
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola records sin bloquear el hilo del request.
+    - Si la cola está llena (stdout atascado), se descarta el record y se cuenta.
+    - prepare() solo resuelve el mensaje; el formateo/serialización ocurre en el listener.
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolvemos msg % args aquí para no depender de objetos mutables en otro hilo.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    Parsea LOG_DEBUG_SAMPLING: "logger.a=0.1,logger.b=0" → {"logger.a": 0.1, "logger.b": 0.0}
+    """
+    rates: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        name, sep, rate = item.strip().partition("=")
+        if not sep or not name:
+            continue
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
 
 
 def _mask_pii_in_message(msg: str) -> str:
@@ -58,13 +178,44 @@ def _mask_pii_in_message(msg: str) -> str:
     return msg
 
 
-def configure_logging(level_name: str = "INFO", fmt: str = "json", include_pii: bool = False) -> None:
+def _build_stream_handler(fmt: str) -> logging.Handler:
+    handler = logging.StreamHandler(stream=sys.stdout)
+    if fmt.lower() == "json":
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+            datefmt="%Y-%m-%dT%H:%M:%S%z",
+        ))
+    return handler
+
+
+def _stop_listener() -> None:
+    """Vacía la cola y detiene el hilo de escritura (atexit)."""
+    global _LISTENER
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+
+
+def configure_logging(
+    level_name: str = "INFO",
+    fmt: str = "json",
+    include_pii: bool = False,
+    *,
+    use_queue: bool = True,
+    queue_size: int = 10000,
+    debug_sampling: Optional[Dict[str, float]] = None,
+) -> None:
     """
     Idempotente. Configura logging en texto o JSON.
     - Llama esto lo más temprano posible (ej. en main.py).
     - include_pii=False (recomendado). Si True, no se filtra contenido.
+    - use_queue=True: los hilos del request solo encolan; un hilo de fondo
+      formatea y escribe a stdout (QueueListener).
+    - debug_sampling: tasas por logger para DEBUG (ver _SamplingFilter).
     """
-    global _CONFIGURED
+    global _CONFIGURED, _LISTENER
     if _CONFIGURED:
         return
 
@@ -73,14 +224,17 @@ def configure_logging(level_name: str = "INFO", fmt: str = "json", include_pii:
 
     # Si Uvicorn ya añadió handlers, los respetamos pero alineamos niveles
     if not root.handlers:
-        handler = logging.StreamHandler(stream=sys.stdout)
-        if fmt.lower() == "json":
-            handler.setFormatter(_JsonFormatter())
+        stream_handler = _build_stream_handler(fmt)
+        if use_queue:
+            q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, queue_size))
+            handler: logging.Handler = _NonBlockingQueueHandler(q)
+            _LISTENER = logging.handlers.QueueListener(q, stream_handler, respect_handler_level=False)
+            _LISTENER.start()
+            atexit.register(_stop_listener)
         else:
-            handler.setFormatter(logging.Formatter(
-                fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-                datefmt="%Y-%m-%dT%H:%M:%S%z",
-            ))
+            handler = stream_handler
+        if debug_sampling:
+            handler.addFilter(_SamplingFilter(debug_sampling))
         root.addHandler(handler)
 
     root.setLevel(level)
@@ -108,6 +262,14 @@ def configure_logging(level_name: str = "INFO", fmt: str = "json", include_pii:
     _CONFIGURED = True
 
 
+def dropped_log_records() -> int:
+    """Records descartados por cola llena (útil para métricas/health)."""
+    for h in logging.getLogger().handlers:
+        if isinstance(h, _NonBlockingQueueHandler):
+            return h.dropped
+    return 0
+
+
 def get_logger(name: Optional[str] = None) -> logging.Logger:
     return logging.getLogger(name if name else __name__)
 
@@ -115,9 +277,20 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
 def bootstrap_logging_from_env() -> None:
     """
     Conveniencia: si prefieres no pasar parámetros manualmente.
-    Usa LOG_LEVEL, LOG_FORMAT y LOG_INCLUDE_PII del entorno.
+    Usa LOG_LEVEL, LOG_FORMAT, LOG_INCLUDE_PII, LOG_ASYNC, LOG_QUEUE_SIZE
+    y LOG_DEBUG_SAMPLING del entorno.
     """
     level = os.getenv("LOG_LEVEL", "INFO")
     fmt = os.getenv("LOG_FORMAT", "json")
     include_pii = os.getenv("LOG_INCLUDE_PII", "false").lower() in {"true", "1", "yes"}
-    configure_logging(level_name=level, fmt=fmt, include_pii=include_pii)
+    use_queue = os.getenv("LOG_ASYNC", "true").lower() in {"true", "1", "yes"}
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    sampling = _parse_sampling(os.getenv("LOG_DEBUG_SAMPLING", ""))
+    configure_logging(
+        level_name=level,
+        fmt=fmt,
+        include_pii=include_pii,
+        use_queue=use_queue,
+        queue_size=queue_size,
+        debug_sampling=sampling,
+    )
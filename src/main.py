@@ -7,18 +7,23 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from src.logging_conf import bootstrap_logging_from_env, get_logger
 from src.settings import get_settings
+from src.domain.prompt_loader import get_prompt_registry
+from src.auth import start_credential_refresher
+from src.health_probe import start_health_prober
+from src.memory_budget import start_memory_tracing
 
 # Routers
 from src.api.health import router as health_router
 from src.api.testimonios import router as testimonios_router
+from src.api.jobs import router as jobs_router
+from src.api.admin import router as admin_router
 
-# Middleware global (si es función tipo decorator HTTP middleware)
-# Si en tu proyecto es una clase de Starlette, cámbialo por add_middleware(ClaseMiddleware)
+# Middleware global de errores (clase ASGI: un http-middleware ocultaría la desconexión del cliente)
 try:
-    from src.api.middleware.error_handler import unhandled_exception_middleware
+    from src.api.middleware.error_handler import UnhandledExceptionMiddleware
     _HAS_ERR_MW = True
 except Exception:
-    unhandled_exception_middleware = None  # opcional
+    UnhandledExceptionMiddleware = None  # opcional
     _HAS_ERR_MW = False
 
 # --- App ---
@@ -42,17 +47,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Middleware global de errores/logs (si es un http-middleware function)
-if _HAS_ERR_MW and callable(unhandled_exception_middleware):
-    app.middleware("http")(unhandled_exception_middleware)
+# Middleware global de errores
+if _HAS_ERR_MW:
+    app.add_middleware(UnhandledExceptionMiddleware)
 
 # Warnings de configuración (no detienen arranque)
 for w in settings.sanity_warnings():
     logger.warning(w)
 
+# Precompila plantillas de prompts (falla de una plantilla no detiene arranque)
+get_prompt_registry(str(settings.prompts_dir))
+
+# Renueva el token compartido antes de que venza (fuera del camino crítico de los requests)
+start_credential_refresher()
+
+# Health checks caros (Docs/Vertex) en background; /health/ready y /health/sa leen el cache
+start_health_prober()
+
+# tracemalloc por etapa (MEMORY_TRACE); el presupuesto de memoria se aplica en el runner
+start_memory_tracing()
+
 # Routers
 app.include_router(health_router, tags=["health"])
 app.include_router(testimonios_router, tags=["testimonios"])
+app.include_router(jobs_router, tags=["jobs"])
+app.include_router(admin_router, tags=["admin"])
+
+# Al apagar: espera los efectos secundarios en background (callbacks a Sheets) antes de salir
+@app.on_event("shutdown")
+async def _drain_background_stages():
+    from src.orchestration.stages import adrain_background
+
+    await adrain_background()
 
 # Endpoint raíz simple (opcional)
 @app.get("/")
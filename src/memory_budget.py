@@ -0,0 +1,207 @@
+# src/memory_budget.py
+"""
+Memoria por request y presupuesto por instancia.
+
+- Presupuesto (MEMORY_BUDGET_MB): cada request reserva su huella estimada
+  (≈ MEMORY_COPIES_FACTOR × tamaño del transcript: raw_text, transcript, prompt, salida,
+  líneas y requests del render). Si no entra, espera hasta MEMORY_BUDGET_WAIT_S y luego
+  se rechaza con 503 (Retry-After) en vez de que el contenedor muera por OOM.
+  Un request que por sí solo excede el presupuesto se rechaza con 413.
+  Los PDFs reservan por el tamaño del archivo (estimate_pdf_bytes) mientras se cortan en /tmp.
+- Tracing (MEMORY_TRACE): tracemalloc con 1 frame; el grafo de etapas reporta por etapa
+  el delta de memoria trazada y el máximo visto (logs + métricas).
+- Spool: un raw_text grande se baja a disco mientras el request espera turno/etapas
+  y se vuelve a leer solo cuando hace falta.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException
+
+from src import metrics
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+_MB = 1024 * 1024
+
+
+# ---------------------------
+# Tracing
+# ---------------------------
+
+def start_memory_tracing() -> bool:
+    """Activa tracemalloc (1 frame: overhead bajo) si MEMORY_TRACE=true."""
+    if not get_settings().memory_trace:
+        return False
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(1)
+        logger.info("🧠 tracemalloc activo (memoria por etapa en logs/métricas).")
+    return True
+
+
+def traced_bytes() -> Optional[int]:
+    """Memoria trazada actual, o None si tracemalloc no está activo."""
+    if not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0]
+
+
+# ---------------------------
+# Presupuesto
+# ---------------------------
+
+def estimate_request_bytes(text_chars: int) -> int:
+    s = get_settings()
+    # UTF-8 ≈ 1–2 bytes/char en español; str de Python ≈ 1 byte/char (latin-1) a 4 (emoji)
+    return int(s.memory_base_request_mb * _MB + text_chars * 2 * s.memory_copies_factor)
+
+
+# PDF en /tmp + sus chunks en /tmp (en Cloud Run /tmp es RAM) + la página abierta en PyMuPDF
+_PDF_COPIES = 3
+
+
+def estimate_pdf_bytes(file_bytes: int) -> int:
+    """Huella de cortar un PDF de `file_bytes` (el `size` de Drive) antes de subir los chunks."""
+    return int(get_settings().memory_base_request_mb * _MB + file_bytes * _PDF_COPIES)
+
+
+class _Reservation:
+    def __init__(self, budget: "MemoryBudget", nbytes: int) -> None:
+        self._budget = budget
+        self.nbytes = nbytes
+
+    def grow_to(self, nbytes: int) -> None:
+        """
+        Sube la reserva a `nbytes` sin esperar turno: se usa cuando el dato ya está en memoria
+        (el transcript recién leído de Docs, cuyo largo no se conocía al reservar), para que
+        los requests siguientes lo vean. Nunca baja.
+        """
+        if self._budget.enabled and nbytes > self.nbytes:
+            self._budget._grow(nbytes - self.nbytes)
+            self.nbytes = nbytes
+
+    def release(self) -> None:
+        if self.nbytes:
+            self._budget._release(self.nbytes)
+            self.nbytes = 0
+
+    def __enter__(self) -> "_Reservation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes: int, wait_s: float) -> None:
+        self.limit = limit_bytes
+        self.wait_s = wait_s
+        self._reserved = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        metrics.register_gauge("memory.reserved_mb", lambda: self._reserved / _MB)
+        metrics.register_gauge("memory.waiting", lambda: self._waiting)
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def reserve(self, nbytes: int, *, label: str = "") -> _Reservation:
+        """Bloquea hasta que haya lugar (o lanza HTTPException 503/413)."""
+        if not self.enabled:
+            return _Reservation(self, 0)
+        if nbytes > self.limit:
+            metrics.incr("memory.rejected_too_large")
+            raise HTTPException(413, f"Request demasiado grande para esta instancia "
+                                     f"(~{nbytes / _MB:.0f} MB estimados, presupuesto {self.limit / _MB:.0f} MB).")
+        deadline = time.monotonic() + self.wait_s
+        with self._cond:
+            if self._reserved + nbytes > self.limit:
+                metrics.incr("memory.queued")
+                logger.info("🧠 Esperando memoria para %s (~%.1f MB; reservado %.1f/%.1f MB)",
+                            label or "request", nbytes / _MB, self._reserved / _MB, self.limit / _MB)
+            self._waiting += 1
+            try:
+                while self._reserved + nbytes > self.limit:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        metrics.incr("memory.rejected_busy")
+                        raise HTTPException(503, "Memoria de la instancia al límite; reintenta más tarde.",
+                                            headers={"Retry-After": str(max(1, int(self.wait_s)))})
+                    self._cond.wait(left)
+            finally:
+                self._waiting -= 1
+            self._reserved += nbytes
+        return _Reservation(self, nbytes)
+
+    async def areserve(self, nbytes: int, *, label: str = "") -> _Reservation:
+        if not self.enabled:
+            return _Reservation(self, 0)
+        # Camino rápido sin hilo; si hay que esperar, se espera fuera del event loop
+        with self._cond:
+            if nbytes <= self.limit and self._reserved + nbytes <= self.limit:
+                self._reserved += nbytes
+                return _Reservation(self, nbytes)
+        return await asyncio.to_thread(self.reserve, nbytes, label=label)
+
+    def _grow(self, nbytes: int) -> None:
+        with self._cond:
+            self._reserved += nbytes
+        metrics.incr("memory.grown_mb", nbytes / _MB)
+
+    def _release(self, nbytes: int) -> None:
+        with self._cond:
+            self._reserved -= nbytes
+            self._cond.notify_all()
+
+
+@lru_cache(maxsize=1)
+def get_memory_budget() -> MemoryBudget:
+    s = get_settings()
+    # El presupuesto es por instancia: con N workers HTTP cada proceso recibe 1/N
+    return MemoryBudget(int(s.memory_budget_mb * _MB / max(1, s.serve_workers)), s.memory_budget_wait_s)
+
+
+# ---------------------------
+# Spool de texto grande a disco
+# ---------------------------
+
+class SpooledText:
+    """Texto guardado en disco; `read()` lo recupera y `discard()` borra el archivo."""
+
+    def __init__(self, text: str) -> None:
+        spool_dir = get_settings().spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="raw-", suffix=".txt", dir=spool_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        self.chars = len(text)
+
+    def read(self) -> str:
+        with open(self.path, encoding="utf-8") as fh:
+            return fh.read()
+
+    def discard(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def maybe_spool(text: Optional[str]) -> Optional[SpooledText]:
+    """Spool a disco si el texto supera RAW_TEXT_SPOOL_KB (0 = nunca)."""
+    limit = get_settings().raw_text_spool_kb * 1024
+    if not text or limit <= 0 or len(text) < limit:
+        return None
+    metrics.incr("memory.spooled_raw_text")
+    return SpooledText(text)
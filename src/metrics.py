@@ -0,0 +1,116 @@
+# src/metrics.py
+"""
+Métricas en proceso (sin dependencias): gauges, contadores y latencias con p50/p95.
+
+- `observe("auth.refresh_latency_s", 0.21)`  → ventana de muestras + count/sum/max
+- `incr("auth.refresh_failures")`
+- `set_gauge("x", 1.0)` o `register_gauge("auth.token_age_s", fn)` (se evalúa al leer)
+- `snapshot()` → dict serializable (lo expone GET /health/metrics)
+
+Cada proceso (uvicorn worker o src.worker) tiene sus propias métricas.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+class _Series:
+    __slots__ = ("samples", "count", "total", "max", "last")
+
+    def __init__(self, window: int) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+        n = len(ordered)
+        return {
+            "count": self.count,
+            "last": round(self.last, 4),
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(ordered[n // 2], 4) if n else 0.0,
+            "p95": round(ordered[min(n - 1, int(n * 0.95))], 4) if n else 0.0,
+            "max": round(self.max, 4),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, window: int = 500) -> None:
+        self._window = window
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._gauge_fns: Dict[str, Callable[[], Optional[float]]] = {}
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = _Series(self._window)
+            series.add(float(value))
+
+    def incr(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0.0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = float(value)
+
+    def register_gauge(self, name: str, fn: Callable[[], Optional[float]]) -> None:
+        with self._lock:
+            self._gauge_fns[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            series = {k: s.summary() for k, s in self._series.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            gauge_fns = dict(self._gauge_fns)
+        for name, fn in gauge_fns.items():
+            try:
+                value = fn()
+            except Exception:
+                value = None
+            if value is not None:
+                gauges[name] = round(float(value), 4)
+        return {"gauges": gauges, "counters": counters, "latencies": series}
+
+
+@lru_cache(maxsize=1)
+def get_metrics() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+def observe(name: str, value: float) -> None:
+    get_metrics().observe(name, value)
+
+
+def incr(name: str, value: float = 1.0) -> None:
+    get_metrics().incr(name, value)
+
+
+def set_gauge(name: str, value: float) -> None:
+    get_metrics().set_gauge(name, value)
+
+
+def register_gauge(name: str, fn: Callable[[], Optional[float]]) -> None:
+    get_metrics().register_gauge(name, fn)
+
+
+def snapshot() -> Dict[str, Any]:
+    return get_metrics().snapshot()
@@ -0,0 +1,267 @@
+# src/orchestration/job_queue.py
+"""
+Cola durable de jobs de testimonios (SQLite, archivo local) con semántica de lease.
+
+- enqueue(): la capa HTTP solo inserta el job y responde.
+- lease(): un worker toma el siguiente job disponible por `lease_s` segundos.
+- heartbeat(): el worker extiende su lease mientras procesa.
+- Si el worker muere, el lease expira y el job vuelve a estar disponible
+  (cuenta como un intento más).
+- Orden de lease (ver src/orchestration/scheduler.py): no FIFO puro. Cada clase por debajo de
+  interactive cuenta como llegada SCHED_QUEUE_AGING_S más tarde y cada job en curso del mismo
+  tenant suma SCHED_TENANT_PENALTY_S: un backfill de 300 filas no bloquea a los demás, pero
+  tampoco queda sin turno para siempre.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+from src.logging_conf import get_logger
+from src.orchestration.scheduler import PRIORITY_CLASSES
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT PRIMARY KEY,
+    kind             TEXT NOT NULL DEFAULT 'testimony',
+    priority         TEXT NOT NULL DEFAULT 'webhook',
+    tenant           TEXT NOT NULL DEFAULT '',
+    payload          TEXT NOT NULL,
+    status           TEXT NOT NULL,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    max_attempts     INTEGER NOT NULL,
+    lease_owner      TEXT,
+    lease_expires_at REAL,
+    available_at     REAL NOT NULL,
+    created_at       REAL NOT NULL,
+    updated_at       REAL NOT NULL,
+    result           TEXT,
+    error            TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at, created_at);
+"""
+
+# Columnas agregadas después de la primera versión (colas ya existentes en disco)
+_MIGRATIONS = {
+    "priority": "ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'webhook'",
+    "tenant": "ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT ''",
+}
+_INDEXES = "CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs (status, tenant);"
+
+# Llegada "efectiva" para el orden de lease (parámetros: aging por clase, penalidad por job del tenant en curso)
+_EFFECTIVE_AT = (
+    "available_at"
+    " + ? * (CASE priority " + " ".join(f"WHEN '{c}' THEN {i}" for i, c in enumerate(PRIORITY_CLASSES))
+    + f" ELSE {len(PRIORITY_CLASSES) - 1} END)"
+    " + ? * (SELECT COUNT(*) FROM jobs AS running WHERE running.status = 'leased' AND running.tenant = jobs.tenant)"
+)
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    priority: str = "webhook"
+    tenant: str = ""
+
+    @classmethod
+    def _from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            lease_owner=row["lease_owner"],
+            lease_expires_at=row["lease_expires_at"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            priority=row["priority"],
+            tenant=row["tenant"],
+        )
+
+    def public(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Una conexión por operación: seguro entre hilos (heartbeat) y procesos (workers).
+    WAL permite lectores concurrentes mientras un worker toma un lease.
+    """
+
+    def __init__(self, path: str, *, max_attempts: int = 3,
+                 aging_s: float = 600.0, tenant_penalty_s: float = 60.0) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        self.aging_s = aging_s
+        self.tenant_penalty_s = tenant_penalty_s
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            for column, ddl in _MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(ddl)
+            conn.executescript(_INDEXES)
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=30000")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---------- Productor ----------
+
+    def enqueue(self, payload: Dict[str, Any], *, job_id: Optional[str] = None,
+                kind: str = "testimony", delay_s: float = 0.0,
+                priority: str = "webhook", tenant: str = "") -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, priority, tenant, payload, status, max_attempts,"
+                " available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, priority, tenant, json.dumps(payload, ensure_ascii=False, default=str), QUEUED,
+                 self.max_attempts, now + delay_s, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job._from_row(row) if row else None
+
+    # ---------- Consumidor ----------
+
+    def lease(self, worker_id: str, lease_s: float) -> Optional[Job]:
+        """Toma el siguiente job disponible (o con lease vencido) por llegada efectiva. Atómico entre procesos."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs"
+                    " WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?)"
+                    f" ORDER BY {_EFFECTIVE_AT}, created_at LIMIT 1",
+                    (QUEUED, now, LEASED, now, self.aging_s, self.tenant_penalty_s),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["status"] == LEASED:
+                    logger.warning("♻️ Lease vencido de %s (job %s); se re-encola.", row["lease_owner"], row["id"])
+                if row["attempts"] >= row["max_attempts"]:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, lease_owner = NULL, error = COALESCE(error, ?), updated_at = ?"
+                        " WHERE id = ?",
+                        (FAILED, "Lease vencido en el último intento.", now, row["id"]),
+                    )
+                    conn.execute("COMMIT")
+                    return self.lease(worker_id, lease_s)
+                conn.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?,"
+                    " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (LEASED, worker_id, now + lease_s, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = self.get(row["id"])
+        return job
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_s: float) -> bool:
+        """Extiende el lease. False si el lease ya no es de este worker (lo tomó otro)."""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + lease_s, now, job_id, LEASED, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, updated_at = ?"
+                " WHERE id = ? AND lease_owner = ?",
+                (DONE, json.dumps(result, ensure_ascii=False, default=str), now, job_id, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str, *, retry: bool = True,
+             retry_delay_s: float = 30.0) -> Optional[str]:
+        """
+        Re-encola (con backoff) si quedan intentos y `retry`; si no, marca failed.
+        Devuelve el estado aplicado, o None si el lease ya no era de este worker (no cambia nada).
+        """
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            final = (not retry) or row is None or row["attempts"] >= row["max_attempts"]
+            status = FAILED if final else QUEUED
+            delay = retry_delay_s * (2 ** max(0, (row["attempts"] if row else 1) - 1))
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL,"
+                " available_at = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (status, error[:2000], now + delay, now, job_id, worker_id),
+            )
+        return status if cur.rowcount == 1 else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Conteo por estado + `by_priority`: {clase: {estado: n}}."""
+        with self._conn() as conn:
+            rows = conn.execute("SELECT priority, status, COUNT(*) AS n FROM jobs GROUP BY priority, status").fetchall()
+        out: Dict[str, Any] = {}
+        by_priority: Dict[str, Dict[str, int]] = {}
+        for r in rows:
+            out[r["status"]] = out.get(r["status"], 0) + r["n"]
+            by_priority.setdefault(r["priority"], {})[r["status"]] = r["n"]
+        out["by_priority"] = by_priority
+        return out
+
+
+@lru_cache(maxsize=4)
+def get_job_queue(path: Optional[str] = None) -> JobQueue:
+    s = get_settings()
+    return JobQueue(path or s.job_queue_path, max_attempts=s.job_max_attempts,
+                    aging_s=s.sched_queue_aging_s, tenant_penalty_s=s.sched_tenant_penalty_s)
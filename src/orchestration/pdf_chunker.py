@@ -0,0 +1,172 @@
+# src/orchestration/pdf_chunker.py
+"""
+Etapa PDF → chunks en GCS para `generate_text_from_files_map_reduce`.
+
+- Plan de cortes por rango de páginas (`pages_per_chunk`) o por presupuesto de tamaño
+  (`max_chunk_mb`, estimado por bytes/página y verificado al guardar).
+- El corte (PyMuPDF) corre en un pool de procesos: es CPU (re-serializar páginas)
+  y no debe competir con el event loop ni con el GIL.
+- Los chunks se suben a GCS en paralelo (hilos: I/O).
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+PageRange = Tuple[int, int]  # (primera, última) — 0-based, inclusiva
+
+
+@dataclass
+class PdfChunk:
+    start_page: int  # 1-based, para logs/prompts
+    end_page: int
+    path: str
+    bytes: int
+    gcs_uri: Optional[str] = None
+
+
+# ---------------------------
+# Plan de cortes
+# ---------------------------
+
+def plan_page_ranges(page_count: int, *, pages_per_chunk: Optional[int] = None,
+                     file_bytes: Optional[int] = None, max_chunk_bytes: Optional[int] = None) -> List[PageRange]:
+    """Rangos de páginas contiguos. Con presupuesto de tamaño, estima por bytes/página promedio."""
+    if page_count <= 0:
+        return []
+    per = pages_per_chunk or 0
+    if max_chunk_bytes and file_bytes:
+        avg = max(1, file_bytes // page_count)
+        by_size = max(1, max_chunk_bytes // avg)
+        per = min(per, by_size) if per else by_size
+    per = per or page_count
+    return [(s, min(s + per, page_count) - 1) for s in range(0, page_count, per)]
+
+
+# ---------------------------
+# Corte (corre en procesos hijos)
+# ---------------------------
+
+def _split_range(pdf_path: str, first: int, last: int, out_dir: str, max_bytes: int) -> List[Tuple[int, int, str, int]]:
+    """
+    Guarda las páginas [first, last] como un PDF nuevo. Si el resultado excede `max_bytes`
+    y tiene más de una página, se parte en dos (la estimación por promedio falló).
+    """
+    import fitz  # PyMuPDF: import en el hijo
+
+    out: List[Tuple[int, int, str, int]] = []
+    stack = [(first, last)]
+    with fitz.open(pdf_path) as src:
+        while stack:
+            a, b = stack.pop()
+            part = fitz.open()
+            try:
+                part.insert_pdf(src, from_page=a, to_page=b)
+                # Metadatos del original y sin /ID nuevo: mismo PDF → mismos bytes → mismo objeto en GCS (CAS)
+                part.set_metadata(src.metadata or {})
+                data = part.tobytes(garbage=3, deflate=True, no_new_id=True)
+            finally:
+                part.close()
+            if max_bytes and len(data) > max_bytes and b > a:
+                mid = (a + b) // 2
+                stack.extend([(mid + 1, b), (a, mid)])  # LIFO: se procesa (a, mid) primero
+                continue
+            path = os.path.join(out_dir, f"chunk_{a + 1:05d}-{b + 1:05d}.pdf")
+            with open(path, "wb") as fh:
+                fh.write(data)
+            out.append((a, b, path, len(data)))
+    return out
+
+
+@lru_cache(maxsize=1)
+def _get_process_pool() -> ProcessPoolExecutor:
+    workers = get_settings().pdf_split_processes or (os.cpu_count() or 1)
+    # spawn: el proceso padre tiene hilos (logging, refresh de token) y clientes gRPC
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+
+
+def _run_split(pdf_path: str, ranges: List[PageRange], out_dir: str, max_bytes: int) -> List[Tuple[int, int, str, int]]:
+    pool = _get_process_pool()
+    futures: List[Future] = [pool.submit(_split_range, pdf_path, a, b, out_dir, max_bytes) for a, b in ranges]
+    return [part for fut in futures for part in fut.result()]
+
+
+def split_pdf(pdf_path: str, out_dir: str, *, pages_per_chunk: Optional[int] = None,
+              max_chunk_mb: Optional[float] = None) -> List[PdfChunk]:
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    max_bytes = int((max_chunk_mb or 0) * 1024 * 1024)
+    ranges = plan_page_ranges(
+        page_count, pages_per_chunk=pages_per_chunk,
+        file_bytes=os.path.getsize(pdf_path), max_chunk_bytes=max_bytes or None,
+    )
+    if len(ranges) == 1 and not max_bytes:
+        # Un solo chunk: el PDF original sirve tal cual
+        return [PdfChunk(1, page_count, pdf_path, os.path.getsize(pdf_path))]
+
+    t0 = time.perf_counter()
+    try:
+        parts = _run_split(pdf_path, ranges, out_dir, max_bytes)
+    except BrokenProcessPool:
+        # Un hijo murió (OOM, señal): el pool queda inservible → uno nuevo y un reintento
+        logger.warning("♻️ Pool de corte PDF roto; recreando.")
+        _get_process_pool.cache_clear()
+        parts = _run_split(pdf_path, ranges, out_dir, max_bytes)
+    chunks = [PdfChunk(a + 1, b + 1, path, size) for a, b, path, size in parts]
+    logger.info("✂️ PDF de %s páginas → %s chunks en %.2fs", page_count, len(chunks), time.perf_counter() - t0)
+    return chunks
+
+
+# ---------------------------
+# Subida en paralelo
+# ---------------------------
+
+def upload_chunks(chunks: List[PdfChunk], bucket_name: str, *, max_workers: Optional[int] = None) -> List[PdfChunk]:
+    """Sube en paralelo; nombres por contenido (CAS): un chunk ya subido por otro caso no se re-sube."""
+    from src.clients.gcs_client import upload_file
+
+    workers = max_workers or get_settings().transfer_concurrency
+    t0 = time.perf_counter()
+
+    def _up(c: PdfChunk) -> None:
+        c.gcs_uri = upload_file(bucket_name, c.path, content_type="application/pdf")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="chunk-upload") as pool:
+        list(pool.map(_up, chunks))
+
+    total = sum(c.bytes for c in chunks)
+    elapsed = time.perf_counter() - t0
+    logger.info("☁️ %s chunks en GCS (%.1f MB) en %.2fs", len(chunks), total / 1e6, elapsed)
+    return chunks
+
+
+def chunk_drive_pdf_to_gcs(file_id: str, bucket_name: str, *,
+                           pages_per_chunk: Optional[int] = None,
+                           max_chunk_mb: Optional[float] = None) -> List[PdfChunk]:
+    """
+    Drive PDF → archivo temporal (streaming) → chunks (pool de procesos) → GCS (en paralelo).
+    Devuelve los chunks en orden de páginas, con `gcs_uri`.
+    """
+    from src.clients.drive_client import download_file_to
+
+    with tempfile.TemporaryDirectory(prefix="pdfchunks-") as tmp:
+        src_path = os.path.join(tmp, "source.pdf")
+        with open(src_path, "wb") as fh:
+            size = download_file_to(file_id, fh)
+        logger.info("📥 PDF %s descargado (%.1f MB)", file_id, size / 1e6)
+        chunks = split_pdf(src_path, tmp, pages_per_chunk=pages_per_chunk, max_chunk_mb=max_chunk_mb)
+        return upload_chunks(chunks, bucket_name)
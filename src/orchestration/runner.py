@@ -1,22 +1,54 @@
 # src/orchestration/runner.py
 from __future__ import annotations
 
+import asyncio
 import json
 import re
-from typing import Any, Dict
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from fastapi import HTTPException
+from googleapiclient.errors import HttpError
 
 from src.logging_conf import get_logger
 from src.settings import get_settings
 # Importamos los nuevos esquemas
-from src.domain.schemas import TestimonyRequest, TestimonyResponse, TranscriptionWebhookRequest
-from src.clients.drive_client import assert_sa_has_access
-from src.clients.gdocs_client import get_document_content, write_markdown_to_document
-from src.clients.vertex_client import generate_text
-from src.clients.sheets_client import update_row_status
-from src.auth import build_drive_client
+from src.domain.schemas import (
+    PdfTestimonyRequest,
+    TestimonyRequest,
+    TestimonyOutput,
+    TestimonyOutputResult,
+    TestimonyResponse,
+    TranscriptCompaction,
+    TranscriptionWebhookRequest,
+)
+from src.clients.drive_client import batch_get_files, parse_drive_url_to_id
+from src.clients.gdocs_client import (
+    aget_document_content,
+    awrite_markdown_to_document,
+    get_document_content,
+    is_revision_conflict,
+    load_write_checkpoint,
+    write_markdown_to_document,
+)
+from src.clients.google_async import get_async_google_client
+from src.clients.vertex_client import (
+    agenerate_text_result,
+    generate_text_from_files_map_reduce,
+    generate_text_result,
+)
+from src.clients.llm_router import LLMResult
+from src.clients.sheet_row_index import resolve_callback_row
+from src.clients.sheets_client import write_cells
 from src.domain.prompt_loader import render_testimony_prompt
+from src.domain.transcript_compaction import compact_transcript
+from src.memory_budget import estimate_pdf_bytes, estimate_request_bytes, get_memory_budget, maybe_spool
+from src.orchestration.scheduler import get_rate_limiter, get_scheduler, normalize_priority, tenant_of
+from src.orchestration.stages import StageGraph
+from src.shared_cache import cache_key, get_shared_cache
 
 
 logger = get_logger(__name__)
@@ -32,116 +64,668 @@ def _resolve_language(req: TestimonyRequest) -> str:
     if req.language: return (req.language or "").lower()
     return (req.extra or {}).get("language", settings.default_language or "es").lower()
 
+def _google_status(e: Exception) -> Optional[int]:
+    if isinstance(e, HttpError):
+        return getattr(e, "status_code", None) or getattr(e.resp, "status", None)
+    return None
+
 def _map_google_http_error(e: Exception, *, op: str, file_id: str) -> HTTPException:
-    return HTTPException(status_code=403, detail=f"{op} falló para {file_id}: {e}")
+    """
+    Conserva el status de Google: 403/404 (sin acceso, no existe) no se reintentan; 408/429/5xx
+    sí (ver worker._is_permanent). El conflicto de revisión (Doc editado mientras se escribía)
+    sale como 409 y un error sin status (red, timeout) como 502.
+    Se lanza con `raise ... from e`: el worker también mira la causa.
+    """
+    status = _google_status(e)
+    if is_revision_conflict(e):
+        status = 409
+    return HTTPException(status_code=status or 502, detail=f"{op} falló para {file_id}: {e}")
 
 def _fallback_prompt(transcript: str, req: TestimonyRequest, language: str) -> str:
     # ... (Tu código de fallback prompt se mantiene igual) ...
     return f"FALLBACK PROMPT {language}..." # Resumido para brevedad
 
+def _source_doc_id(req: TestimonyRequest) -> Optional[str]:
+    """Doc fuente a leer, o None si viene raw_text."""
+    if req.raw_text:
+        return None
+    if req.transcription_doc_id:
+        return req.transcription_doc_id.strip()
+    if req.transcription_link:
+        return _extract_doc_id_from_url(str(req.transcription_link))
+    raise HTTPException(422, "Falta fuente.")
+
+def _default_link(doc_id: str) -> str:
+    return f"https://docs.google.com/document/d/{doc_id}/edit"
+
+def _render_prompt(req: TestimonyRequest, language: str, transcript: str) -> str:
+    if not transcript or len(transcript.strip()) < 20:
+        raise HTTPException(422, "Transcript vacío.")
+    try:
+        return render_testimony_prompt(language=language, templates_dir=settings.prompts_dir, transcript=transcript, req=req)
+    except Exception:
+        return _fallback_prompt(transcript=transcript, req=req, language=language)
+
+def _compact(transcript: str, level: str, reports: List[TranscriptCompaction]) -> str:
+    """Etapa compact: el texto sigue por el grafo (transient); el reporte va a la respuesta."""
+    text, report = compact_transcript(transcript, level)
+    if report is not None:
+        reports.append(report)
+    return text
+
+def _read_transcript(src_doc: str) -> str:
+    try:
+        return get_shared_cache().get_or_compute("transcript", src_doc, lambda: get_document_content(src_doc),
+                                                 ttl_s=settings.transcript_cache_ttl_s)
+    except Exception as e:
+        raise _map_google_http_error(e, op="Leer fuente", file_id=src_doc) from e
+
+def _callback_writes(req: TestimonyRequest | PdfTestimonyRequest, links: List[Tuple[Optional[str], str]],
+                     row: int) -> List[Tuple[str, str, str]]:
+    """
+    Celdas del callback a Sheets: [(spreadsheet_id, rango A1, valor)].
+    `links` = [(columna propia | None, link)]: los que no traen columna van juntos (uno por línea)
+    a testimony_doc_col.
+    """
+    cb = req.sheet_callback
+    writes: List[Tuple[str, str, str]] = []
+    if not cb:
+        return writes
+    shared = "\n".join(link for col, link in links if not col)
+    if cb.testimony_doc_col and shared:
+        writes.append((cb.spreadsheet_id, f"{cb.sheet_name}!{cb.testimony_doc_col}{row}", shared))
+    for col, link in links:
+        if col:
+            writes.append((cb.spreadsheet_id, f"{cb.sheet_name}!{col}{row}", link))
+    if cb.status_col:
+        writes.append((cb.spreadsheet_id, f"{cb.sheet_name}!{cb.status_col}{row}", "✅ Testimonio Listo"))
+    return writes
+
+def _build_response(req: TestimonyRequest | PdfTestimonyRequest, target_doc_id: str, output_link: str, model: str, language: str,
+                    compaction: Optional[TranscriptCompaction] = None,
+                    outputs: Optional[List[TestimonyOutputResult]] = None) -> Dict[str, Any]:
+    return TestimonyResponse(
+        status="success",
+        message="Testimonio generado correctamente.",
+        doc_id=target_doc_id,
+        output_doc_link=output_link,
+        model=model,
+        language=language,
+        case_id=req.case_id,
+        request_id=req.request_id,
+        compaction=compaction,
+        outputs=outputs,
+    ).model_dump()
+
 # ---------------------------
 # Caso de uso principal
 # ---------------------------
 
-def run_testimony(req: TestimonyRequest) -> Dict[str, Any]:
+def _target_doc_id(req: TestimonyRequest | PdfTestimonyRequest) -> str:
+    target_doc_id = (req.output_doc_id or "").strip()
+    if not target_doc_id:
+        raise HTTPException(422, "Falta 'output_doc_id'.")
+    return target_doc_id
+
+def _log_callback(req: TestimonyRequest | PdfTestimonyRequest, row: int) -> None:
+    cb = req.sheet_callback
+    logger.info("📊 Actualizando Sheet: %s (Fila %s%s)", cb.spreadsheet_id, row,
+                "" if cb.row_index is not None else f", buscada por {cb.key_col}")
+
+def _spool_and_estimate(req: TestimonyRequest):
+    """
+    raw_text grande → disco: el runner sigue con una copia del request sin el texto (la etapa
+    source lo relee). El request del caller no se toca: puede reintentar con el mismo objeto.
+    Devuelve (request a usar, SpooledText | None, huella estimada en bytes para el presupuesto
+    de memoria). Con la fuente en Docs la huella es la base; la etapa source la sube al conocer
+    el largo del transcript (_Reservation.grow_to).
+    """
+    spooled = maybe_spool(req.raw_text)
+    chars = len(req.raw_text or "")
+    if spooled is not None:
+        req = req.model_copy(update={"raw_text": None})
+        logger.info("💾 raw_text de %s chars enviado a disco (%s).", chars, spooled.path)
+    return req, spooled, estimate_request_bytes(chars)
+
+# ---------------------------
+# Idempotencia y cache compartido entre procesos (src/shared_cache.py)
+# ---------------------------
+
+def _fingerprint(req: TestimonyRequest | PdfTestimonyRequest) -> str:
+    # Prioridad y deadline los puede fijar el endpoint/reintento: el mismo request por otra vía no es "otro payload"
+    return cache_key(type(req).__name__, req.model_dump_json(exclude={"request_id", "priority", "timeout_s"}))
+
+def _replayed(req: TestimonyRequest | PdfTestimonyRequest, fingerprint: str, stored: Dict[str, Any], computed: bool) -> Dict[str, Any]:
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(409, f"request_id {req.request_id} ya se usó con otro payload.")
+    if not computed:
+        logger.info("♻️ request_id ya procesado: se devuelve la respuesta guardada.",
+                    extra={"case_id": req.case_id, "request_id": req.request_id})
+    return stored["response"]
+
+def _idempotent(req: TestimonyRequest | PdfTestimonyRequest, run) -> Dict[str, Any]:
+    """
+    Con `request_id`, un reintento (o el mismo request en otro worker) devuelve la respuesta
+    ya generada en vez de volver a generar y escribir. Solo se guardan respuestas exitosas.
+    """
+    if not req.request_id:
+        return run()
+    fingerprint = _fingerprint(req)
+    computed = []
+
+    def _run() -> Dict[str, Any]:
+        computed.append(True)
+        return {"fingerprint": fingerprint, "response": run()}
+
+    stored = get_shared_cache().get_or_compute("idempotency", req.request_id, _run, ttl_s=settings.idempotency_ttl_s)
+    return _replayed(req, fingerprint, stored, bool(computed))
+
+# ---------------------------
+# Escritura reanudable (ver _WriteCheckpoint en src/clients/gdocs_client.py)
+# ---------------------------
+
+def _write_checkpoint_key(req: TestimonyRequest, target_doc_id: str) -> str:
+    # Mismo payload (con o sin request_id) → mismo checkpoint: el reintento del caller lo encuentra
+    return cache_key("write", target_doc_id, _fingerprint(req))
+
+def _llm_meta(result: LLMResult) -> Dict[str, Any]:
+    return {k: v for k, v in asdict(result).items() if k != "text"}
+
+def _pending_write(checkpoint: str) -> Optional[LLMResult]:
+    """Escritura cortada de este mismo request: el texto sale del checkpoint, sin volver al LLM."""
+    state = load_write_checkpoint(checkpoint)
+    if not state or not state.get("meta"):
+        return None
+    logger.info("⏯️ Escritura pendiente (%s lotes aplicados): se reutiliza el texto ya generado.", state.get("applied", 0))
+    return LLMResult(text=state["text"], **state["meta"])
+
+# ---------------------------
+# Varias salidas del mismo transcript (TestimonyRequest.outputs)
+# ---------------------------
+
+@dataclass
+class _Output:
+    """Una salida del request: su copia del request (destino, idioma, context, write_mode) y su checkpoint."""
+    req: TestimonyRequest
+    target_doc_id: str
+    language: str
+    checkpoint: str
+    suffix: str = ""  # etapas "llm", "write"… para la principal; "llm.1", "write.1"… para las demás
+    doc_col: Optional[str] = None
+    generated: Optional[LLMResult] = None
+
+    def stage(self, name: str) -> str:
+        return name + self.suffix
+
+def _variant(req: TestimonyRequest, out: Optional[TestimonyOutput]) -> TestimonyRequest:
+    update: Dict[str, Any] = {"outputs": None}
+    if out is not None:
+        update.update(output_doc_id=out.output_doc_id, context=out.context or req.context,
+                      language=out.language or req.language, write_mode=out.write_mode or req.write_mode)
+    return req.model_copy(update=update)
+
+def _outputs(req: TestimonyRequest) -> List[_Output]:
+    """
+    La salida principal (el request tal cual) + una por cada `outputs`. La misma salida pedida
+    sola o dentro de otro request tiene el mismo checkpoint de escritura.
+    """
+    outs: List[_Output] = []
+    for i, out in enumerate([None, *(req.outputs or [])]):
+        variant = _variant(req, out)
+        target_doc_id = _target_doc_id(variant)
+        outs.append(_Output(
+            req=variant, target_doc_id=target_doc_id, language=_resolve_language(variant),
+            checkpoint=_write_checkpoint_key(variant, target_doc_id), suffix=f".{i}" if i else "",
+            doc_col=out.testimony_doc_col if out is not None else None,
+        ))
+    return outs
+
+def _pending_writes(outs: List[_Output]) -> None:
+    for o in outs:
+        o.generated = _pending_write(o.checkpoint)
+
+def _output_links(outs: List[_Output], results: Dict[str, Any]) -> List[Tuple[Optional[str], str]]:
+    return [(o.doc_col, results[o.stage("access")]) for o in outs]
+
+def _output_results(outs: List[_Output], results: Dict[str, Any]) -> Optional[List[TestimonyOutputResult]]:
+    if len(outs) == 1:
+        return None
+    return [TestimonyOutputResult(doc_id=o.target_doc_id, output_doc_link=results[o.stage("access")],
+                                  model=results[o.stage("llm")].model, language=o.language, context=o.req.context)
+            for o in outs]
+
+async def _aidempotent(req: TestimonyRequest, run) -> Dict[str, Any]:
+    if not req.request_id:
+        return await run()
+    fingerprint = _fingerprint(req)
+    computed = []
+
+    async def _run() -> Dict[str, Any]:
+        computed.append(True)
+        return {"fingerprint": fingerprint, "response": await run()}
+
+    stored = await get_shared_cache().aget_or_compute("idempotency", req.request_id, _run, ttl_s=settings.idempotency_ttl_s)
+    return _replayed(req, fingerprint, stored, bool(computed))
+
+def run_testimony(req: TestimonyRequest, *,
+                  generated: Optional[Union[LLMResult, List[LLMResult]]] = None) -> Dict[str, Any]:
     """
     Ejecuta el flujo de generación de testimonio y escribe SIEMPRE en el Doc output_doc_id.
+
+    Grafo de etapas (ver src/orchestration/stages.py):
+        access ───────────────────────────────────┐
+        source → compact → prompt → llm ──────────┴→ write ⇢ callback (background)
+
+    Con `request_id` es idempotente (ver _idempotent); transcript, link del destino y
+    respuesta del LLM salen del cache compartido entre procesos si están frescos.
+    El grafo arranca cuando el scheduler le da turno (clase `priority`, reparto por tenant);
+    las llamadas al modelo y cada batchUpdate a Docs esperan cuota (VERTEX_RPM / DOCS_WRITE_RPM) con esa clase.
+    `compact` limpia el ruido de ASR del transcript según `compaction` / TRANSCRIPT_COMPACTION
+    (src/domain/transcript_compaction.py); con "off" lo deja pasar intacto.
+
+    Con `outputs` (otro idioma / context, cada uno con su output_doc_id) el transcript se lee
+    y compacta una sola vez; cada salida tiene sus etapas access/prompt/llm/write ("llm.1"…),
+    que corren en paralelo, y el callback espera todas las escrituras (una sola escritura a Sheets).
+
+    Con `generated` (texto ya generado offline, ver build_testimony_prompts: una lista en el orden
+    de las salidas, o un solo resultado para la principal) el grafo se reduce a
+    access → write ⇢ callback para esas salidas. Lo mismo si un intento anterior de este request dejó la
+    escritura a medias: el texto sale del checkpoint y la escritura sigue desde el último lote
+    aplicado (WRITE_CHECKPOINT_TTL_S).
     """
-    logger.info("🚀 run_testimony", extra={"case_id": req.case_id, "context": req.context})
+    return _idempotent(req, lambda: _run_testimony(req, generated))
 
-    # 1. Validaciones y Accesos (Sin cambios)
-    target_doc_id = (req.output_doc_id or "").strip()
-    if not target_doc_id:
-        raise HTTPException(422, "Falta 'output_doc_id'.")
-    
-    try:
-        assert_sa_has_access(target_doc_id, use_docs_api=True)
-    except Exception as e:
-        raise _map_google_http_error(e, op="Validar acceso destino", file_id=target_doc_id)
 
-    # 2. Obtener Fuente (Sin cambios)
-    language = _resolve_language(req)
-    if req.raw_text:
-        transcript = req.raw_text
-    elif req.transcription_doc_id:
-        src_doc = req.transcription_doc_id.strip()
-        try:
-            transcript = get_document_content(src_doc)
-        except Exception as e:
-            raise _map_google_http_error(e, op="Leer fuente", file_id=src_doc)
-    elif req.transcription_link:
-        src_doc = _extract_doc_id_from_url(str(req.transcription_link))
-        try:
-            transcript = get_document_content(src_doc)
-        except Exception as e:
-            raise _map_google_http_error(e, op="Leer fuente", file_id=src_doc)
-    else:
-        raise HTTPException(422, "Falta fuente.")
+def build_testimony_prompts(req: TestimonyRequest) -> List[str]:
+    """
+    source → compact → prompt de cada salida (la principal primero, luego `outputs`), sin generar
+    ni escribir: la generación offline (src/clients/vertex_batch.py) junta los prompts de muchas
+    filas en un solo job y luego escribe los resultados con run_testimony(req, generated=[...]).
+    El transcript se lee y compacta una sola vez.
+    """
+    src_doc = _source_doc_id(req)
+    transcript = _read_transcript(src_doc) if src_doc else req.raw_text
+    text, _ = compact_transcript(transcript, req.compaction or settings.transcript_compaction)
+    return [_render_prompt(o.req, o.language, text) for o in _outputs(req)]
 
-    if not transcript or len(transcript.strip()) < 20:
-        raise HTTPException(422, "Transcript vacío.")
 
-    # 3. Prompt + LLM (Sin cambios)
+# ---------------------------
+# Corrida de un testimonio: estado, etapas y grafo comunes a _run_testimony / _arun_testimony
+# (las dos variantes solo difieren en el I/O de cada etapa)
+# ---------------------------
+
+@dataclass
+class _TestimonyRun:
+    req: TestimonyRequest
+    outs: List[_Output]
+    src_doc: Optional[str]
+    priority: str
+    compaction: str
+    spooled: Optional[Any]
+    footprint: int
+    compacted: List[TranscriptCompaction] = field(default_factory=list)
+    reservation: Optional[Any] = None
+
+    def sourced(self, transcript: str) -> str:
+        """Transcript leído de Docs: la reserva de memoria sube a su largo real."""
+        self.reservation.grow_to(estimate_request_bytes(len(transcript)))
+        return transcript
+
+    def prompt(self, o: _Output, r: Dict[str, Any]) -> str:
+        return _render_prompt(o.req, o.language, r["compact"])
+
+    def write_kwargs(self, o: _Output, result: LLMResult) -> Dict[str, Any]:
+        return dict(mode=o.req.write_mode or settings.docs_write_mode, checkpoint=o.checkpoint,
+                    checkpoint_meta=_llm_meta(result), priority=self.priority)
+
+    def written(self, o: _Output) -> None:
+        logger.info("✅ Testimonio generado", extra={"case_id": self.req.case_id, "doc_id": o.target_doc_id})
+
+    def callback_writes(self, r: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        # URLs de todas las salidas + Status Final en una sola escritura
+        row = resolve_callback_row(self.req.sheet_callback, self.req.case_id)
+        writes = _callback_writes(self.req, _output_links(self.outs, r), row)
+        if writes:
+            _log_callback(self.req, row)
+        return writes
+
+    def response(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        outs = self.outs
+        return _build_response(self.req, outs[0].target_doc_id, results["access"], results["llm"].model,
+                               outs[0].language, self.compacted[0] if self.compacted else None,
+                               _output_results(outs, results))
+
+
+def _prepare_run(req: TestimonyRequest,
+                 generated: Optional[Union[LLMResult, List[LLMResult]]] = None) -> _TestimonyRun:
+    """Salidas, escrituras pendientes y spool del raw_text (lee el cache y escribe a disco: en async, en un hilo)."""
+    outs = _outputs(req)
+    src_doc = _source_doc_id(req)
+    _pending_writes(outs)
+    if generated is not None:
+        for o, result in zip(outs, generated if isinstance(generated, list) else [generated]):
+            o.generated = result
+    req, spooled, footprint = _spool_and_estimate(req)
+    if spooled is not None:
+        for o in outs:
+            o.req.raw_text = None
+    return _TestimonyRun(req=req, outs=outs, src_doc=src_doc, priority=normalize_priority(req.priority),
+                         compaction=req.compaction or settings.transcript_compaction,
+                         spooled=spooled, footprint=footprint)
+
+
+@contextmanager
+def _google_errors(op: str, file_id: str) -> Iterator[None]:
     try:
-        prompt = render_testimony_prompt(language=language, templates_dir=settings.prompts_dir, transcript=transcript, req=req)
-    except Exception:
-        prompt = _fallback_prompt(transcript=transcript, req=req, language=language)
+        yield
+    except Exception as e:
+        raise _map_google_http_error(e, op=op, file_id=file_id) from e
+
 
+@contextmanager
+def _llm_errors() -> Iterator[None]:
     try:
-        output_text = generate_text(prompt)
+        yield
     except Exception:
         raise HTTPException(500, "Error al generar texto con el modelo.")
 
-    # 4. Escribir en Doc (Sin cambios)
-    try:
-        write_markdown_to_document(target_doc_id, output_text)
-    except Exception as e:
-        raise _map_google_http_error(e, op="Escribir salida", file_id=target_doc_id)
 
-    # 5. Obtener link (Sin cambios)
+def _testimony_graph(name: str, run: _TestimonyRun, *, access: Callable, source: Callable, compact: Callable,
+                     prompt: Callable, llm: Callable, resumed: Callable, write: Callable,
+                     callback: Callable) -> StageGraph:
+    """
+    El grafo de run_testimony. Las etapas por salida (access, prompt, llm, resumed, write) reciben
+    la salida como primer argumento; en arun_testimony todas son corutinas.
+    """
+    outs = run.outs
+    graph = StageGraph(name)
+    for o in outs:
+        graph.add(o.stage("access"), partial(access, o))
+    if any(o.generated is None for o in outs):
+        (graph
+         .add("source", source, transient=True)
+         .add("compact", compact, after=("source",), transient=True))
+    for o in outs:
+        if o.generated is None:
+            (graph
+             .add(o.stage("prompt"), partial(prompt, o), after=("compact",), transient=True)
+             .add(o.stage("llm"), partial(llm, o), after=(o.stage("prompt"),)))
+        else:
+            graph.add(o.stage("llm"), partial(resumed, o))
+        graph.add(o.stage("write"), partial(write, o), after=(o.stage("access"), o.stage("llm")))
+    if run.req.sheet_callback:
+        graph.add("callback", callback, after=tuple(o.stage("write") for o in outs), background=True)
+    return graph
+
+
+def _run_testimony(req: TestimonyRequest,
+                   generated: Optional[Union[LLMResult, List[LLMResult]]] = None) -> Dict[str, Any]:
+    logger.info("🚀 run_testimony", extra={"case_id": req.case_id, "context": req.context})
+    run = _prepare_run(req, generated)
+    cache = get_shared_cache()
+
+    targets: Dict[str, Any] = {}
+    targets_lock = threading.Lock()
+
+    def _fetch_link(target_doc_id: str) -> str:
+        # El primer destino sin cache trae los de todas las salidas en un solo batch de Drive;
+        # cada salida ve su propio error (BatchItem)
+        with _google_errors("Validar acceso destino", target_doc_id):
+            with targets_lock:
+                if not targets:
+                    targets.update(batch_get_files([o.target_doc_id for o in run.outs], fields="id,webViewLink"))
+            meta = targets[target_doc_id].result()
+        return meta.get("webViewLink") or _default_link(target_doc_id)
+
+    def _access(o: _Output, _: Dict[str, Any]) -> str:
+        # Acceso al destino + su webViewLink (el link sale de aquí: no hace falta buscarlo después)
+        return cache.get_or_compute("doc_meta", o.target_doc_id, lambda: _fetch_link(o.target_doc_id),
+                                    ttl_s=settings.doc_meta_cache_ttl_s)
+
+    def _source(_: Dict[str, Any]) -> str:
+        if run.spooled is not None:
+            return run.spooled.read()
+        if not run.src_doc:
+            return run.req.raw_text
+        return run.sourced(_read_transcript(run.src_doc))
+
+    def _llm(o: _Output, r: Dict[str, Any]) -> LLMResult:
+        with _llm_errors():
+            return generate_text_result(r[o.stage("prompt")], context=o.req.context, priority=run.priority)
+
+    def _write(o: _Output, r: Dict[str, Any]) -> None:
+        result = r[o.stage("llm")]
+        with _google_errors("Escribir salida", o.target_doc_id):
+            write_markdown_to_document(o.target_doc_id, result.text, **run.write_kwargs(o, result))
+        run.written(o)
+
+    def _callback(r: Dict[str, Any]) -> None:
+        try:
+            writes = run.callback_writes(r)
+            if writes:
+                write_cells(writes)
+        except Exception as e:
+            logger.error("❌ Error actualizando Sheets: %s", e)
+
+    graph = _testimony_graph(
+        "run_testimony", run, access=_access, source=_source,
+        compact=lambda r: _compact(r["source"], run.compaction, run.compacted),
+        prompt=run.prompt, llm=_llm, resumed=lambda o, _: o.generated, write=_write, callback=_callback,
+    )
     try:
-        drive = build_drive_client()
-        meta = drive.files().get(fileId=target_doc_id, fields="webViewLink", supportsAllDrives=True).execute()
-        output_link = meta.get("webViewLink", f"https://docs.google.com/document/d/{target_doc_id}/edit")
-    except Exception:
-        output_link = f"https://docs.google.com/document/d/{target_doc_id}/edit"
+        with get_scheduler().admit(run.priority, tenant_of(run.req)), \
+                get_memory_budget().reserve(run.footprint, label=run.req.case_id) as run.reservation:
+            results = graph.run().results
+    finally:
+        if run.spooled is not None:
+            run.spooled.discard()
+    return run.response(results)
 
-    logger.info("✅ Testimonio generado", extra={"case_id": req.case_id})
 
-    # ---------------------------------------------------------
-    # ✅ 6. CALLBACK A GOOGLE SHEETS (NUEVO)
-    # ---------------------------------------------------------
-    if req.sheet_callback:
-        cb = req.sheet_callback
-        logger.info(f"📊 Actualizando Sheet: {cb.spreadsheet_id} (Fila {cb.row_index})")
-        
+async def arun_testimony(req: TestimonyRequest, *,
+                         generated: Optional[Union[LLMResult, List[LLMResult]]] = None) -> Dict[str, Any]:
+    """
+    Variante asyncio de run_testimony (mismo grafo, misma respuesta y errores).
+    Todo el I/O Google va por src/clients/google_async.py y el LLM se espera sin
+    bloquear el event loop: un proceso puede tener cientos de jobs en vuelo.
+    """
+    return await _aidempotent(req, lambda: _arun_testimony(req, generated))
+
+
+async def _arun_testimony(req: TestimonyRequest,
+                          generated: Optional[Union[LLMResult, List[LLMResult]]] = None) -> Dict[str, Any]:
+    logger.info("🚀 arun_testimony", extra={"case_id": req.case_id, "context": req.context})
+    run = await asyncio.to_thread(_prepare_run, req, generated)  # cache + escribe a disco: fuera del loop
+    client = get_async_google_client()
+    cache = get_shared_cache()
+
+    async def _fetch_link(target_doc_id: str) -> str:
+        with _google_errors("Validar acceso destino", target_doc_id):
+            meta = await client.files_get(target_doc_id, fields="id,webViewLink")
+        return meta.get("webViewLink") or _default_link(target_doc_id)
+
+    async def _access(o: _Output, _: Dict[str, Any]) -> str:
+        return await cache.aget_or_compute("doc_meta", o.target_doc_id, lambda: _fetch_link(o.target_doc_id),
+                                           ttl_s=settings.doc_meta_cache_ttl_s)
+
+    async def _source(_: Dict[str, Any]) -> str:
+        if run.spooled is not None:
+            return await asyncio.to_thread(run.spooled.read)
+        if not run.src_doc:
+            return run.req.raw_text
+        with _google_errors("Leer fuente", run.src_doc):
+            transcript = await cache.aget_or_compute("transcript", run.src_doc,
+                                                     lambda: aget_document_content(run.src_doc),
+                                                     ttl_s=settings.transcript_cache_ttl_s)
+        return run.sourced(transcript)
+
+    async def _compact_stage(r: Dict[str, Any]) -> str:
+        if run.compaction == "off":
+            return r["source"]
+        # CPU (regex sobre el transcript completo): fuera del event loop
+        return await asyncio.to_thread(_compact, r["source"], run.compaction, run.compacted)
+
+    async def _prompt(o: _Output, r: Dict[str, Any]) -> str:
+        # Jinja sobre el transcript completo (o el fallback): CPU, fuera del event loop
+        return await asyncio.to_thread(run.prompt, o, r)
+
+    async def _llm(o: _Output, r: Dict[str, Any]) -> LLMResult:
+        with _llm_errors():
+            return await agenerate_text_result(r[o.stage("prompt")], context=o.req.context, priority=run.priority)
+
+    async def _resumed(o: _Output, _: Dict[str, Any]) -> LLMResult:
+        return o.generated
+
+    async def _write(o: _Output, r: Dict[str, Any]) -> None:
+        result = r[o.stage("llm")]
+        with _google_errors("Escribir salida", o.target_doc_id):
+            await awrite_markdown_to_document(o.target_doc_id, result.text, **run.write_kwargs(o, result))
+        run.written(o)
+
+    async def _callback(r: Dict[str, Any]) -> None:
         try:
-            # Escribir URL del Testimonio
-            if cb.testimony_doc_col:
-                update_row_status(
-                    cb.spreadsheet_id, cb.sheet_name, cb.row_index, 
-                    cb.testimony_doc_col, output_link
+            writes = await asyncio.to_thread(run.callback_writes, r)
+            if writes:
+                await client.values_batch_update(
+                    run.req.sheet_callback.spreadsheet_id,
+                    [{"range": rng, "values": [[val]]} for _, rng, val in writes],
                 )
-            
-            # Escribir Status Final
-            if cb.status_col:
-                 update_row_status(
-                    cb.spreadsheet_id, cb.sheet_name, cb.row_index, 
-                    cb.status_col, "✅ Testimonio Listo"
+        except Exception as e:
+            logger.error("❌ Error actualizando Sheets: %s", e)
+
+    graph = _testimony_graph(
+        "arun_testimony", run, access=_access, source=_source, compact=_compact_stage,
+        prompt=_prompt, llm=_llm, resumed=_resumed, write=_write, callback=_callback,
+    )
+    try:
+        async with get_scheduler().aadmit(run.priority, tenant_of(run.req)):
+            with await get_memory_budget().areserve(run.footprint, label=run.req.case_id) as run.reservation:
+                results = (await graph.arun()).results
+    finally:
+        if run.spooled is not None:
+            run.spooled.discard()
+    return run.response(results)
+
+
+# ---------------------------
+# PDF → Testimonio (chunks + map-reduce)
+# ---------------------------
+
+_PDF_TRANSCRIPT_PLACEHOLDER = {
+    "es": "[La transcripción está en el PDF adjunto a cada parte.]",
+    "en": "[The transcript is in the PDF attached to each part.]",
+}
+_PDF_SYSTEM_TEXT = {
+    "es": "Redacta el testimonio usando solo el contenido de los PDF adjuntos.",
+    "en": "Write the testimony using only the content of the attached PDFs.",
+}
+
+def run_pdf_testimony(req: PdfTestimonyRequest) -> Dict[str, Any]:
+    """
+    PDF en Drive → chunks por páginas (pool de procesos) → GCS (en paralelo)
+    → map-reduce en Vertex → Doc output_doc_id (+ callback a Sheets en background).
+
+        access → chunks ─┐
+        prompt ──────────┴→ map_reduce → write ⇢ callback (background)
+
+    Con `request_id` es idempotente, como run_testimony.
+    """
+    return _idempotent(req, lambda: _run_pdf_testimony(req))
+
+
+def _run_pdf_testimony(req: PdfTestimonyRequest) -> Dict[str, Any]:
+    from src.orchestration.pdf_chunker import chunk_drive_pdf_to_gcs
+
+    logger.info("🚀 run_pdf_testimony", extra={"case_id": req.case_id, "context": req.context})
+    if not settings.gcs_bucket:
+        raise HTTPException(500, "GCS_BUCKET no está configurado (requerido para PDFs).")
+
+    target_doc_id = _target_doc_id(req)
+    pdf_id = (req.pdf_file_id or "").strip() or parse_drive_url_to_id(req.pdf_link or "")
+    if not pdf_id:
+        raise HTTPException(422, "No pude extraer el fileId del PDF.")
+    language = (req.language or settings.default_language or "es").lower()
+    priority = normalize_priority(req.priority)
+    pdf_sizes: List[int] = []  # `size` de Drive, para reservar memoria antes de cortar
+
+    def _access(_: Dict[str, Any]) -> str:
+        files = batch_get_files([target_doc_id, pdf_id], fields="id,webViewLink,mimeType,size")
+        try:
+            target_meta = files[target_doc_id].result()
+        except Exception as e:
+            raise _map_google_http_error(e, op="Validar acceso destino", file_id=target_doc_id) from e
+        try:
+            pdf_meta = files[pdf_id].result()
+        except Exception as e:
+            raise _map_google_http_error(e, op="Leer PDF", file_id=pdf_id) from e
+        if pdf_meta.get("mimeType") != "application/pdf":
+            raise HTTPException(422, f"El archivo {pdf_id} no es un PDF (mimeType={pdf_meta.get('mimeType')}).")
+        pdf_sizes.append(int(pdf_meta.get("size") or 0))
+        return target_meta.get("webViewLink") or _default_link(target_doc_id)
+
+    def _chunks(_: Dict[str, Any]) -> list:
+        # PDF y chunks viven en /tmp hasta que se suben: la reserva dura lo que dura el corte
+        with get_memory_budget().reserve(estimate_pdf_bytes(pdf_sizes[0]), label=req.case_id):
+            try:
+                return chunk_drive_pdf_to_gcs(
+                    pdf_id, settings.gcs_bucket,
+                    pages_per_chunk=req.pages_per_chunk or settings.pdf_pages_per_chunk,
+                    max_chunk_mb=settings.pdf_max_chunk_mb if req.max_chunk_mb is None else req.max_chunk_mb,
                 )
+            except Exception as e:
+                logger.exception("Error preparando chunks del PDF", extra={"case_id": req.case_id})
+                raise HTTPException(500, f"No se pudo preparar el PDF {pdf_id}: {e}")
+
+    def _prompt(_: Dict[str, Any]) -> str:
+        placeholder = _PDF_TRANSCRIPT_PLACEHOLDER.get(language, _PDF_TRANSCRIPT_PLACEHOLDER["es"])
+        try:
+            return render_testimony_prompt(language=language, templates_dir=settings.prompts_dir,
+                                           transcript=placeholder, req=req)
+        except Exception:
+            return _fallback_prompt(transcript=placeholder, req=req, language=language)
+
+    def _map_reduce(r: Dict[str, Any]) -> str:
+        params = {"case_id": req.case_id, "context": req.context, "client": req.client,
+                  "witness": req.witness, "language": language}
+        try:
+            return generate_text_from_files_map_reduce(
+                _PDF_SYSTEM_TEXT.get(language, _PDF_SYSTEM_TEXT["es"]), r["prompt"],
+                [c.gcs_uri for c in r["chunks"]], params, max_workers=settings.pdf_map_concurrency,
+                priority=priority,
+            )
+        except Exception:
+            raise HTTPException(500, "Error al generar texto con el modelo.")
+
+    def _write(r: Dict[str, Any]) -> None:
+        try:
+            write_markdown_to_document(target_doc_id, r["map_reduce"], mode=req.write_mode or settings.docs_write_mode,
+                                       priority=priority)
         except Exception as e:
-            logger.error(f"❌ Error actualizando Sheets: {e}")
+            raise _map_google_http_error(e, op="Escribir salida", file_id=target_doc_id) from e
+        logger.info("✅ Testimonio PDF generado (%s chunks)", len(r["chunks"]), extra={"case_id": req.case_id})
 
-    return TestimonyResponse(
-        status="success",
-        message="Testimonio generado correctamente.",
-        doc_id=target_doc_id,
-        output_doc_link=output_link,
-        model=settings.model_id,
-        language=language,
-        case_id=req.case_id,
-        request_id=req.request_id,
-    ).model_dump()
+    def _callback(r: Dict[str, Any]) -> None:
+        try:
+            row = resolve_callback_row(req.sheet_callback, req.case_id)
+            _log_callback(req, row)
+            write_cells(_callback_writes(req, [(None, r["access"])], row))
+        except Exception as e:
+            logger.error("❌ Error actualizando Sheets: %s", e)
+
+    graph = (
+        StageGraph("run_pdf_testimony")
+        .add("access", _access)
+        .add("prompt", _prompt)
+        .add("chunks", _chunks, after=("access",))
+        .add("map_reduce", _map_reduce, after=("chunks", "prompt"))
+        .add("write", _write, after=("map_reduce",))
+    )
+    if req.sheet_callback:
+        graph.add("callback", _callback, after=("write",), background=True)
+    with get_scheduler().admit(priority, tenant_of(req)):
+        results = graph.run().results
+
+    return _build_response(req, target_doc_id, results["access"], settings.model_id, language)
 
 
 # ---------------------------
@@ -152,7 +736,7 @@ def run_testimony_from_webhook(webhook_req: TranscriptionWebhookRequest) -> Dict
     Recibe el payload del Transcriptor, lo convierte a TestimonyRequest interno
     y ejecuta el proceso.
     """
-    logger.info(f"🔗 Webhook recibido para Case: {webhook_req.case_id}")
+    logger.info("🔗 Webhook recibido para Case: %s", webhook_req.case_id)
     
     meta = webhook_req.metadata
     
@@ -170,7 +754,8 @@ def run_testimony_from_webhook(webhook_req: TranscriptionWebhookRequest) -> Dict
         output_doc_id=meta.output_doc_id,
         sheet_callback=meta.sheet_callback,
         
-        language="es" # Default o lógica extra si quisieras
+        language="es", # Default o lógica extra si quisieras
+        priority="webhook",
     )
     
     return run_testimony(internal_req)
\ No newline at end of file
@@ -0,0 +1,362 @@
+# src/orchestration/scheduler.py
+"""
+Scheduler delante del pipeline: prioridad por clase + reparto justo por cliente.
+
+Clases (de más a menos prioritaria):
+- interactive: POST /generate-testimony (paralegales esperando la respuesta)
+- webhook:     /webhook/chain, jobs de la cola
+- backfill:    src.backfill y jobs masivos
+
+Admisión (por proceso, SCHED_MAX_CONCURRENT pipelines a la vez; 0 = sin tope ni cola):
+- Entre clases, reparto ponderado (SCHED_WEIGHTS, p.ej. interactive=16,webhook=4,backfill=1):
+  con las tres colas llenas, de cada 21 turnos 16 son interactivos, pero backfill nunca queda
+  en cero (a diferencia de una prioridad estricta).
+- Dentro de una clase, round-robin por tenant (`extra.tenant`, si no `client`, si no la
+  "familia" del case_id: el prefijo antes del primer -/_): un backfill de 300 filas de un
+  cliente no deja sin turno a otro cliente de la misma clase.
+
+Límites globales de cuota (token bucket por minuto, repartidos entre los procesos de la
+instancia: workers de src.serve o de src.worker):
+- VERTEX_RPM: llamadas al modelo (solo las que no salen del cache); DOCS_WRITE_RPM: requests de
+  escritura a Docs (1 token por batchUpdate o subida; una escritura larga gasta varios).
+  Quien espera un token sale por clase (interactive primero) y luego por orden de llegada,
+  así un backfill ya admitido no le gana la cuota a un request interactivo.
+
+Ninguna espera (turno o cuota) va más allá del deadline del request (src/deadline.py).
+
+Métricas por clase en /health/metrics: `sched.queued.<clase>`, `sched.running.<clase>`,
+`sched.wait_s.<clase>`, `ratelimit.wait_s.<límite>.<clase>`. La cola durable (job_queue.py)
+ordena con el mismo criterio de clase y tenant; GET /jobs desglosa por clase.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+from src import metrics
+from src.deadline import current_deadline
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+PRIORITY_CLASSES = ("interactive", "webhook", "backfill")
+_RANK = {c: i for i, c in enumerate(PRIORITY_CLASSES)}
+
+_current_class: contextvars.ContextVar[str] = contextvars.ContextVar("priority_class", default="interactive")
+
+
+def current_priority() -> str:
+    return _current_class.get()
+
+
+def normalize_priority(value: Optional[str], default: str = "interactive") -> str:
+    value = (value or "").strip().lower()
+    return value if value in _RANK else default
+
+
+def tenant_of(req: Any) -> str:
+    """Clave de reparto justo: extra.tenant > client > familia del case_id."""
+    extra = getattr(req, "extra", None) or {}
+    if extra.get("tenant"):
+        return str(extra["tenant"]).strip().lower()
+    if getattr(req, "client", None):
+        return str(req.client).strip().lower()
+    case_id = str(getattr(req, "case_id", "") or "")
+    return re.split(r"[-_/\s]", case_id.strip(), maxsplit=1)[0].lower() or "-"
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {"interactive": 16.0, "webhook": 4.0, "backfill": 1.0}
+    for item in (spec or "").split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip() in weights:
+            try:
+                weights[name.strip()] = max(0.01, float(value))
+            except ValueError:
+                logger.warning("⚠️ SCHED_WEIGHTS inválido: %s", item)
+    return weights
+
+
+# ---------------------------
+# Admisión
+# ---------------------------
+
+@dataclass
+class _Ticket:
+    cls: str
+    tenant: str
+    grant: Callable[[], None]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+
+class FairScheduler:
+    def __init__(self, max_concurrent: int, weights: Dict[str, float]) -> None:
+        self.max_concurrent = max_concurrent
+        self.weights = weights
+        self._lock = threading.Lock()
+        self._running: Dict[str, int] = {c: 0 for c in PRIORITY_CLASSES}
+        # clase → {tenant: FIFO}; el orden del OrderedDict es el turno del round-robin
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {c: OrderedDict() for c in PRIORITY_CLASSES}
+        self._vtime: Dict[str, float] = {c: 0.0 for c in PRIORITY_CLASSES}
+        self._clock = 0.0
+        for c in PRIORITY_CLASSES:
+            metrics.register_gauge(f"sched.queued.{c}", lambda c=c: self.queued(c))
+            metrics.register_gauge(f"sched.running.{c}", lambda c=c: self._running[c])
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def queued(self, cls: str) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues[cls].values())
+
+    # ----- núcleo (con self._lock tomado) -----
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        tenants = self._queues[ticket.cls]
+        if not tenants:
+            # Una clase que estaba vacía no acumula crédito por el tiempo que no tuvo trabajo
+            self._vtime[ticket.cls] = max(self._vtime[ticket.cls], self._clock)
+        tenants.setdefault(ticket.tenant, deque()).append(ticket)
+
+    def _pick(self) -> Optional[_Ticket]:
+        ready = [c for c in PRIORITY_CLASSES if self._queues[c]]
+        if not ready:
+            return None
+        cls = min(ready, key=lambda c: (self._vtime[c], _RANK[c]))
+        self._clock = self._vtime[cls]
+        self._vtime[cls] += 1.0 / self.weights[cls]
+        tenants = self._queues[cls]
+        tenant, fifo = next(iter(tenants.items()))
+        ticket = fifo.popleft()
+        del tenants[tenant]
+        if fifo:
+            tenants[tenant] = fifo  # al final: turno del siguiente tenant
+        return ticket
+
+    def _dispatch(self) -> None:
+        while sum(self._running.values()) < self.max_concurrent:
+            ticket = self._pick()
+            if ticket is None:
+                return
+            ticket.granted = True
+            self._running[ticket.cls] += 1
+            metrics.observe(f"sched.wait_s.{ticket.cls}", time.monotonic() - ticket.enqueued_at)
+            ticket.grant()
+
+    def _remove(self, ticket: _Ticket) -> None:
+        fifo = self._queues[ticket.cls].get(ticket.tenant)
+        if fifo is not None and ticket in fifo:
+            fifo.remove(ticket)
+            if not fifo:
+                del self._queues[ticket.cls][ticket.tenant]
+
+    def _release(self, cls: str) -> None:
+        with self._lock:
+            self._running[cls] -= 1
+            self._dispatch()
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        """El que esperaba se fue (deadline, cancelación): sale de la cola o devuelve el turno."""
+        with self._lock:
+            granted = ticket.granted
+            if not granted:
+                self._remove(ticket)
+        if granted:
+            self._release(ticket.cls)
+
+    # ----- API -----
+
+    @contextmanager
+    def admit(self, cls: str, tenant: str) -> Iterator[None]:
+        """Bloquea hasta que haya turno para (clase, tenant); fija la clase para los rate limits."""
+        cls = normalize_priority(cls)
+        token = _current_class.set(cls)
+        metrics.incr(f"sched.admitted.{cls}")
+        if not self.enabled:
+            try:
+                yield
+            finally:
+                _current_class.reset(token)
+            return
+        event = threading.Event()
+        ticket = _Ticket(cls, tenant, event.set)
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        if not ticket.granted:
+            logger.info("🚦 En cola (%s/%s): %s pipelines en curso.", cls, tenant, self.max_concurrent)
+        deadline = current_deadline()
+        if deadline is not None:
+            unregister = deadline.on_cancel(event.set)
+            event.wait(deadline.timeout())
+            unregister()
+            if deadline.done:
+                self._abandon(ticket)
+                _current_class.reset(token)
+                deadline.check("turno del scheduler")
+        else:
+            event.wait()
+        try:
+            yield
+        finally:
+            _current_class.reset(token)
+            self._release(cls)
+
+    @asynccontextmanager
+    async def aadmit(self, cls: str, tenant: str) -> AsyncIterator[None]:
+        cls = normalize_priority(cls)
+        token = _current_class.set(cls)
+        metrics.incr(f"sched.admitted.{cls}")
+        if not self.enabled:
+            try:
+                yield
+            finally:
+                _current_class.reset(token)
+            return
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+
+        def _grant() -> None:
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        ticket = _Ticket(cls, tenant, _grant)
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        deadline = current_deadline()
+        try:
+            await asyncio.wait_for(fut, deadline.timeout() if deadline is not None else None)
+        except BaseException as e:
+            # Cancelado (cliente desconectado) o deadline vencido mientras esperaba
+            self._abandon(ticket)
+            _current_class.reset(token)
+            if isinstance(e, asyncio.TimeoutError) and deadline is not None:
+                deadline.check("turno del scheduler")
+            raise
+        try:
+            yield
+        finally:
+            _current_class.reset(token)
+            self._release(cls)
+
+
+# ---------------------------
+# Límites de cuota (token bucket con prioridad)
+# ---------------------------
+
+class RateLimiter:
+    """`per_min` tokens por minuto (ráfaga = 1 minuto de cuota). 0 = sin límite."""
+
+    def __init__(self, name: str, per_min: float) -> None:
+        self.name = name
+        self.rate = per_min / 60.0
+        self.capacity = max(1.0, per_min)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []  # heap (rank, seq)
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, entry: tuple, cost: float) -> Optional[float]:
+        """Con el lock tomado: None si tomó los tokens; si no, segundos sugeridos de espera."""
+        self._refill()
+        if self._waiters[0] == entry and self._tokens >= cost:
+            heapq.heappop(self._waiters)
+            self._tokens -= cost
+            self._cond.notify_all()
+            return None
+        return max(0.005, (cost - self._tokens) / self.rate) if self._waiters[0] == entry else 0.05
+
+    def acquire(self, cls: Optional[str] = None, cost: float = 1.0) -> float:
+        """Bloquea hasta tener `cost` tokens. Devuelve los segundos esperados."""
+        if not self.enabled:
+            return 0.0
+        cls = normalize_priority(cls or current_priority())
+        cost = min(cost, self.capacity)
+        entry = (_RANK[cls], next(self._seq))
+        deadline = current_deadline()
+        t0 = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            while (wait := self._try_take(entry, cost)) is not None:
+                if deadline is not None and deadline.done:
+                    self._drop(entry)
+                    deadline.check(f"cuota {self.name}")
+                self._cond.wait(deadline.timeout(wait) if deadline is not None else wait)
+        return self._observe(cls, time.monotonic() - t0)
+
+    async def aacquire(self, cls: Optional[str] = None, cost: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        cls = normalize_priority(cls or current_priority())
+        cost = min(cost, self.capacity)
+        entry = (_RANK[cls], next(self._seq))
+        deadline = current_deadline()
+        t0 = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(entry, cost)
+                if wait is None:
+                    break
+                if deadline is not None:
+                    deadline.check(f"cuota {self.name}")
+                    wait = deadline.timeout(wait)
+                await asyncio.sleep(wait)
+        except BaseException:
+            with self._cond:
+                self._drop(entry)
+            raise
+        return self._observe(cls, time.monotonic() - t0)
+
+    def _drop(self, entry: tuple) -> None:
+        """Con el lock tomado: saca a un waiter que abandona (deadline/cancelación)."""
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def _observe(self, cls: str, waited: float) -> float:
+        metrics.observe(f"ratelimit.wait_s.{self.name}.{cls}", waited)
+        if waited > 1.0:
+            logger.info("🚦 %s: %.1fs esperando cuota (%s).", self.name, waited, cls)
+        return waited
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> FairScheduler:
+    s = get_settings()
+    return FairScheduler(s.sched_max_concurrent, _parse_weights(s.sched_weights))
+
+
+@lru_cache(maxsize=4)
+def get_rate_limiter(name: str) -> RateLimiter:
+    """'vertex' (VERTEX_RPM) o 'docs' (DOCS_WRITE_RPM); la cuota de la instancia se reparte entre procesos."""
+    s = get_settings()
+    per_min = {"vertex": s.vertex_rpm, "docs": s.docs_write_rpm}[name]
+    return RateLimiter(name, per_min / max(1, s.serve_workers))
@@ -0,0 +1,373 @@
+# src/orchestration/stages.py
+"""
+Ejecutor mínimo de un grafo de etapas (DAG) para el runner.
+
+- Cada etapa declara de qué etapas depende; las independientes corren a la vez
+  (p.ej. validar el Doc destino y leer la fuente).
+- Etapas `background=True`: efectos secundarios posteriores a la escritura (callback a Sheets).
+  Arrancan cuando sus dependencias terminan pero NO bloquean el resultado: el request
+  responde antes. Sus errores se loggean (como antes), no se propagan.
+- Si una etapa de primer plano falla, no se arrancan más etapas, se cancelan las que están en
+  vuelo (ABORTED en el deadline de la corrida: LLM, lotes de Docs, esperas de cuota) y se las
+  espera antes de re-lanzar la excepción tal cual (HTTPException incluida). Así el turno del
+  scheduler y la reserva de memoria no se sueltan con trabajo todavía corriendo.
+- Timing por etapa: un log por corrida + métricas `runner.stage_s.<etapa>`.
+  Con MEMORY_TRACE (src/memory_budget.py) también el delta de memoria trazada por etapa
+  (`runner.stage_mem_mb.<etapa>`) y el máximo visto en la corrida.
+- Si el request corre bajo un profile (src/profiling.py), cada etapa de primer plano de
+  `run()` se registra ahí (wall vs CPU + muestras de stack). Las de background no.
+- Etapas `transient=True`: su resultado se suelta en cuanto terminan todas las etapas que
+  dependen de él (p.ej. el transcript tras renderizar el prompt), para no retener copias.
+- Deadline del request (src/deadline.py): cada etapa de primer plano recibe lo que queda como
+  timeout; vencido (o con el cliente desconectado) no arrancan más etapas y sale
+  DeadlineExceeded/ClientDisconnected en vez del error que haya provocado el corte.
+  En `arun()` la etapa en vuelo se cancela; en `run()` los hilos no se pueden matar: lo que
+  corre ve el deadline en su próximo chequeo (LLM, lotes de Docs). Background: sin deadline.
+
+Dos ejecutores con la misma semántica:
+- `run()`  → hilos (runner síncrono: worker, backfill, webhook).
+- `arun()` → corutinas en el event loop actual (arun_testimony).
+
+Antes de salir de un proceso (worker, backfill, shutdown de la app) conviene
+`drain_background()` / `adrain_background()` para no perder callbacks en vuelo.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.deadline import ABORTED, DeadlineExceeded, EXPIRED, Deadline, current_deadline, use_deadline
+from src.logging_conf import get_logger
+from src.memory_budget import traced_bytes
+from src.metrics import observe
+from src.profiling import current_profile
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+StageFn = Callable[[Dict[str, Any]], Any]
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class _Stage:
+    name: str
+    fn: StageFn
+    after: Tuple[str, ...]
+    background: bool
+    transient: bool = False
+
+
+@dataclass
+class StageRun:
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)  # segundos por etapa de primer plano
+    memory: Dict[str, int] = field(default_factory=dict)     # delta de memoria trazada (bytes), con MEMORY_TRACE
+    peak_traced: int = 0  # máximo visto en bordes de etapa, sobre la memoria trazada al arrancar la corrida
+    elapsed: float = 0.0
+    _baseline: Optional[int] = field(default_factory=traced_bytes, repr=False)
+
+    def _note_memory(self, name: str, before: Optional[int]) -> None:
+        after = traced_bytes()
+        if before is None or after is None or self._baseline is None:
+            return
+        self.memory[name] = after - before
+        self.peak_traced = max(self.peak_traced, before - self._baseline, after - self._baseline)
+
+
+# Etapas de primer plano que un pipeline puede tener en vuelo a la vez (access ‖ source, y llm/write
+# con margen); con `outputs` son ~2 por salida
+_STAGES_PER_PIPELINE = 4
+
+
+def stage_pool_size() -> int:
+    """
+    STAGE_POOL_WORKERS, o auto: max(32, 4 × SCHED_MAX_CONCURRENT). Las etapas bloquean el hilo
+    (LLM, espera de cuota, lotes de Docs): si el pool se queda corto, las etapas listas esperan
+    en su cola (`runner.stage_queue_s`) aunque el scheduler ya haya admitido el pipeline.
+    """
+    s = get_settings()
+    if s.stage_pool_workers > 0:
+        return s.stage_pool_workers
+    return max(32, _STAGES_PER_PIPELINE * s.sched_max_concurrent)
+
+
+@lru_cache(maxsize=1)
+def _stage_pool() -> ThreadPoolExecutor:
+    # Los hilos nunca esperan a otras etapas (el scheduler solo envía etapas listas): sin deadlocks
+    return ThreadPoolExecutor(max_workers=stage_pool_size(), thread_name_prefix="stage")
+
+
+@lru_cache(maxsize=1)
+def _background_pool() -> ThreadPoolExecutor:
+    # Pool aparte: los efectos secundarios no le quitan hilos a etapas del camino crítico
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="side-effect")
+
+
+_bg_lock = threading.Lock()
+_bg_futures: Set[Future] = set()
+_bg_tasks: Set[asyncio.Task] = set()
+
+
+def _observe_stage(name: str, seconds: float) -> None:
+    observe(f"runner.stage_s.{name}", seconds)
+
+
+def _log_background_error(label: str, name: str, e: BaseException) -> None:
+    logger.error("❌ Etapa en background %s/%s falló: %s", label, name, e)
+
+
+class StageGraph:
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self._stages: Dict[str, _Stage] = {}
+
+    def add(self, name: str, fn: StageFn, *, after: Tuple[str, ...] = (), background: bool = False,
+            transient: bool = False) -> "StageGraph":
+        """`fn(results)` recibe los resultados de las etapas ya terminadas (por nombre)."""
+        missing = [d for d in after if d not in self._stages]
+        if missing:
+            raise ValueError(f"Etapa {name}: dependencias no declaradas {missing}")
+        if any(self._stages[d].background for d in after):
+            raise ValueError(f"Etapa {name}: no puede depender de una etapa en background")
+        self._stages[name] = _Stage(name, fn, tuple(after), background, transient)
+        return self
+
+    def _release_transient(self, run: StageRun, done: Set[str], started: Set[str]) -> None:
+        for stage in self._stages.values():
+            if not stage.transient or stage.name not in run.results:
+                continue
+            consumers = [s.name for s in self._stages.values() if stage.name in s.after]
+            # Las etapas en background reciben una copia del dict al arrancar: basta con que hayan arrancado
+            if all(c in done or (c in started and self._stages[c].background) for c in consumers):
+                del run.results[stage.name]
+
+    def _ready(self, done: Set[str], started: Set[str]) -> List[_Stage]:
+        return [s for s in self._stages.values() if s.name not in started and all(d in done for d in s.after)]
+
+    def _finish(self, run: StageRun, t0: float) -> StageRun:
+        run.elapsed = time.perf_counter() - t0
+        for name, secs in run.timings.items():
+            _observe_stage(name, secs)
+        extra: Dict[str, Any] = {"stage_timings": {k: round(v, 3) for k, v in run.timings.items()}}
+        mem = ""
+        if run.memory:
+            for name, delta in run.memory.items():
+                observe(f"runner.stage_mem_mb.{name}", delta / _MB)
+            observe("runner.peak_traced_mb", run.peak_traced / _MB)
+            extra["stage_mem_mb"] = {k: round(v / _MB, 2) for k, v in run.memory.items()}
+            extra["peak_traced_mb"] = round(run.peak_traced / _MB, 2)
+            mem = f" · mem pico +{run.peak_traced / _MB:.1f} MB (" + " ".join(
+                f"{k}={v / _MB:+.1f}" for k, v in run.memory.items()) + ")"
+        logger.info(
+            "⏱️ %s: %.2fs (%s)%s", self.label, run.elapsed,
+            " ".join(f"{k}={v:.2f}s" for k, v in run.timings.items()), mem,
+            extra=extra,
+        )
+        return run
+
+    # ---------- Hilos ----------
+
+    def _submit_background(self, stage: _Stage, results: Dict[str, Any]) -> None:
+        def _bg() -> None:
+            # (los hilos del pool de background no heredan el deadline del request)
+            t = time.perf_counter()
+            try:
+                stage.fn(results)
+            except Exception as e:
+                _log_background_error(self.label, stage.name, e)
+            finally:
+                _observe_stage(stage.name, time.perf_counter() - t)
+
+        fut = _background_pool().submit(_bg)
+        with _bg_lock:
+            _bg_futures.add(fut)
+        fut.add_done_callback(_discard_future)
+
+    def run(self) -> StageRun:
+        run = StageRun()
+        pool = _stage_pool()
+        t0 = time.perf_counter()
+        done: Set[str] = set()
+        started: Set[str] = set()
+        inflight: Dict[Future, Tuple[str, float]] = {}
+        # Los hilos del pool no heredan los contextvars: se capturan acá
+        profile = current_profile()
+        deadline = current_deadline()
+        scope = _run_scope(deadline)
+
+        def _call(stage: _Stage, submitted_at: float) -> Any:
+            # Espera en la cola del pool: > 0 sostenido = STAGE_POOL_WORKERS corto para la carga
+            observe("runner.stage_queue_s", time.perf_counter() - submitted_at)
+            before = traced_bytes()
+            try:
+                with use_deadline(scope), _deadline_errors(scope, stage.name):
+                    if profile is None:
+                        return stage.fn(run.results)
+                    with profile.stage(stage.name):
+                        return stage.fn(run.results)
+            finally:
+                run._note_memory(stage.name, before)
+
+        try:
+            while True:
+                for stage in self._ready(done, started):
+                    started.add(stage.name)
+                    if stage.background:
+                        self._submit_background(stage, dict(run.results))
+                        continue
+                    now = time.perf_counter()
+                    inflight[pool.submit(_call, stage, now)] = (stage.name, now)
+                if not inflight:
+                    break
+                finished, _ = wait(inflight, timeout=scope.timeout(), return_when=FIRST_COMPLETED)
+                if not finished:
+                    # Deadline vencido: cancela lo cancelable (LLM en vuelo) y no espera a los hilos
+                    scope.cancel(EXPIRED)
+                    raise scope.error(", ".join(name for name, _ in inflight.values()))
+                for fut in finished:
+                    name, started_at = inflight.pop(fut)
+                    run.timings[name] = time.perf_counter() - started_at
+                    exc = fut.exception()
+                    if exc is not None:
+                        # Las pendientes no arrancan; las en vuelo se cortan en su próximo chequeo
+                        # y se las espera (hasta el deadline del request)
+                        scope.cancel(ABORTED)
+                        wait(inflight, timeout=deadline.timeout() if deadline else None)
+                        raise exc
+                    run.results[name] = fut.result()
+                    done.add(name)
+                self._release_transient(run, done, started)
+        finally:
+            scope.detach()
+        return self._finish(run, t0)
+
+    # ---------- asyncio ----------
+
+    async def arun(self) -> StageRun:
+        run = StageRun()
+        t0 = time.perf_counter()
+        done: Set[str] = set()
+        started: Set[str] = set()
+        inflight: Dict[asyncio.Task, Tuple[str, float]] = {}
+
+        deadline = current_deadline()
+        scope = _run_scope(deadline)
+
+        async def _call(stage: _Stage) -> Any:
+            before = traced_bytes()
+            try:
+                with use_deadline(scope), _deadline_errors(scope, stage.name):
+                    timeout = scope.timeout()
+                    if timeout is None:
+                        return await stage.fn(run.results)
+                    return await asyncio.wait_for(stage.fn(run.results), timeout)
+            finally:
+                run._note_memory(stage.name, before)
+
+        try:
+            while True:
+                for stage in self._ready(done, started):
+                    started.add(stage.name)
+                    if stage.background:
+                        self._create_background_task(stage, dict(run.results))
+                        continue
+                    task = asyncio.ensure_future(_call(stage))
+                    inflight[task] = (stage.name, time.perf_counter())
+                if not inflight:
+                    break
+                finished, _ = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name, started_at = inflight.pop(task)
+                    run.timings[name] = time.perf_counter() - started_at
+                    run.results[name] = task.result()  # re-lanza la excepción de la etapa
+                    done.add(name)
+                self._release_transient(run, done, started)
+        finally:
+            if inflight:
+                # Igual que run(): lo que corre en hilos (to_thread) ve el ABORTED; las tasks se
+                # cancelan y se las espera antes de salir
+                scope.cancel(ABORTED)
+                for task in inflight:
+                    task.cancel()
+                await asyncio.wait(inflight, timeout=deadline.timeout() if deadline else None)
+            scope.detach()
+        return self._finish(run, t0)
+
+    def _create_background_task(self, stage: _Stage, results: Dict[str, Any]) -> None:
+        async def _bg() -> None:
+            t = time.perf_counter()
+            try:
+                with use_deadline(None):  # la task hereda el contexto del request: sin deadline
+                    await stage.fn(results)
+            except Exception as e:
+                _log_background_error(self.label, stage.name, e)
+            finally:
+                _observe_stage(stage.name, time.perf_counter() - t)
+
+        task = asyncio.get_running_loop().create_task(_bg())
+        _bg_tasks.add(task)  # referencia fuerte: una task sin referencias puede ser recolectada
+        task.add_done_callback(_bg_tasks.discard)
+
+
+def _run_scope(deadline: Optional[Deadline]) -> Deadline:
+    """Deadline de una corrida: hijo del request (o uno sin límite) que se cancela si falla una etapa."""
+    return deadline.child() if deadline is not None else Deadline(None)
+
+
+@contextmanager
+def _deadline_errors(deadline: Optional[Deadline], stage: str) -> Iterator[None]:
+    """Chequea el deadline al arrancar la etapa; si falló por el corte, lo reporta como tal."""
+    if deadline is None:
+        yield
+        return
+    deadline.check(stage)
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:  # timeout de la etapa, llamada cancelada, error al cortar a mitad
+        if deadline.done:
+            deadline.cancel(EXPIRED)
+            raise deadline.error(stage) from e
+        raise
+
+
+def _discard_future(fut: Future) -> None:
+    with _bg_lock:
+        _bg_futures.discard(fut)
+
+
+def pending_background() -> int:
+    with _bg_lock:
+        return len(_bg_futures) + len(_bg_tasks)
+
+
+def drain_background(timeout: Optional[float] = 30.0) -> int:
+    """Espera los efectos secundarios en hilos. Devuelve cuántos quedaron sin terminar."""
+    with _bg_lock:
+        pending = set(_bg_futures)
+    if pending:
+        logger.info("⏳ Esperando %s efectos secundarios en background...", len(pending))
+        _, not_done = wait(pending, timeout=timeout)
+        return len(not_done)
+    return 0
+
+
+async def adrain_background(timeout: Optional[float] = 30.0) -> int:
+    """Espera los efectos secundarios del event loop actual (y los de hilos, sin bloquear el loop)."""
+    loop = asyncio.get_running_loop()
+    tasks = [t for t in _bg_tasks if t.get_loop() is loop]
+    left = 0
+    if tasks:
+        logger.info("⏳ Esperando %s efectos secundarios en background...", len(tasks))
+        _, not_done = await asyncio.wait(tasks, timeout=timeout)
+        left = len(not_done)
+    return left + await asyncio.to_thread(drain_background, timeout)
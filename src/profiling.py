@@ -0,0 +1,272 @@
+# src/profiling.py
+"""
+Profiling bajo demanda de un request (sin redeploy).
+
+Se activa por request con el header `X-Profile: <ADMIN_TOKEN>` o por muestreo
+(PROFILE_SAMPLE_RATE). El request corre `run_testimony` y, por cada etapa del grafo
+(src/orchestration/stages.py), se registra:
+
+- wall vs CPU (`time.thread_time` del hilo de la etapa): una etapa con wall alto y CPU
+  bajo está esperando I/O (Google, LLM); con CPU alto, está calculando.
+- PROFILE_MODE=sample (default, overhead bajo): un hilo muestrea cada PROFILE_INTERVAL_MS
+  los stacks de los hilos de las etapas → "collapsed stacks" (flamegraph.pl / speedscope).
+- PROFILE_MODE=cprofile: cProfile por etapa, combinado en un dump pstats.
+
+Los resultados quedan en PROFILE_DIR (últimos PROFILE_KEEP) y se leen por /admin/profiles.
+"""
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from uuid import uuid4
+
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+
+_MAX_DEPTH = 64
+
+
+def current_profile() -> Optional["RequestProfile"]:
+    return _current.get()
+
+
+def admin_token_matches(header_token: Optional[str]) -> bool:
+    """Header == ADMIN_TOKEN (configurado), en tiempo constante (X-Profile y /admin/*)."""
+    token = get_settings().admin_token
+    # En bytes: compare_digest con str no ASCII lanza TypeError (un header "sécret" daría 500)
+    return bool(header_token and token) and hmac.compare_digest(header_token.encode(), token.encode())
+
+
+def should_profile(header_token: Optional[str]) -> bool:
+    """Header admin válido, o muestreo por PROFILE_SAMPLE_RATE."""
+    s = get_settings()
+    if admin_token_matches(header_token):
+        return True
+    return s.profile_sample_rate > 0 and random.random() < s.profile_sample_rate
+
+
+def _frame_label(frame) -> str:
+    """`src/...` o `paquete/...` (site-packages); stdlib y el resto, solo el nombre de archivo."""
+    code = frame.f_code
+    path = code.co_filename
+    idx = path.rfind("/src/")
+    if idx >= 0:
+        path = path[idx + 1:]
+    elif "site-packages/" in path:
+        path = path.rsplit("site-packages/", 1)[1]
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{code.co_name}"
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile: "RequestProfile", interval_s: float) -> None:
+        super().__init__(name=f"profiler-{profile.id[:8]}", daemon=True)
+        self.profile = profile
+        self.interval_s = interval_s
+        self._stop_evt = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_evt.wait(self.interval_s):
+            threads = self.profile._active_threads()
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident, stage in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack: List[str] = []
+                while frame is not None and len(stack) < _MAX_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(f"stage:{stage}")
+                self.profile._stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+        self.join(timeout=1.0)
+
+
+class RequestProfile:
+    def __init__(self, label: str, *, mode: Optional[str] = None, meta: Optional[Dict[str, Any]] = None) -> None:
+        s = get_settings()
+        self.id = uuid4().hex
+        self.label = label
+        self.mode = (mode or s.profile_mode).lower()
+        self.meta = meta or {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stacks: Counter = Counter()
+        self._stats: Optional[pstats.Stats] = None
+        self._sampler = _Sampler(self, s.profile_interval_ms / 1000.0) if self.mode == "sample" else None
+        self._t0 = time.perf_counter()
+        self._started_at = time.time()
+
+    def _active_threads(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return list(self._threads.items())
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Envuelve la ejecución de una etapa en el hilo actual: wall, CPU y muestras/cProfile."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = name
+        prof = cProfile.Profile() if self.mode == "cprofile" else None
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        if prof is not None:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+            wall, cpu = time.perf_counter() - wall0, time.thread_time() - cpu0
+            with self._lock:
+                self._threads.pop(ident, None)
+                self.stages[name] = {"wall_s": round(wall, 4), "cpu_s": round(cpu, 4),
+                                     "cpu_pct": round(100 * cpu / wall, 1) if wall > 0 else 0.0}
+                if prof is not None:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(prof)
+                    else:
+                        self._stats.add(prof)
+
+    def __enter__(self) -> "RequestProfile":
+        self._token = _current.set(self)
+        if self._sampler is not None:
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self._token)
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.meta["status"] = "error" if exc is not None else "ok"
+        if exc is not None:
+            self.meta["error"] = str(getattr(exc, "detail", None) or exc)[:300]
+        try:
+            self.save()
+        except Exception as e:
+            logger.warning("No se pudo guardar el profile %s: %s", self.id, e)
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Ejecuta `fn` bajo este profile (p.ej. vía asyncio.to_thread); si falla, el profile igual se guarda."""
+        with self:
+            return fn(*args, **kwargs)
+
+    # ---------- Persistencia ----------
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "mode": self.mode,
+            "started_at": self._started_at,
+            "elapsed_s": round(time.perf_counter() - self._t0, 4),
+            "stages": self.stages,
+            "samples": sum(self._stacks.values()),
+            **self.meta,
+        }
+
+    def save(self) -> str:
+        s = get_settings()
+        os.makedirs(s.profile_dir, exist_ok=True)
+        base = os.path.join(s.profile_dir, self.id)
+        if self.mode == "sample":
+            with open(base + ".collapsed", "w", encoding="utf-8") as fh:
+                for stack, count in self._stacks.most_common():
+                    fh.write(f"{stack} {count}\n")
+        elif self._stats is not None:
+            self._stats.dump_stats(base + ".pstats")
+        with open(base + ".json", "w", encoding="utf-8") as fh:
+            json.dump(self.summary(), fh, ensure_ascii=False)
+        _prune(s.profile_dir, s.profile_keep)
+        logger.info("🔬 Profile %s guardado (%s, %s etapas).", self.id, self.mode, len(self.stages),
+                    extra={"profile_id": self.id})
+        return self.id
+
+
+def _prune(directory: str, keep: int) -> None:
+    summaries = sorted(
+        (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".json")),
+        key=os.path.getmtime, reverse=True,
+    )
+    for path in summaries[max(1, keep):]:
+        stem = path[:-len(".json")]
+        for ext in (".json", ".collapsed", ".pstats"):
+            try:
+                os.unlink(stem + ext)
+            except FileNotFoundError:
+                pass
+
+
+# ---------- Lectura (admin) ----------
+
+def _profile_path(profile_id: str, ext: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(get_settings().profile_dir, profile_id + ext)
+    return path if os.path.exists(path) else None
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    directory = get_settings().profile_dir
+    if not os.path.isdir(directory):
+        return []
+    paths = sorted((os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".json")),
+                   key=os.path.getmtime, reverse=True)[:limit]
+    out = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            out.append(json.load(fh))
+    return out
+
+
+def load_summary(profile_id: str) -> Optional[Dict[str, Any]]:
+    path = _profile_path(profile_id, ".json")
+    if path is None:
+        return None
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def load_collapsed(profile_id: str) -> Optional[str]:
+    path = _profile_path(profile_id, ".collapsed")
+    if path is None:
+        return None
+    with open(path, encoding="utf-8") as fh:
+        return fh.read()
+
+
+def pstats_path(profile_id: str) -> Optional[str]:
+    return _profile_path(profile_id, ".pstats")
+
+
+def pstats_text(profile_id: str, *, sort: str = "cumulative", limit: int = 60) -> Optional[str]:
+    path = pstats_path(profile_id)
+    if path is None:
+        return None
+    buf = io.StringIO()
+    pstats.Stats(path, stream=buf).sort_stats(sort).print_stats(limit)
+    return buf.getvalue()
@@ -0,0 +1,60 @@
+# src/serve.py
+"""
+Servidor HTTP multi-proceso (CMD del Dockerfile):
+
+    python -m src.serve                  # WEB_WORKERS procesos uvicorn (0 = vCPUs)
+    python -m src.serve --workers 4
+
+Cada worker es un proceso con sus propios clientes, token y métricas; lo que vale la pena
+compartir entre ellos (LLM, transcripts, metadata, idempotencia) vive en el cache compartido
+(src/shared_cache.py, SQLite local en WAL). El presupuesto de memoria se reparte entre workers.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from typing import Optional
+
+from src.logging_conf import bootstrap_logging_from_env, get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+
+def available_cpus() -> int:
+    """vCPUs del contenedor: cuota de cgroup (Cloud Run) si existe; si no, afinidad / cpu_count."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as fh:
+            quota, period = fh.read().split()[:2]
+        if quota != "max":
+            return max(1, int(int(quota) / int(period) + 0.5))
+    except (OSError, ValueError):
+        pass
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main(argv: Optional[list] = None) -> None:
+    import uvicorn
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(prog="python -m src.serve", description="Servidor HTTP de testimonios.")
+    parser.add_argument("--workers", type=int, default=settings.web_workers, help="Procesos uvicorn (0 = vCPUs).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    args = parser.parse_args(argv)
+
+    bootstrap_logging_from_env()
+    workers = args.workers if args.workers > 0 else available_cpus()
+    # Los workers heredan el entorno: así cada uno sabe cuántos son (presupuesto de memoria por proceso)
+    os.environ["SERVE_WORKERS"] = str(workers)
+    logger.info("🚀 Sirviendo con %s worker(s) en %s:%s (cache compartido: %s).",
+                workers, args.host, args.port, settings.shared_cache_path or "desactivado")
+    uvicorn.run("src.main:app", host=args.host, port=args.port, workers=workers,
+                proxy_headers=True, forwarded_allow_ips="*")
+
+
+if __name__ == "__main__":
+    main()
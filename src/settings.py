@@ -42,22 +42,152 @@ class Settings(BaseModel):
 
     vertex_location: str = os.getenv("VERTEX_LOCATION", "us-central1")
 
+    # --- Ruteo / failover / hedging LLM (ver src/clients/llm_router.py) ---
+    # Prompts >= LLM_LONG_PROMPT_CHARS van a VERTEX_MODEL_LONG (0 = desactivado)
+    vertex_model_long: str = os.getenv("VERTEX_MODEL_LONG", "")          # p.ej. "gemini-2.5-pro"
+    llm_long_prompt_chars: int = int(os.getenv("LLM_LONG_PROMPT_CHARS", "0"))
+    # Modelo por contexto: "Witness=gemini-2.5-pro,Reference Letter=gemini-2.5-flash"
+    llm_context_models: str = os.getenv("LLM_CONTEXT_MODELS", "")
+    # Failover ante 429/5xx: otras regiones (mismo modelo) y luego otros modelos
+    vertex_fallback_locations: str = os.getenv("VERTEX_FALLBACK_LOCATIONS", "")  # "us-east4,us-west1"
+    vertex_fallback_models: str = os.getenv("VERTEX_FALLBACK_MODELS", "")        # "gemini-2.5-pro"
+    llm_gemini_api_fallback: bool = os.getenv("LLM_GEMINI_API_FALLBACK", "false").lower() in {"true", "1", "yes"}
+    llm_request_timeout_s: float = float(os.getenv("LLM_REQUEST_TIMEOUT_S", "0"))  # 0 = sin límite
+    # Hedging: segundo intento si el primero supera el p95 observado (o LLM_HEDGE_AFTER_S fijo)
+    llm_hedge_enabled: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in {"true", "1", "yes"}
+    llm_hedge_after_s: float = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))
+
     # --- Docs/Drive ---
     # Nota: NO hay creación de documentos. Solo escritura en un Doc provisto en el request.
     # Se mantiene opcionalmente el Shared Drive ID para llamadas con supportsAllDrives=True.
     shared_drive_id: Optional[str] = os.getenv("SHARED_DRIVE_ID") or None
+    # Escritura del Doc de salida: "rewrite" (borra todo) | "diff" (solo párrafos cambiados)
+    # | "docx" / "html" (render local + una sola subida de Drive con conversión)
+    docs_write_mode: str = os.getenv("DOCS_WRITE_MODE", "rewrite").lower()
+
+    # Cliente Google asyncio (httpx): conexiones del pool por event loop y timeout por request
+    google_async_max_connections: int = int(os.getenv("GOOGLE_ASYNC_MAX_CONNECTIONS", "100"))
+    google_async_timeout_s: float = float(os.getenv("GOOGLE_ASYNC_TIMEOUT_S", "180"))
+
+    # Transferencias Drive→GCS en streaming: tamaño de chunk y transferencias en paralelo
+    transfer_chunk_mb: int = int(os.getenv("TRANSFER_CHUNK_MB", "8"))
+    transfer_concurrency: int = int(os.getenv("TRANSFER_CONCURRENCY", "4"))
+
+    # Subidas a GCS direccionadas por contenido (sha256): prefijo, días sin uso antes de borrar
+    # (regla de lifecycle por daysSinceCustomTime; 0 = no gestionar lifecycle) y tamaño del índice local
+    gcs_cas_prefix: str = os.getenv("GCS_CAS_PREFIX", "cas").strip("/")
+    gcs_cas_ttl_days: int = int(os.getenv("GCS_CAS_TTL_DAYS", "30"))
+    gcs_cas_index_size: int = int(os.getenv("GCS_CAS_INDEX_SIZE", "4096"))
+
+    # --- PDF → testimonio (map-reduce) ---
+    gcs_bucket: str = os.getenv("GCS_BUCKET", "")                          # chunks PDF subidos para Vertex
+    pdf_pages_per_chunk: int = int(os.getenv("PDF_PAGES_PER_CHUNK", "30"))
+    pdf_max_chunk_mb: float = float(os.getenv("PDF_MAX_CHUNK_MB", "20"))    # 0 = sin presupuesto de tamaño
+    pdf_split_processes: int = int(os.getenv("PDF_SPLIT_PROCESSES", "0"))   # 0 = os.cpu_count()
+    pdf_map_concurrency: int = int(os.getenv("PDF_MAP_CONCURRENCY", "4"))   # llamadas MAP en paralelo
+
+    # --- Generación offline: Vertex batch prediction (python -m src.backfill --batch) ---
+    # "vertex" (JSONL en gs://GCS_BUCKET/BATCH_GCS_PREFIX) | "local" (sustituto en proceso, para pruebas)
+    batch_backend: str = os.getenv("BATCH_BACKEND", "vertex").lower()
+    batch_gcs_prefix: str = os.getenv("BATCH_GCS_PREFIX", "batch").strip("/")
+    batch_model: str = os.getenv("BATCH_MODEL", "")                        # vacío = model_id
+    batch_poll_s: float = float(os.getenv("BATCH_POLL_S", "60"))
+    batch_max_wait_s: float = float(os.getenv("BATCH_MAX_WAIT_S", "86400"))  # Vertex corta los jobs a las 24 h
 
     # --- Idioma/plantillas ---
     default_language: str = os.getenv("DEFAULT_LANGUAGE", "es")
     prompts_dir: Path = Path(
         os.getenv("PROMPTS_DIR", Path(__file__).resolve().parent / "domain" / "prompts")
     )
+    # Recarga en caliente: cada cuántos segundos revisar el mtime de una plantilla (0 = siempre)
+    prompts_reload_interval: float = float(os.getenv("PROMPTS_RELOAD_INTERVAL", "2"))
+    # Compactación del transcript antes del prompt (src/domain/transcript_compaction.py):
+    # "off" | "light" | "standard" | "aggressive". El request puede pedir otra con `compaction`.
+    transcript_compaction: str = os.getenv("TRANSCRIPT_COMPACTION", "off").lower()
     
+    # --- Cola durable / workers (python -m src.worker) ---
+    job_queue_path: str = os.getenv("JOB_QUEUE_PATH", "/tmp/testimonios/jobs.sqlite3")
+    job_lease_seconds: float = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    worker_processes: int = int(os.getenv("WORKER_PROCESSES", "0"))  # 0 = vCPUs del contenedor
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", "1"))  # >1 = jobs async en vuelo por proceso
+
+    # --- Servidor HTTP multi-proceso (python -m src.serve) ---
+    web_workers: int = int(os.getenv("WEB_WORKERS", "1"))  # 0 = vCPUs del contenedor
+    serve_workers: int = int(os.getenv("SERVE_WORKERS", "1"))  # lo fijan src.serve / src.worker: procesos que se reparten cuota y memoria (no configurar)
+
+    # --- Cache compartido entre procesos (src/shared_cache.py) ---
+    shared_cache_path: str = os.getenv("SHARED_CACHE_PATH", "/tmp/testimonios/cache.sqlite3")  # vacío = desactivado
+    shared_cache_max_mb: float = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+    shared_cache_lease_s: float = float(os.getenv("SHARED_CACHE_LEASE_S", "300"))  # espera máx. al que calcula
+    # TTL por tipo de entrada (0 = no cachear ese tipo)
+    llm_cache_ttl_s: float = float(os.getenv("LLM_CACHE_TTL_S", "3600"))
+    transcript_cache_ttl_s: float = float(os.getenv("TRANSCRIPT_CACHE_TTL_S", "300"))
+    doc_meta_cache_ttl_s: float = float(os.getenv("DOC_META_CACHE_TTL_S", "300"))
+    idempotency_ttl_s: float = float(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+    # Escritura a medio aplicar (plan + texto + último lote): el reintento sigue desde ahí sin re-generar
+    write_checkpoint_ttl_s: float = float(os.getenv("WRITE_CHECKPOINT_TTL_S", "86400"))
+
+    # --- Memoria (src/memory_budget.py) ---
+    # Presupuesto por instancia (0 = sin límite), repartido entre los workers de src.serve:
+    # huella estimada = base + chars × 2 × factor de copias
+    memory_budget_mb: float = float(os.getenv("MEMORY_BUDGET_MB", "0"))
+    memory_budget_wait_s: float = float(os.getenv("MEMORY_BUDGET_WAIT_S", "30"))  # espera antes del 503
+    memory_copies_factor: float = float(os.getenv("MEMORY_COPIES_FACTOR", "10"))
+    memory_base_request_mb: float = float(os.getenv("MEMORY_BASE_REQUEST_MB", "8"))
+    memory_trace: bool = os.getenv("MEMORY_TRACE", "false").lower() in {"true", "1", "yes"}  # tracemalloc por etapa
+    raw_text_spool_kb: int = int(os.getenv("RAW_TEXT_SPOOL_KB", "512"))  # 0 = nunca a disco
+    spool_dir: str = os.getenv("SPOOL_DIR", "/tmp/testimonios/spool")
+
+    # --- Profiling bajo demanda (src/profiling.py, /admin/profiles) ---
+    # Sin ADMIN_TOKEN los endpoints /admin/* quedan deshabilitados y el header X-Profile se ignora.
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0..1 de /generate-testimony
+    profile_mode: str = os.getenv("PROFILE_MODE", "sample").lower()  # sample (collapsed stacks) | cprofile (pstats)
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    profile_dir: str = os.getenv("PROFILE_DIR", "/tmp/testimonios/profiles")
+    profile_keep: int = int(os.getenv("PROFILE_KEEP", "50"))
+
+    # --- Callbacks a Sheets por clave (src/clients/sheet_row_index.py) ---
+    sheet_index_batch_window_ms: float = float(os.getenv("SHEET_INDEX_BATCH_WINDOW_MS", "20"))  # junta búsquedas concurrentes
+    sheet_index_max_sheets: int = int(os.getenv("SHEET_INDEX_MAX_SHEETS", "64"))
+    sheet_index_miss_ttl_s: float = float(os.getenv("SHEET_INDEX_MISS_TTL_S", "10"))  # clave ausente: no se re-busca
+
+    # --- Scheduler: prioridad por clase y reparto por cliente (src/orchestration/scheduler.py) ---
+    sched_max_concurrent: int = int(os.getenv("SCHED_MAX_CONCURRENT", "0"))  # pipelines por proceso (0 = sin tope)
+    sched_weights: str = os.getenv("SCHED_WEIGHTS", "interactive=16,webhook=4,backfill=1")
+    # Hilos para las etapas de run() (src/orchestration/stages.py). 0 = auto: max(32, 4 × SCHED_MAX_CONCURRENT)
+    stage_pool_workers: int = int(os.getenv("STAGE_POOL_WORKERS", "0"))
+    # Cola durable: cada clase por debajo cuenta como llegada N s más tarde; cada job en curso del
+    # mismo tenant, M s más tarde (un backfill viejo termina pasando; un cliente no acapara workers)
+    sched_queue_aging_s: float = float(os.getenv("SCHED_QUEUE_AGING_S", "600"))
+    sched_tenant_penalty_s: float = float(os.getenv("SCHED_TENANT_PENALTY_S", "60"))
+    # Cuotas por instancia (0 = sin límite), repartidas entre los workers de src.serve
+    vertex_rpm: float = float(os.getenv("VERTEX_RPM", "0"))
+    docs_write_rpm: float = float(os.getenv("DOCS_WRITE_RPM", "0"))
+
+    # --- Deadline y cancelación (src/deadline.py) ---
+    # Presupuesto por defecto si el caller no manda X-Request-Timeout / timeout_s (0 = sin deadline).
+    # En Cloud Run conviene algo menor que el --timeout del servicio.
+    request_timeout_s: float = float(os.getenv("REQUEST_TIMEOUT_S", "0"))
+    disconnect_poll_s: float = float(os.getenv("DISCONNECT_POLL_S", "1"))  # cada cuánto se mira si el cliente sigue
+
     # --- Service Account / Auth ---
     service_account_email: str = os.getenv("SERVICE_ACCOUNT_EMAIL", "")
     # Solo LOCAL: ruta al JSON de la SA. En Cloud Run usa ADC (sin llaves).
     sa_credentials_path: Optional[str] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS") or None
 
+    # Health checks en background (src/health_probe.py): los endpoints leen el cache.
+    # La sonda de escritura gasta cuota de Docs: intervalo aparte (más largo).
+    healthcheck_doc_id: str = os.getenv("HEALTHCHECK_DOC_ID", "")
+    health_probe_enabled: bool = os.getenv("HEALTH_PROBE_ENABLED", "true").lower() in {"true", "1", "yes"}
+    health_probe_interval_s: float = float(os.getenv("HEALTH_PROBE_INTERVAL_S", "60"))
+    health_write_probe_interval_s: float = float(os.getenv("HEALTH_WRITE_PROBE_INTERVAL_S", "900"))
+
+    # Refresh proactivo del token compartido (hilo de fondo), N segundos antes de vencer
+    auth_background_refresh: bool = os.getenv("AUTH_BACKGROUND_REFRESH", "true").lower() in {"true", "1", "yes"}
+    auth_refresh_margin_s: float = float(os.getenv("AUTH_REFRESH_MARGIN_S", "300"))
+
     # --- Controles heredados ---
     # Nunca usar OAuth en prod: mantener false (se conserva solo por compatibilidad).
     use_oauth: bool = os.getenv("USE_OAUTH", "false").lower() in {"true", "1", "yes"}
@@ -66,6 +196,11 @@ class Settings(BaseModel):
     log_level: str = os.getenv("LOG_LEVEL", "INFO").upper()        # INFO | DEBUG | WARNING | ERROR
     log_format: str = os.getenv("LOG_FORMAT", "json").lower()      # json | text
     log_include_pii: bool = os.getenv("LOG_INCLUDE_PII", "false").lower() in {"true", "1", "yes"}
+    # Logging no bloqueante: los requests encolan y un hilo de fondo escribe a stdout.
+    log_async: bool = os.getenv("LOG_ASYNC", "true").lower() in {"true", "1", "yes"}
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Muestreo DEBUG por logger: "src.clients.gdocs_client=0.1,src.auth=0"
+    log_debug_sampling: str = os.getenv("LOG_DEBUG_SAMPLING", "")
 
     # --- Utilidades ---
     @property
@@ -91,6 +226,30 @@ class Settings(BaseModel):
             raise ValueError(f"LLM_BACKEND inválido: {v}. Usa uno de {allowed}")
         return v
 
+    @field_validator("docs_write_mode")
+    @classmethod
+    def _validate_write_mode(cls, v: str) -> str:
+        allowed = {"rewrite", "diff", "docx", "html"}
+        if v not in allowed:
+            raise ValueError(f"DOCS_WRITE_MODE inválido: {v}. Usa uno de {allowed}")
+        return v
+
+    @field_validator("batch_backend")
+    @classmethod
+    def _validate_batch_backend(cls, v: str) -> str:
+        allowed = {"vertex", "local"}
+        if v not in allowed:
+            raise ValueError(f"BATCH_BACKEND inválido: {v}. Usa uno de {allowed}")
+        return v
+
+    @field_validator("transcript_compaction")
+    @classmethod
+    def _validate_compaction(cls, v: str) -> str:
+        allowed = {"off", "light", "standard", "aggressive"}
+        if v not in allowed:
+            raise ValueError(f"TRANSCRIPT_COMPACTION inválido: {v}. Usa uno de {allowed}")
+        return v
+
     def sanity_warnings(self) -> list[str]:
         """
         Advertencias de configuración comunes (no detiene arranque).
@@ -118,6 +277,11 @@ class Settings(BaseModel):
                 "LLM_BACKEND=gemini_api pero GEMINI_API_KEY no está configurado. Para prod, preferir LLM_BACKEND=vertex."
             )
 
+        if self.llm_hedge_enabled and not (self.vertex_fallback_locations or self.vertex_fallback_models):
+            warnings.append(
+                "LLM_HEDGE_ENABLED=true sin VERTEX_FALLBACK_LOCATIONS/VERTEX_FALLBACK_MODELS: no hay candidato para el hedge."
+            )
+
         return warnings
 
 
@@ -0,0 +1,349 @@
+# src/shared_cache.py
+"""
+Cache compartido entre procesos de la misma instancia (SQLite en WAL, archivo local).
+
+Con varios workers (python -m src.serve, src.worker) los `lru_cache` de cada proceso
+no se ven entre sí: este store guarda lo que vale la pena compartir (respuestas del LLM,
+transcripts, metadata de Docs, registros de idempotencia, índice CAS de GCS, health checks).
+
+- Valores JSON con TTL por entrada; tope de tamaño total (SHARED_CACHE_MAX_MB): se desalojan
+  primero las entradas que vencen antes.
+- `get_or_compute`: single-flight entre procesos. El primero que falla el cache toma un lease
+  (SHARED_CACHE_LEASE_S) y calcula; los demás esperan su resultado en vez de repetir el trabajo.
+  Si el que calcula falla (o muere), el lease se suelta/vence y otro lo intenta.
+  Mientras `fn` corre, el lease se renueva cada SHARED_CACHE_LEASE_S/3 (como el heartbeat de
+  src/worker.py): un cálculo largo (p.ej. un request idempotente entero) no lo pierde.
+  La espera se corta con el deadline del request (src/deadline.py).
+- Nunca rompe un request: errores de SQLite se loggean y se calcula sin cache.
+- SHARED_CACHE_PATH vacío = desactivado (todo pasa directo a `fn`): sin single-flight, sin
+  idempotencia por request_id y sin checkpoints de escritura. Se avisa al crearlo.
+
+En Cloud Run /tmp vive en memoria: el tope de tamaño cuenta contra la memoria de la instancia.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterator, Union
+
+from src import metrics
+from src.deadline import check_deadline
+from src.logging_conf import get_logger
+from src.settings import get_settings
+
+logger = get_logger(__name__)
+
+_MB = 1024 * 1024
+_PURGE_EVERY = 64  # sets por proceso entre purgas
+_MISSING = object()
+_LEASED = object()
+
+Ttl = Union[float, Callable[[Any], float]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns         TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    ns         TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+"""
+
+
+def cache_key(*parts: Any) -> str:
+    """sha256 de las partes (prompts/transcripts largos como clave)."""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class SharedCache:
+    """
+    Una conexión por operación (como JobQueue): seguro entre hilos y procesos.
+    Las lecturas no escriben (sin "touch"), así que no serializan a los lectores.
+    """
+
+    def __init__(self, path: str, *, max_bytes: int, lease_s: float) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lease_s = lease_s
+        self._sets = 0
+        self.enabled = bool(path)
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._conn() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido desactivado (%s): %s", path, e)
+            self.enabled = False
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=10000")
+        conn.execute("PRAGMA synchronous=NORMAL")  # es un cache: no hace falta fsync por escritura
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---------- Operaciones básicas ----------
+
+    def _get(self, ns: str, key: str) -> Any:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE ns = ? AND key = ? AND expires_at > ?", (ns, key, time.time()),
+            ).fetchone()
+        return _MISSING if row is None else json.loads(row[0])
+
+    def get(self, ns: str, key: str, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        try:
+            value = self._get(ns, key)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido (get %s): %s", ns, e)
+            return default
+        metrics.incr(f"cache.{ns}.{'misses' if value is _MISSING else 'hits'}")
+        return default if value is _MISSING else value
+
+    def set(self, ns: str, key: str, value: Any, ttl_s: float) -> None:
+        if not self.enabled or ttl_s <= 0:
+            return
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (ns, key, value, size, expires_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (ns, key, payload, len(payload), now + ttl_s, now),
+                )
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido (set %s): %s", ns, e)
+            return
+        self._sets += 1
+        if self._sets % _PURGE_EVERY == 0:
+            self.purge()
+
+    def delete(self, ns: str, key: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido (delete %s): %s", ns, e)
+
+    def purge(self) -> int:
+        """Borra vencidos y, si el total supera SHARED_CACHE_MAX_MB, las entradas que vencen antes."""
+        if not self.enabled:
+            return 0
+        removed = 0
+        try:
+            with self._conn() as conn:
+                now = time.time()
+                removed += conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+                conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    evict = []
+                    for rowid, size in conn.execute("SELECT rowid, size FROM entries ORDER BY expires_at"):
+                        if total <= self.max_bytes:
+                            break
+                        evict.append((rowid,))
+                        total -= size
+                    conn.executemany("DELETE FROM entries WHERE rowid = ?", evict)
+                    removed += len(evict)
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido (purge): %s", e)
+        return removed
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        if not self.enabled:
+            return {}
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT ns, COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE expires_at > ? GROUP BY ns",
+                (time.time(),),
+            ).fetchall()
+        return {ns: {"entries": n, "mb": round(size / _MB, 2)} for ns, n, size in rows}
+
+    # ---------- Leases (single-flight entre procesos) ----------
+
+    def _try_lease(self, ns: str, key: str, owner: str) -> bool:
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT expires_at FROM leases WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+                if row is not None and row[0] > now:
+                    return False
+                conn.execute("INSERT OR REPLACE INTO leases (ns, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+                             (ns, key, owner, now + self.lease_s))
+                return True
+            finally:
+                conn.execute("COMMIT")
+
+    def _renew(self, ns: str, key: str, owner: str) -> bool:
+        """Extiende el lease. False si ya no es de este owner (venció y lo tomó otro)."""
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE leases SET expires_at = ? WHERE ns = ? AND key = ? AND owner = ?",
+                               (time.time() + self.lease_s, ns, key, owner))
+        return cur.rowcount == 1
+
+    def _release(self, ns: str, key: str, owner: str) -> None:
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM leases WHERE ns = ? AND key = ? AND owner = ?", (ns, key, owner))
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Cache compartido (release %s): %s", ns, e)
+
+    def _claim(self, ns: str, key: str, owner: str) -> Any:
+        """Valor cacheado; _LEASED si este caller tomó el lease y debe calcular; _MISSING = seguir esperando."""
+        value = self._get(ns, key)
+        if value is not _MISSING:
+            return value
+        if self._try_lease(ns, key, owner):
+            return _LEASED
+        return _MISSING
+
+    def get_or_compute(self, ns: str, key: str, fn: Callable[[], Any], *, ttl_s: Ttl) -> Any:
+        """`ttl_s` puede ser una función del valor (p.ej. TTL corto para un health check fallido); 0 = sin cache."""
+        if not self.enabled or (not callable(ttl_s) and ttl_s <= 0):
+            return fn()
+        owner = uuid.uuid4().hex
+        delay = 0.05
+        waited = False
+        while True:
+            try:
+                claim = self._claim(ns, key, owner)
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Cache compartido (%s): %s", ns, e)
+                return fn()
+            if claim is _MISSING:
+                if not waited:
+                    waited = True
+                    metrics.incr(f"cache.{ns}.waits")
+                check_deadline(f"esperando cache {ns}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            if claim is not _LEASED:
+                metrics.incr(f"cache.{ns}.hits")
+                return claim
+            metrics.incr(f"cache.{ns}.misses")
+            hb = _LeaseHeartbeat(self, ns, key, owner)
+            hb.start()
+            try:
+                value = fn()
+                self.set(ns, key, value, ttl_s(value) if callable(ttl_s) else ttl_s)
+                return value
+            finally:
+                hb.stop()
+                self._release(ns, key, owner)
+
+    async def aget_or_compute(self, ns: str, key: str, fn: Callable[[], Awaitable[Any]], *, ttl_s: Ttl) -> Any:
+        """Como get_or_compute; SQLite corre fuera del event loop y la espera no lo bloquea."""
+        if not self.enabled or (not callable(ttl_s) and ttl_s <= 0):
+            return await fn()
+        owner = uuid.uuid4().hex
+        delay = 0.05
+        waited = False
+        while True:
+            try:
+                claim = await asyncio.to_thread(self._claim, ns, key, owner)
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Cache compartido (%s): %s", ns, e)
+                return await fn()
+            if claim is _MISSING:
+                if not waited:
+                    waited = True
+                    metrics.incr(f"cache.{ns}.waits")
+                check_deadline(f"esperando cache {ns}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            if claim is not _LEASED:
+                metrics.incr(f"cache.{ns}.hits")
+                return claim
+            metrics.incr(f"cache.{ns}.misses")
+            hb = asyncio.create_task(self._arenew_loop(ns, key, owner))
+            try:
+                value = await fn()
+                await asyncio.to_thread(self.set, ns, key, value, ttl_s(value) if callable(ttl_s) else ttl_s)
+                return value
+            finally:
+                hb.cancel()
+                await asyncio.to_thread(self._release, ns, key, owner)
+
+    async def _arenew_loop(self, ns: str, key: str, owner: str) -> None:
+        interval = max(1.0, self.lease_s / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await asyncio.to_thread(self._renew, ns, key, owner):
+                    _lease_lost(ns)
+                    return
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Cache compartido (renovar lease %s): %s", ns, e)
+
+
+def _lease_lost(ns: str) -> None:
+    metrics.incr(f"cache.{ns}.lease_lost")
+    logger.warning("⚠️ Lease de cache %s perdido mientras se calculaba: otro proceso puede repetir el trabajo.", ns)
+
+
+class _LeaseHeartbeat(threading.Thread):
+    """Renueva el lease de get_or_compute mientras `fn` corre (como worker._Heartbeat con los jobs)."""
+
+    def __init__(self, cache: SharedCache, ns: str, key: str, owner: str) -> None:
+        super().__init__(name=f"lease-{ns}", daemon=True)
+        self._cache, self._ns, self._key, self._owner = cache, ns, key, owner
+        self._stop_evt = threading.Event()
+
+    def run(self) -> None:
+        interval = max(1.0, self._cache.lease_s / 3)
+        while not self._stop_evt.wait(interval):
+            try:
+                if not self._cache._renew(self._ns, self._key, self._owner):
+                    _lease_lost(self._ns)
+                    return
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Cache compartido (renovar lease %s): %s", self._ns, e)
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+
+@lru_cache(maxsize=1)
+def get_shared_cache() -> SharedCache:
+    s = get_settings()
+    cache = SharedCache(s.shared_cache_path, max_bytes=int(s.shared_cache_max_mb * _MB), lease_s=s.shared_cache_lease_s)
+    if not cache.enabled:
+        logger.warning("⚠️ Cache compartido desactivado (SHARED_CACHE_PATH vacío o inválido): request_id no "
+                       "deduplica reintentos, no hay single-flight entre procesos ni escrituras reanudables.")
+    return cache
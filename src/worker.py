@@ -0,0 +1,292 @@
+# src/worker.py
+"""
+Worker multi-proceso: consume jobs de la cola durable (src/orchestration/job_queue.py)
+y ejecuta `run_testimony` en cada uno.
+
+    python -m src.worker --processes 4 --queue /var/tmp/testimonios_jobs.sqlite3
+    python -m src.worker --processes 2 --concurrency 100   # jobs async en vuelo por proceso
+
+- Cada proceso calienta sus propios clientes (Docs/Drive/Sheets/Vertex) una vez.
+- VERTEX_RPM / DOCS_WRITE_RPM / MEMORY_BUDGET_MB son por instancia: se reparten entre los procesos.
+- Heartbeat en hilo aparte mientras el job corre; si el proceso muere, el lease
+  vence y el job vuelve a la cola.
+- SIGTERM/SIGINT: cada proceso termina el job en curso y sale.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from src.logging_conf import bootstrap_logging_from_env, get_logger
+from src.settings import get_settings
+from src.serve import available_cpus
+
+logger = get_logger(__name__)
+
+
+def _job_payload(job) -> Dict[str, Any]:
+    # Jobs encolados sin `priority` en el payload corren con la clase con la que se encolaron
+    return {**job.payload, "priority": job.payload.get("priority") or job.priority}
+
+
+def _run_job(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Despacha un job según su tipo."""
+    from src.domain.schemas import TestimonyRequest
+    from src.orchestration.runner import run_testimony
+
+    if kind == "testimony":
+        return run_testimony(TestimonyRequest(**payload))
+    raise ValueError(f"Tipo de job desconocido: {kind}")
+
+
+async def _arun_job(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Como _run_job, pero con el runner asyncio (I/O Google vía httpx)."""
+    from src.domain.schemas import TestimonyRequest
+    from src.orchestration.runner import arun_testimony
+
+    if kind == "testimony":
+        return await arun_testimony(TestimonyRequest(**payload))
+    raise ValueError(f"Tipo de job desconocido: {kind}")
+
+
+def _is_permanent(e: Exception) -> bool:
+    """
+    Errores 4xx (fuente ausente, sin acceso, etc.) no se reintentan; 408/429/5xx y errores sin
+    status sí. El 409 de un conflicto de revisión en Docs (con la causa de Google encadenada,
+    ver runner._map_google_http_error) también: el reintento reanuda desde el checkpoint.
+    """
+    status = getattr(e, "status_code", None)
+    if not (isinstance(status, int) and 400 <= status < 500) or status in (408, 429):
+        return False
+    # El 409 de idempotencia (request_id con otro payload) no trae causa: ese sí es definitivo
+    return not (status == 409 and e.__cause__ is not None)
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, queue, job_id: str, worker_id: str, lease_s: float) -> None:
+        super().__init__(name=f"heartbeat-{job_id}", daemon=True)
+        self._queue = queue
+        self._job_id = job_id
+        self._worker_id = worker_id
+        self._lease_s = lease_s
+        self._stop_evt = threading.Event()
+        self.lost = False
+
+    def run(self) -> None:
+        interval = max(1.0, self._lease_s / 3)
+        while not self._stop_evt.wait(interval):
+            try:
+                if not self._queue.heartbeat(self._job_id, self._worker_id, self._lease_s):
+                    self.lost = True
+                    logger.warning("⚠️ Lease perdido para job %s", self._job_id)
+                    return
+            except Exception as e:
+                logger.warning("Heartbeat falló para job %s: %s", self._job_id, e)
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+
+def _warm_clients() -> None:
+    from src.auth import get_all_clients, start_credential_refresher
+    from src.domain.prompt_loader import get_prompt_registry
+    from src.memory_budget import start_memory_tracing
+
+    start_memory_tracing()
+    try:
+        get_all_clients()
+        start_credential_refresher()
+        get_prompt_registry(str(get_settings().prompts_dir))
+    except Exception as e:
+        # No es fatal: el primer job reintentará la inicialización
+        logger.warning("No se pudieron calentar los clientes: %s", e)
+
+
+def worker_loop(worker_id: str, queue_path: str, lease_s: float, poll_s: float,
+                stop: Optional[Any] = None, max_jobs: Optional[int] = None) -> int:
+    """Bucle de un proceso worker. Devuelve cuántos jobs procesó."""
+    from src.orchestration.job_queue import get_job_queue
+    from src.orchestration.stages import drain_background
+
+    queue = get_job_queue(queue_path)
+    _warm_clients()
+    logger.info("👷 Worker %s listo (cola=%s)", worker_id, queue_path)
+
+    processed = 0
+    while not (stop is not None and stop.is_set()):
+        if max_jobs is not None and processed >= max_jobs:
+            break
+        job = queue.lease(worker_id, lease_s)
+        if job is None:
+            time.sleep(poll_s)
+            continue
+
+        logger.info("▶️ Job %s (intento %s/%s)", job.id, job.attempts, job.max_attempts,
+                    extra={"job_id": job.id, "case_id": job.payload.get("case_id")})
+        hb = _Heartbeat(queue, job.id, worker_id, lease_s)
+        hb.start()
+        t0 = time.perf_counter()
+        try:
+            result = _run_job(job.kind, _job_payload(job))
+        except Exception as e:
+            hb.stop()
+            detail = getattr(e, "detail", None) or str(e)
+            status = queue.fail(job.id, worker_id, detail, retry=not _is_permanent(e))
+            if status is None:
+                logger.warning("⚠️ Job %s falló pero el lease ya no era de este worker: %s", job.id, detail)
+            else:
+                logger.error("❌ Job %s falló (%s): %s", job.id, status, detail, extra={"job_id": job.id})
+        else:
+            hb.stop()
+            if hb.lost or not queue.complete(job.id, worker_id, result):
+                logger.warning("⚠️ Job %s terminó pero el lease ya no era de este worker.", job.id)
+            else:
+                logger.info("✅ Job %s listo en %.1fs", job.id, time.perf_counter() - t0,
+                            extra={"job_id": job.id})
+        processed += 1
+
+    drain_background()  # callbacks a Sheets aún en vuelo
+    logger.info("👋 Worker %s detenido (%s jobs).", worker_id, processed)
+    return processed
+
+
+async def _async_heartbeat(queue, job_id: str, worker_id: str, lease_s: float) -> None:
+    interval = max(1.0, lease_s / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id, lease_s):
+                logger.warning("⚠️ Lease perdido para job %s", job_id)
+                return
+        except Exception as e:
+            logger.warning("Heartbeat falló para job %s: %s", job_id, e)
+
+
+async def _async_process_job(queue, job, worker_id: str, lease_s: float) -> None:
+    logger.info("▶️ Job %s (intento %s/%s)", job.id, job.attempts, job.max_attempts,
+                extra={"job_id": job.id, "case_id": job.payload.get("case_id")})
+    hb = asyncio.create_task(_async_heartbeat(queue, job.id, worker_id, lease_s))
+    t0 = time.perf_counter()
+    try:
+        result = await _arun_job(job.kind, _job_payload(job))
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e)
+        status = await asyncio.to_thread(queue.fail, job.id, worker_id, detail, retry=not _is_permanent(e))
+        if status is None:
+            logger.warning("⚠️ Job %s falló pero el lease ya no era de este worker: %s", job.id, detail)
+        else:
+            logger.error("❌ Job %s falló (%s): %s", job.id, status, detail, extra={"job_id": job.id})
+    else:
+        if not await asyncio.to_thread(queue.complete, job.id, worker_id, result):
+            logger.warning("⚠️ Job %s terminó pero el lease ya no era de este worker.", job.id)
+        else:
+            logger.info("✅ Job %s listo en %.1fs", job.id, time.perf_counter() - t0, extra={"job_id": job.id})
+    finally:
+        hb.cancel()
+
+
+async def async_worker_loop(worker_id: str, queue_path: str, lease_s: float, poll_s: float,
+                            concurrency: int, stop: Optional[Any] = None) -> int:
+    """
+    Un proceso, hasta `concurrency` jobs en vuelo en un solo event loop (arun_testimony).
+    Los jobs pasan casi todo el tiempo esperando I/O: no hace falta un hilo por job.
+    """
+    from src.clients.google_async import close_async_google_client
+    from src.orchestration.job_queue import get_job_queue
+    from src.orchestration.stages import adrain_background
+
+    queue = get_job_queue(queue_path)
+    await asyncio.to_thread(_warm_clients)
+    logger.info("👷 Worker %s listo (async, concurrencia=%s, cola=%s)", worker_id, concurrency, queue_path)
+
+    slots = asyncio.Semaphore(concurrency)
+    inflight: set = set()
+    processed = 0
+    while not (stop is not None and stop.is_set()):
+        await slots.acquire()
+        job = await asyncio.to_thread(queue.lease, worker_id, lease_s)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(poll_s)
+            continue
+        task = asyncio.create_task(_async_process_job(queue, job, worker_id, lease_s))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+        task.add_done_callback(lambda _t: slots.release())
+        processed += 1
+
+    if inflight:
+        logger.info("⏳ Esperando %s jobs en curso...", len(inflight))
+        await asyncio.gather(*inflight, return_exceptions=True)
+    await adrain_background()  # usan el cliente async: antes de cerrarlo
+    await close_async_google_client()
+    logger.info("👋 Worker %s detenido (%s jobs).", worker_id, processed)
+    return processed
+
+
+def _child_main(index: int, queue_path: str, lease_s: float, poll_s: float, stop, concurrency: int = 1) -> None:
+    bootstrap_logging_from_env()
+    # El padre maneja las señales; el hijo solo deja de tomar jobs cuando `stop` se activa.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    if concurrency > 1:
+        asyncio.run(async_worker_loop(worker_id, queue_path, lease_s, poll_s, concurrency, stop))
+    else:
+        worker_loop(worker_id, queue_path, lease_s, poll_s, stop)
+
+
+def main(argv: Optional[list] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(prog="python -m src.worker", description="Worker de testimonios (cola durable).")
+    parser.add_argument("--processes", type=int, default=settings.worker_processes or available_cpus())
+    parser.add_argument("--queue", default=settings.job_queue_path, help="Ruta del archivo SQLite de la cola.")
+    parser.add_argument("--lease-seconds", type=float, default=settings.job_lease_seconds)
+    parser.add_argument("--poll-seconds", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency,
+                        help="Jobs en vuelo por proceso (>1 usa el runner asyncio).")
+    args = parser.parse_args(argv)
+
+    bootstrap_logging_from_env()
+    processes = max(1, args.processes)
+    # Los hijos heredan el entorno (como en src.serve): cuota y memoria de la instancia por proceso
+    os.environ["SERVE_WORKERS"] = str(processes)
+    ctx = mp.get_context("spawn")  # clientes Google/gRPC no sobreviven a fork
+    stop = ctx.Event()
+
+    def _spawn(i: int):
+        p = ctx.Process(target=_child_main, args=(i, args.queue, args.lease_seconds, args.poll_seconds, stop, args.concurrency),
+                        name=f"testimonios-worker-{i}")
+        p.start()
+        return p
+
+    procs = {i: _spawn(i) for i in range(processes)}
+    logger.info("🚀 %s procesos worker iniciados (cola=%s).", len(procs), args.queue)
+
+    def _shutdown(*_):
+        logger.info("🛑 Deteniendo workers (terminan el job en curso)...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    while not stop.is_set():
+        time.sleep(1.0)
+        for i, p in list(procs.items()):
+            if not p.is_alive() and not stop.is_set():
+                logger.warning("💥 Worker %s salió (code=%s); reiniciando.", i, p.exitcode)
+                procs[i] = _spawn(i)
+
+    for p in procs.values():
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""
+Entorno de las pruebas: nada toca Google ni /tmp/testimonios.
+
+Los defaults de src/settings.py se leen del entorno al importar: por eso el entorno se fija
+aquí, antes de que cualquier prueba importe `src`. El cache compartido (SQLite) es uno nuevo
+por prueba.
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="testimonios-tests-")
+os.environ.update(
+    SHARED_CACHE_PATH=os.path.join(_TMP, "cache.sqlite3"),
+    JOB_QUEUE_PATH=os.path.join(_TMP, "jobs.sqlite3"),
+    HEALTH_PROBE_ENABLED="false",
+    LOG_FORMAT="text",
+    LOG_ASYNC="false",
+    SCHED_MAX_CONCURRENT="0",
+    VERTEX_RPM="0",
+    DOCS_WRITE_RPM="0",
+)
+
+import pytest  # noqa: E402
+
+from src.settings import get_settings  # noqa: E402
+from src.shared_cache import get_shared_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "shared_cache_path", str(tmp_path / "cache.sqlite3"))
+    get_shared_cache.cache_clear()
+    yield get_shared_cache()
+    get_shared_cache.cache_clear()
@@ -0,0 +1,187 @@
+# tests/fake_docs.py
+"""
+Google Doc en memoria para probar las escrituras de src/clients/gdocs_client.py sin la API.
+
+Aplica el subset de requests que generan los planes (insertText, deleteContentRange,
+update*Style, create/deleteParagraphBullets), devuelve el documento con la forma de
+`documents.get` y valida `writeControl.requiredRevisionId` como Docs: con otra revisión el
+batchUpdate falla con 400 FAILED_PRECONDITION.
+"""
+from __future__ import annotations
+
+import copy
+import itertools
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def revision_conflict() -> HttpError:
+    body = {"error": {"code": 400, "message": "The required revision id does not match",
+                      "status": "FAILED_PRECONDITION"}}
+    return HttpError(httplib2.Response({"status": 400}), json.dumps(body).encode())
+
+
+class FakeDoc:
+    """Cuerpo del Doc como lista de [char, textStyle, paragraphStyle (solo en los \\n)]."""
+
+    def __init__(self) -> None:
+        self.chars: List[list] = [["\n", {}, {"namedStyleType": "NORMAL_TEXT"}]]
+        self.lists: Dict[str, str] = {}
+        self.rev = 0
+        self._ids = itertools.count()
+
+    # ----- estructura -----
+
+    def text(self) -> str:
+        return "".join(c[0] for c in self.chars)
+
+    def _paragraphs(self) -> List[tuple]:
+        out, start = [], 0
+        for i, entry in enumerate(self.chars):
+            if entry[0] == "\n":
+                out.append((start, i))
+                start = i + 1
+        return out
+
+    def _newlines_in(self, start: int, end: int) -> List[int]:
+        return [pe for ps, pe in self._paragraphs() if ps < end - 1 and pe >= start - 1]
+
+    # ----- requests -----
+
+    def _insert(self, index: int, text: str) -> None:
+        pos = index - 1
+        prev = self.chars[pos - 1] if pos > 0 and self.chars[pos - 1][0] != "\n" else self.chars[pos]
+        para_end = pos
+        while self.chars[para_end][0] != "\n":
+            para_end += 1
+        pstyle = self.chars[para_end][2]
+        new = []
+        for ch in text:
+            entry = [ch, dict(prev[1])]
+            if ch == "\n":
+                entry.append(copy.deepcopy(pstyle))
+            new.append(entry)
+        self.chars[pos:pos] = new
+
+    def apply(self, request: Dict[str, Any]) -> None:
+        kind, body = next(iter(request.items()))
+        if kind == "insertText":
+            self._insert(body["location"]["index"], body["text"])
+            return
+        start, end = body["range"]["startIndex"], body["range"]["endIndex"]
+        assert 1 <= start < end <= len(self.chars), (kind, start, end, len(self.chars))
+        if kind == "deleteContentRange":
+            del self.chars[start - 1:end - 1]
+        elif kind == "updateTextStyle":
+            for entry in self.chars[start - 1:end - 1]:
+                for f in body["fields"].split(","):
+                    if f in body["textStyle"]:
+                        entry[1][f] = body["textStyle"][f]
+                    else:
+                        entry[1].pop(f, None)
+        elif kind == "updateParagraphStyle":
+            for pe in self._newlines_in(start, end):
+                for f in body["fields"].split(","):
+                    if f in body["paragraphStyle"]:
+                        self.chars[pe][2][f] = body["paragraphStyle"][f]
+                    else:
+                        self.chars[pe][2].pop(f, None)
+        elif kind == "createParagraphBullets":
+            list_id = f"l{next(self._ids)}"
+            self.lists[list_id] = body["bulletPreset"]
+            for pe in self._newlines_in(start, end):
+                self.chars[pe][2]["_bullet"] = list_id
+        elif kind == "deleteParagraphBullets":
+            for pe in self._newlines_in(start, end):
+                self.chars[pe][2].pop("_bullet", None)
+        else:
+            raise ValueError(f"Request no soportado por FakeDoc: {kind}")
+
+    # ----- lectura (forma de documents.get) -----
+
+    def get(self) -> Dict[str, Any]:
+        content: List[Dict[str, Any]] = [{"endIndex": 1, "sectionBreak": {}}]
+        for ps, pe in self._paragraphs():
+            elements, i = [], ps
+            while i <= pe:
+                j = i
+                while j + 1 <= pe and self.chars[j + 1][1] == self.chars[i][1]:
+                    j += 1
+                elements.append({"startIndex": i + 1, "endIndex": j + 2,
+                                 "textRun": {"content": "".join(c[0] for c in self.chars[i:j + 1]),
+                                             "textStyle": dict(self.chars[i][1])}})
+                i = j + 1
+            style = self.chars[pe][2]
+            para: Dict[str, Any] = {"elements": elements,
+                                    "paragraphStyle": {k: v for k, v in style.items() if not k.startswith("_")}}
+            if "_bullet" in style:
+                para["bullet"] = {"listId": style["_bullet"]}
+            content.append({"startIndex": ps + 1, "endIndex": pe + 2, "paragraph": para})
+        lists = {lid: {"listProperties": {"nestingLevels": [
+            {"glyphType": "DECIMAL"} if "NUMBERED" in preset else {"glyphSymbol": "●"}]}}
+            for lid, preset in self.lists.items()}
+        return {"body": {"content": content}, "lists": lists, "revisionId": f"r{self.rev}"}
+
+
+class _Call:
+    def __init__(self, fn: Callable[[], Any]) -> None:
+        self._fn = fn
+
+    def execute(self, num_retries: int = 0) -> Any:
+        return self._fn()
+
+
+class FakeDocsService:
+    """
+    Lo que build_docs_client() devuelve, sobre un FakeDoc.
+    `before_batch(n)` corre antes del batchUpdate n (1, 2…): para cortar la escritura o editar el Doc.
+    """
+
+    def __init__(self, doc: FakeDoc, before_batch: Optional[Callable[[int], None]] = None) -> None:
+        self.doc = doc
+        self.before_batch = before_batch
+        self.batches: List[List[Dict[str, Any]]] = []
+        self.gets = 0
+
+    def documents(self) -> "FakeDocsService":
+        return self
+
+    def get(self, documentId: str) -> _Call:
+        def _get() -> Dict[str, Any]:
+            self.gets += 1
+            return self.doc.get()
+        return _Call(_get)
+
+    def batchUpdate(self, documentId: str, body: Dict[str, Any]) -> _Call:
+        def _run() -> Dict[str, Any]:
+            if self.before_batch is not None:
+                self.before_batch(len(self.batches) + 1)
+            required = (body.get("writeControl") or {}).get("requiredRevisionId")
+            if required and required != f"r{self.doc.rev}":
+                raise revision_conflict()
+            for request in body["requests"]:
+                self.doc.apply(request)
+            self.doc.rev += 1
+            self.batches.append(body["requests"])
+            return {"writeControl": {"requiredRevisionId": f"r{self.doc.rev}"}}
+        return _Call(_run)
+
+
+class FakeAsyncGoogleClient:
+    """Lo que get_async_google_client() devuelve para las escrituras a Docs, sobre el mismo FakeDocsService."""
+
+    def __init__(self, service: FakeDocsService) -> None:
+        self.service = service
+
+    async def documents_get(self, document_id: str, *, fields: Optional[str] = None) -> Dict[str, Any]:
+        return self.service.get(document_id).execute()
+
+    async def documents_batch_update(self, document_id: str, requests: List[Dict[str, Any]], *,
+                                     required_revision_id: Optional[str] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"requests": requests}
+        if required_revision_id:
+            body["writeControl"] = {"requiredRevisionId": required_revision_id}
+        return self.service.batchUpdate(document_id, body).execute()
@@ -0,0 +1,142 @@
+# tests/test_backfill.py
+"""Backfill con batch prediction (run_batch_backfill) sobre LocalBatchBackend, sin Google ni Vertex."""
+import json
+
+import pytest
+
+from src.backfill import BackfillRow, Checkpoint, run_batch_backfill
+from src.clients.vertex_batch import LocalBatchBackend
+
+
+def _row(n: int, case_id: str) -> BackfillRow:
+    return BackfillRow(key=f"{n}:{case_id}", row_number=n,
+                       values={"case_id": case_id, "transcription_doc_id": f"SRC-{case_id}",
+                               "output_doc_id": f"OUT-{case_id}"})
+
+
+ROWS = [_row(2, "C-1"), _row(3, "C-2"), _row(4, "C-3")]
+
+
+def _prompts(req):
+    """C-2 pide dos salidas (principal + una de `outputs`): dos líneas del JSONL, #0 y #1."""
+    if req.case_id == "C-3" and "rompe" in req.transcription_doc_id:
+        raise RuntimeError("fuente ilegible")
+    prompts = [f"prompt {req.case_id}"]
+    if req.case_id == "C-2":
+        prompts.append(f"prompt {req.case_id} en")
+    return prompts
+
+
+class _Runner:
+    def __init__(self):
+        self.calls = {}
+
+    def __call__(self, req, *, generated):
+        self.calls[req.case_id] = [g.text for g in generated]
+        return {"output_doc_link": f"https://docs/{req.output_doc_id}"}
+
+
+class _Backend(LocalBatchBackend):
+    """Local + registro de envíos; `timeout=True` simula un corte mientras se espera el job."""
+
+    def __init__(self, workdir, generate=lambda p: f"texto de {p}", timeout=False):
+        super().__init__(workdir, generate=generate, model="modelo-batch")
+        self.submitted = []
+        self.timeout = timeout
+
+    def submit(self, input_path, run_id):
+        job = super().submit(input_path, run_id)
+        self.submitted.append(job.name)
+        return job
+
+    def wait(self, job, *, poll_s, max_wait_s):
+        if self.timeout:
+            raise TimeoutError(f"El job {job.name} sigue en curso.")
+        return super().wait(job, poll_s=poll_s, max_wait_s=max_wait_s)
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return Checkpoint(str(tmp_path / "ckpt.jsonl"))
+
+
+def _records(checkpoint):
+    with open(checkpoint.path, encoding="utf-8") as fh:
+        return {rec["key"]: rec for rec in map(json.loads, fh)}
+
+
+def test_each_row_gets_its_outputs_in_order(tmp_path, checkpoint):
+    runner, backend = _Runner(), _Backend(str(tmp_path))
+
+    summary = run_batch_backfill(ROWS, checkpoint=checkpoint, workdir=str(tmp_path / "batch"), backend=backend,
+                                 runner=runner, prompt_builder=_prompts)
+
+    assert summary == {"total": 3, "ok": 3, "failed": 0, "skipped": 0, "batch_job": backend.submitted[0]}
+    assert runner.calls == {
+        "C-1": ["texto de prompt C-1"],
+        "C-2": ["texto de prompt C-2", "texto de prompt C-2 en"],
+        "C-3": ["texto de prompt C-3"],
+    }
+    records = _records(checkpoint)
+    assert {k: r["status"] for k, r in records.items()} == {"2:C-1": "done", "3:C-2": "done", "4:C-3": "done"}
+    assert records["3:C-2"]["doc_link"] == "https://docs/OUT-C-2"
+
+
+def test_rows_without_prompt_are_failed_and_left_out_of_the_job(tmp_path, checkpoint):
+    rows = [*ROWS[:2], BackfillRow("4:C-3", 4, {**ROWS[2].values, "transcription_doc_id": "rompe"})]
+    runner, backend = _Runner(), _Backend(str(tmp_path))
+
+    summary = run_batch_backfill(rows, checkpoint=checkpoint, workdir=str(tmp_path / "batch"), backend=backend,
+                                 runner=runner, prompt_builder=_prompts)
+
+    assert (summary["ok"], summary["failed"]) == (2, 1)
+    assert set(runner.calls) == {"C-1", "C-2"}
+    keys = [json.loads(line)["key"] for line in (tmp_path / "batch" / "input.jsonl").read_text().splitlines()]
+    assert sorted(keys) == ["2:C-1#0", "3:C-2#0", "3:C-2#1"]
+    assert "fuente ilegible" in _records(checkpoint)["4:C-3"]["error"]
+
+
+def test_a_failed_output_fails_the_whole_row(tmp_path, checkpoint):
+    def _generate(prompt):
+        if prompt.endswith(" en"):
+            raise RuntimeError("bloqueado por seguridad")
+        return f"texto de {prompt}"
+
+    runner, backend = _Runner(), _Backend(str(tmp_path), generate=_generate)
+
+    summary = run_batch_backfill(ROWS, checkpoint=checkpoint, workdir=str(tmp_path / "batch"), backend=backend,
+                                 runner=runner, prompt_builder=_prompts)
+
+    assert (summary["ok"], summary["failed"]) == (2, 1)
+    assert "C-2" not in runner.calls
+    assert "bloqueado por seguridad" in _records(checkpoint)["3:C-2"]["error"]
+
+
+def test_done_rows_are_skipped_on_the_next_run(tmp_path, checkpoint):
+    checkpoint.record("2:C-1", "done")
+    runner, backend = _Runner(), _Backend(str(tmp_path))
+
+    summary = run_batch_backfill(ROWS, checkpoint=checkpoint, workdir=str(tmp_path / "batch"), backend=backend,
+                                 runner=runner, prompt_builder=_prompts)
+
+    assert (summary["total"], summary["skipped"]) == (2, 1)
+    assert set(runner.calls) == {"C-2", "C-3"}
+
+
+def test_a_submitted_job_is_resumed_without_rendering_again(tmp_path, checkpoint):
+    workdir = str(tmp_path / "batch")
+    cut = _Backend(str(tmp_path), timeout=True)
+    with pytest.raises(TimeoutError):
+        run_batch_backfill(ROWS, checkpoint=checkpoint, workdir=workdir, backend=cut,
+                           runner=_Runner(), prompt_builder=_prompts)
+
+    def _no_prompts(req):
+        raise AssertionError("al retomar no se vuelven a renderizar prompts")
+
+    runner, backend = _Runner(), _Backend(str(tmp_path))
+    summary = run_batch_backfill(ROWS, checkpoint=checkpoint, workdir=workdir, backend=backend,
+                                 job_name=cut.submitted[0], runner=runner, prompt_builder=_no_prompts)
+
+    assert summary["ok"] == 3 and summary["batch_job"] == cut.submitted[0]
+    assert backend.submitted == []
+    assert runner.calls["C-2"] == ["texto de prompt C-2", "texto de prompt C-2 en"]
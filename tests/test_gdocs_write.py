@@ -0,0 +1,207 @@
+# tests/test_gdocs_write.py
+"""Escritura Markdown → Google Doc: plan de diff, reescritura, checkpoints y conflictos de revisión."""
+import asyncio
+
+import pytest
+
+import src.clients.gdocs_client as gdocs
+import src.clients.google_async as google_async
+from tests.fake_docs import FakeAsyncGoogleClient, FakeDoc, FakeDocsService
+
+BASE = """# Título **uno**
+
+Párrafo con **negrita** y *cursiva* y [link](http://x) fin.
+
+- item a
+- item **b**
+- item c
+
+1. uno
+2. dos
+
+---
+```
+code line
+```
+Último párrafo."""
+
+# ~600 requests: más de un lote de BATCH_LIMIT
+LONG = "\n\n".join(f"Párrafo **{i}** del testimonio." for i in range(300))
+
+
+class _Cut(Exception):
+    """Corte de la escritura a mitad (instancia reciclada, deadline): no se reintenta."""
+
+
+def _cut_at(batch: int):
+    def _before(n: int) -> None:
+        if n == batch:
+            raise _Cut()
+    return _before
+
+
+@pytest.fixture(autouse=True)
+def _no_pause(monkeypatch):
+    monkeypatch.setattr(gdocs.time, "sleep", lambda s: None)
+
+
+def _use(monkeypatch, service: FakeDocsService) -> FakeDocsService:
+    monkeypatch.setattr(gdocs, "build_docs_client", lambda: service)
+    return service
+
+
+def _written(markdown: str) -> FakeDoc:
+    """El Doc que deja una reescritura desde cero: la referencia de cada escenario."""
+    doc = FakeDoc()
+    service = FakeDocsService(doc)
+    steps = gdocs._write_steps("ref", markdown, "rewrite", None)
+    original = gdocs.build_docs_client
+    gdocs.build_docs_client = lambda: service
+    try:
+        gdocs._run_write_steps(steps, "ref", None)
+    finally:
+        gdocs.build_docs_client = original
+    return doc
+
+
+def _blocks(doc: FakeDoc):
+    """Párrafos con sus estilos y tipo de lista (sin los listId, que cambian en cada escritura)."""
+    blocks, _ = gdocs._read_doc_blocks(doc.get())
+    return [b.paras for b in blocks]
+
+
+@pytest.mark.parametrize("edited", [
+    BASE.replace("item **b**", "item *b*"),
+    BASE.replace("Párrafo con", "Párrafo nuevo con"),
+    BASE.replace("- item c\n", ""),
+    "Intro nueva\n" + BASE + "\nextra final",
+    BASE.replace("# Título", "## Título"),
+    BASE.replace("1. uno\n2. dos", "- uno\n- dos"),
+    "",
+])
+def test_diff_leaves_the_same_doc_as_a_rewrite(monkeypatch, edited):
+    doc = FakeDoc()
+    _use(monkeypatch, FakeDocsService(doc))
+    gdocs.write_markdown_to_document("d", BASE)
+    stats = gdocs.write_markdown_to_document("d", edited, mode="diff")
+
+    assert stats["mode"] == "diff"
+    assert doc.text() == _written(edited).text()
+    assert _blocks(doc) == _blocks(_written(edited))
+
+
+def test_diff_of_the_same_text_sends_nothing(monkeypatch):
+    service = _use(monkeypatch, FakeDocsService(FakeDoc()))
+    gdocs.write_markdown_to_document("d", BASE)
+    before = len(service.batches)
+
+    stats = gdocs.write_markdown_to_document("d", BASE, mode="diff")
+
+    assert stats["requests"] == 0 and stats["deleted"] == stats["inserted"] == 0
+    assert len(service.batches) == before
+
+
+def test_diff_keeps_untouched_paragraphs(monkeypatch):
+    _use(monkeypatch, FakeDocsService(FakeDoc()))
+    gdocs.write_markdown_to_document("d", BASE)
+
+    stats = gdocs.write_markdown_to_document("d", BASE.replace("Último párrafo.", "Otro final."), mode="diff")
+
+    assert stats["deleted"] == stats["inserted"] == 1
+    assert stats["kept"] > 10
+
+
+def test_planner_rejects_docs_with_tables():
+    doc = {"revisionId": "r1", "body": {"content": [
+        {"endIndex": 1, "sectionBreak": {}},
+        {"startIndex": 1, "endIndex": 10, "table": {}},
+    ]}}
+    assert gdocs._plan_markdown_diff(doc, gdocs._parse_markdown(BASE)) is None
+
+
+def test_rewrite_splits_in_batches_chained_by_revision(monkeypatch):
+    service = _use(monkeypatch, FakeDocsService(FakeDoc()))
+
+    stats = gdocs.write_markdown_to_document("d", LONG)
+
+    assert stats["batch_updates"] == len(service.batches) > 1
+    assert all(len(batch) <= gdocs.BATCH_LIMIT for batch in service.batches)
+    assert service.doc.text() == _written(LONG).text()
+
+
+def test_rewrite_replans_once_after_a_concurrent_edit(monkeypatch):
+    doc = FakeDoc()
+    edits = []
+
+    def _edit(n: int) -> None:
+        if not edits:
+            edits.append(n)
+            doc.rev += 1  # alguien editó el Doc entre la lectura y el primer lote
+
+    service = _use(monkeypatch, FakeDocsService(doc, before_batch=_edit))
+    gdocs.write_markdown_to_document("d", BASE)
+
+    assert service.gets == 2
+    assert doc.text() == _written(BASE).text()
+
+
+def test_cut_write_resumes_from_the_last_applied_batch(monkeypatch):
+    doc = FakeDoc()
+    service = _use(monkeypatch, FakeDocsService(doc, before_batch=_cut_at(3)))
+    with pytest.raises(_Cut):
+        gdocs.write_markdown_to_document("d", LONG, checkpoint="k", checkpoint_meta={"model": "m"})
+    assert gdocs.load_write_checkpoint("k")["applied"] == 2
+
+    service.before_batch = None
+    stats = gdocs.write_markdown_to_document("d", LONG, checkpoint="k")
+
+    assert stats["resumed_from_batch"] == 3
+    assert doc.text() == _written(LONG).text()
+    assert gdocs.load_write_checkpoint("k") is None
+
+
+def test_resume_replans_when_the_doc_changed_since_the_cut(monkeypatch):
+    doc = FakeDoc()
+    service = _use(monkeypatch, FakeDocsService(doc, before_batch=_cut_at(2)))
+    with pytest.raises(_Cut):
+        gdocs.write_markdown_to_document("d", LONG, checkpoint="k")
+
+    doc.rev += 1  # edición manual entre el corte y el reintento
+    service.before_batch = None
+    stats = gdocs.write_markdown_to_document("d", LONG, checkpoint="k")
+
+    assert stats["mode"] == "rewrite" and "resumed_from_batch" not in stats
+    assert doc.text() == _written(LONG).text()
+
+
+def test_checkpoint_of_another_text_is_ignored(monkeypatch):
+    doc = FakeDoc()
+    service = _use(monkeypatch, FakeDocsService(doc, before_batch=_cut_at(2)))
+    with pytest.raises(_Cut):
+        gdocs.write_markdown_to_document("d", LONG, checkpoint="k")
+
+    service.before_batch = None
+    stats = gdocs.write_markdown_to_document("d", BASE, checkpoint="k")
+
+    assert "resumed_from_batch" not in stats
+    assert doc.text() == _written(BASE).text()
+
+
+@pytest.mark.parametrize("mode", ["rewrite", "diff"])
+def test_async_write_matches_the_sync_one(monkeypatch, mode):
+    doc = FakeDoc()
+    service = _use(monkeypatch, FakeDocsService(doc))
+    monkeypatch.setattr(google_async, "get_async_google_client", lambda: FakeAsyncGoogleClient(service))
+    gdocs.write_markdown_to_document("d", BASE)
+    edited = BASE.replace("Párrafo con", "Párrafo nuevo con")
+
+    sync_doc = _written(BASE)
+    sync_service = FakeDocsService(sync_doc)
+    monkeypatch.setattr(gdocs, "build_docs_client", lambda: sync_service)
+    sync_stats = gdocs.write_markdown_to_document("d", edited, mode=mode)
+
+    async_stats = asyncio.run(gdocs.awrite_markdown_to_document("d", edited, mode=mode))
+
+    assert async_stats == sync_stats
+    assert doc.text() == sync_doc.text()
+    assert _blocks(doc) == _blocks(sync_doc)
@@ -0,0 +1,154 @@
+# tests/test_job_queue.py
+"""Cola durable: lease, vencimiento, reintentos con backoff y orden por clase/tenant."""
+import pytest
+
+import src.orchestration.job_queue as job_queue
+from src.orchestration.job_queue import DONE, FAILED, LEASED, QUEUED, JobQueue
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(job_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3, aging_s=600.0, tenant_penalty_s=60.0)
+
+
+def _drain(queue):
+    order = []
+    while (job := queue.lease("w", 60)) is not None:
+        order.append(job.id)
+    return order
+
+
+def test_enqueue_is_idempotent_by_job_id(queue):
+    queue.enqueue({"case_id": "A"}, job_id="j1")
+    queue.enqueue({"case_id": "otro"}, job_id="j1")
+
+    assert queue.get("j1").payload == {"case_id": "A"}
+    assert queue.stats()[QUEUED] == 1
+
+
+def test_a_leased_job_is_not_leased_twice(queue):
+    queue.enqueue({}, job_id="j1")
+
+    job = queue.lease("w1", 60)
+
+    assert (job.id, job.status, job.attempts, job.lease_owner) == ("j1", LEASED, 1, "w1")
+    assert queue.lease("w2", 60) is None
+
+
+def test_expired_lease_goes_to_another_worker(queue, clock):
+    queue.enqueue({}, job_id="j1")
+    queue.lease("w1", 60)
+
+    clock.now += 61
+    job = queue.lease("w2", 60)
+
+    assert (job.lease_owner, job.attempts) == ("w2", 2)
+    # El worker viejo ya no puede extender ni cerrar un lease que no es suyo
+    assert queue.heartbeat("j1", "w1", 60) is False
+    assert queue.complete("j1", "w1", {"ok": True}) is False
+    assert queue.complete("j1", "w2", {"ok": True}) is True
+    assert queue.get("j1").status == DONE
+
+
+def test_heartbeat_keeps_the_lease(queue, clock):
+    queue.enqueue({}, job_id="j1")
+    queue.lease("w1", 60)
+
+    clock.now += 50
+    assert queue.heartbeat("j1", "w1", 60) is True
+    clock.now += 50
+
+    assert queue.lease("w2", 60) is None
+
+
+def test_failures_back_off_exponentially(queue, clock):
+    queue.enqueue({}, job_id="j1")
+    queue.lease("w", 60)
+
+    assert queue.fail("j1", "w", "503", retry_delay_s=30) == QUEUED  # 1er intento: 30 s
+    clock.now += 29
+    assert queue.lease("w", 60) is None
+    clock.now += 2
+    assert queue.lease("w", 60).attempts == 2
+
+    queue.fail("j1", "w", "503", retry_delay_s=30)  # 2º intento: 60 s
+    clock.now += 59
+    assert queue.lease("w", 60) is None
+    clock.now += 2
+    assert queue.lease("w", 60).attempts == 3
+
+
+def test_last_attempt_fails_for_good(queue):
+    queue.enqueue({}, job_id="j1")
+    for _ in range(2):
+        queue.lease("w", 60)
+        queue.fail("j1", "w", "503", retry_delay_s=0)
+    queue.lease("w", 60)
+
+    assert queue.fail("j1", "w", "503 otra vez", retry_delay_s=0) == FAILED
+    assert queue.get("j1").error == "503 otra vez"
+    assert queue.lease("w", 60) is None
+
+
+def test_permanent_errors_do_not_retry(queue):
+    queue.enqueue({}, job_id="j1")
+    queue.lease("w", 60)
+
+    assert queue.fail("j1", "w", "403", retry=False) == FAILED
+
+
+def test_lease_expired_on_the_last_attempt_fails_the_job(queue, clock):
+    queue.enqueue({}, job_id="j1")
+    for _ in range(3):
+        assert queue.lease("w", 60) is not None
+        clock.now += 61
+
+    assert queue.lease("w", 60) is None
+    job = queue.get("j1")
+    assert (job.status, job.error) == (FAILED, "Lease vencido en el último intento.")
+
+
+def test_higher_classes_go_first_until_lower_ones_age(queue, clock):
+    queue.enqueue({}, job_id="backfill-viejo", priority="backfill")
+    clock.now += 10
+    queue.enqueue({}, job_id="interactivo", priority="interactive")
+    queue.enqueue({}, job_id="webhook", priority="webhook")
+
+    assert _drain(queue) == ["interactivo", "webhook", "backfill-viejo"]
+
+
+def test_aged_backfill_beats_new_interactive(queue, clock):
+    # Un backfill que ya esperó más que el aging de dos clases le gana a lo nuevo
+    queue.enqueue({}, job_id="backfill-muy-viejo", priority="backfill")
+    clock.now += 2 * 600 + 1
+    queue.enqueue({}, job_id="interactivo-nuevo", priority="interactive")
+
+    assert _drain(queue) == ["backfill-muy-viejo", "interactivo-nuevo"]
+
+
+def test_tenants_with_running_jobs_wait_their_turn(queue, clock):
+    for i in range(3):
+        queue.enqueue({}, job_id=f"a{i}", priority="backfill", tenant="A")
+    clock.now += 1
+    queue.enqueue({}, job_id="b0", priority="backfill", tenant="B")
+
+    first = queue.lease("w1", 600)
+    second = queue.lease("w2", 600)
+
+    # a0 ya corre: a1 cuenta como llegado 60 s más tarde y B pasa primero
+    assert (first.id, second.id) == ("a0", "b0")
@@ -0,0 +1,137 @@
+# tests/test_runner.py
+"""run_testimony / arun_testimony con Drive, Docs y el modelo sustituidos: mismo grafo, misma respuesta."""
+import asyncio
+
+import httplib2
+import pytest
+from fastapi import HTTPException
+from googleapiclient.errors import HttpError
+
+import src.orchestration.runner as runner
+from src.clients.google_batch import BatchItem
+from src.clients.llm_router import LLMResult
+from src.domain import schemas
+
+TRANSCRIPT = "Abogado: ¿Cuándo llegó?\nTestigo: Llegué en 2019 y trabajé en la obra."
+
+
+def _http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+class _Google:
+    """Registro de llamadas de las dos variantes (síncrona y google_async)."""
+
+    def __init__(self, denied=()):
+        self.denied = set(denied)
+        self.meta_batches = []
+        self.prompts = []
+        self.writes = {}
+
+    def _meta(self, doc_id):
+        if doc_id in self.denied:
+            raise _http_error(403)
+        return {"id": doc_id, "webViewLink": f"https://docs/{doc_id}"}
+
+    # síncrono
+    def batch_get_files(self, ids, fields):
+        self.meta_batches.append(list(ids))
+        items = {}
+        for doc_id in ids:
+            try:
+                items[doc_id] = BatchItem(doc_id, response=self._meta(doc_id))
+            except HttpError as e:
+                items[doc_id] = BatchItem(doc_id, error=e)
+        return items
+
+    def generate(self, prompt, context=None, priority=None):
+        self.prompts.append(prompt)
+        return LLMResult(f"Testimonio ({context})", "modelo", "us-central1", "vertex", 0.1)
+
+    def write(self, doc_id, text, **kwargs):
+        if doc_id in self.denied:
+            raise _http_error(403)
+        self.writes[doc_id] = text
+        return {}
+
+    # asyncio
+    async def files_get(self, doc_id, fields=None):
+        self.meta_batches.append([doc_id])
+        return self._meta(doc_id)
+
+    async def agenerate(self, prompt, context=None, priority=None):
+        return self.generate(prompt, context=context, priority=priority)
+
+    async def awrite(self, doc_id, text, **kwargs):
+        return self.write(doc_id, text, **kwargs)
+
+
+@pytest.fixture
+def google(monkeypatch):
+    def _install(denied=()):
+        fake = _Google(denied)
+        monkeypatch.setattr(runner, "batch_get_files", fake.batch_get_files)
+        monkeypatch.setattr(runner, "generate_text_result", fake.generate)
+        monkeypatch.setattr(runner, "agenerate_text_result", fake.agenerate)
+        monkeypatch.setattr(runner, "write_markdown_to_document", fake.write)
+        monkeypatch.setattr(runner, "awrite_markdown_to_document", fake.awrite)
+        monkeypatch.setattr(runner, "get_async_google_client", lambda: fake)
+        return fake
+    return _install
+
+
+def _request(**extra) -> schemas.TestimonyRequest:
+    return schemas.TestimonyRequest(case_id="C-1", context="Witness", raw_text=TRANSCRIPT, output_doc_id="OUT",
+                                    **extra)
+
+
+OUTPUTS = [{"output_doc_id": "OUT-EN", "language": "en"}, {"output_doc_id": "OUT-REF", "context": "Reference Letter"}]
+
+
+def test_sync_and_async_return_the_same_response(google):
+    sync_google = google()
+    sync_resp = runner.run_testimony(_request(outputs=OUTPUTS))
+    async_google = google()
+    async_resp = asyncio.run(runner.arun_testimony(_request(outputs=OUTPUTS)))
+
+    assert sync_resp == async_resp
+    assert sync_google.writes == async_google.writes == {
+        "OUT": "Testimonio (Witness)", "OUT-EN": "Testimonio (Witness)", "OUT-REF": "Testimonio (Reference Letter)",
+    }
+    assert [o["output_doc_link"] for o in sync_resp["outputs"]] == [
+        "https://docs/OUT", "https://docs/OUT-EN", "https://docs/OUT-REF",
+    ]
+
+
+def test_destinations_of_all_outputs_share_one_drive_batch(google):
+    fake = google()
+
+    runner.run_testimony(_request(outputs=OUTPUTS))
+
+    assert fake.meta_batches == [["OUT", "OUT-EN", "OUT-REF"]]
+
+
+def test_generated_results_skip_the_model(google):
+    generated = [LLMResult(f"offline {i}", "batch", "us-central1", "vertex-batch", 0.0) for i in range(3)]
+    fake = google()
+
+    resp = runner.run_testimony(_request(outputs=OUTPUTS), generated=generated)
+    aresp = asyncio.run(runner.arun_testimony(_request(outputs=OUTPUTS), generated=generated))
+
+    assert fake.prompts == []
+    assert fake.writes == {"OUT": "offline 0", "OUT-EN": "offline 1", "OUT-REF": "offline 2"}
+    assert resp["model"] == aresp["model"] == "batch"
+
+
+@pytest.mark.parametrize("run", [
+    runner.run_testimony,
+    lambda req: asyncio.run(runner.arun_testimony(req)),
+], ids=["sync", "async"])
+def test_google_errors_keep_their_status(google, run):
+    google(denied={"OUT-EN"})
+
+    with pytest.raises(HTTPException) as exc:
+        run(_request(outputs=OUTPUTS))
+
+    assert exc.value.status_code == 403
+    assert "OUT-EN" in exc.value.detail
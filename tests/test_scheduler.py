@@ -0,0 +1,107 @@
+# tests/test_scheduler.py
+"""FairScheduler: reparto ponderado entre clases, round-robin por tenant y abandono por deadline."""
+import threading
+from collections import Counter
+
+import pytest
+
+from src.deadline import Deadline, DeadlineExceeded, use_deadline
+from src.orchestration.scheduler import FairScheduler, _Ticket
+
+WEIGHTS = {"interactive": 4.0, "webhook": 2.0, "backfill": 1.0}
+
+
+def _grant_order(waiting, weights=WEIGHTS):
+    """
+    Con un solo turno ocupado, encola `waiting` [(clase, tenant)] y libera el turno una vez por
+    ticket: devuelve el orden en que el scheduler los fue admitiendo.
+    """
+    sched = FairScheduler(1, weights)
+    granted = []
+    with sched._lock:
+        sched._enqueue(_Ticket("interactive", "ocupado", lambda: None))
+        sched._dispatch()
+        for cls, tenant in waiting:
+            sched._enqueue(_Ticket(cls, tenant, lambda cls=cls, tenant=tenant: granted.append((cls, tenant))))
+    running = "interactive"
+    for _ in waiting:
+        sched._release(running)
+        running = granted[-1][0]
+    return granted
+
+
+def test_classes_share_turns_by_weight():
+    waiting = [(cls, "t") for cls in WEIGHTS for _ in range(20)]
+
+    first = Counter(cls for cls, _ in _grant_order(waiting)[:14])
+
+    assert first == {"interactive": 8, "webhook": 4, "backfill": 2}
+
+
+def test_backfill_is_never_starved():
+    waiting = [("interactive", "t")] * 40 + [("backfill", "t")]
+
+    order = [cls for cls, _ in _grant_order(waiting, {"interactive": 16.0, "webhook": 4.0, "backfill": 1.0})]
+
+    assert order.index("backfill") <= 17
+
+
+def test_an_idle_class_does_not_bank_credit():
+    sched = FairScheduler(1, WEIGHTS)
+    granted = []
+    with sched._lock:
+        sched._enqueue(_Ticket("interactive", "ocupado", lambda: None))
+        sched._dispatch()
+        for _ in range(10):
+            sched._enqueue(_Ticket("interactive", "t", lambda: granted.append("interactive")))
+    for _ in range(6):
+        sched._release("interactive")
+    # Backfill llega tarde: no cobra los turnos que "se perdió" mientras no tenía trabajo
+    with sched._lock:
+        for _ in range(5):
+            sched._enqueue(_Ticket("backfill", "t", lambda: granted.append("backfill")))
+    for _ in range(5):
+        sched._release(granted[-1])
+
+    assert granted[6:].count("backfill") == 1
+
+
+def test_tenants_take_turns_within_a_class():
+    waiting = [("backfill", "A")] * 3 + [("backfill", "B")] * 2 + [("backfill", "C")]
+
+    order = [tenant for _, tenant in _grant_order(waiting)]
+
+    assert order == ["A", "B", "C", "A", "B", "A"]
+
+
+def test_disabled_scheduler_admits_everything():
+    sched = FairScheduler(0, WEIGHTS)
+
+    with sched.admit("backfill", "A"), sched.admit("backfill", "A"):
+        assert sched.queued("backfill") == 0
+
+
+def test_a_waiter_past_its_deadline_leaves_the_queue():
+    sched = FairScheduler(1, WEIGHTS)
+    holding, release = threading.Event(), threading.Event()
+
+    def _hold():
+        with sched.admit("interactive", "A"):
+            holding.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=_hold)
+    holder.start()
+    holding.wait(5)
+    try:
+        with use_deadline(Deadline(0.05)), pytest.raises(DeadlineExceeded):
+            with sched.admit("backfill", "B"):
+                pass
+        assert sched.queued("backfill") == 0
+    finally:
+        release.set()
+        holder.join(5)
+
+    # El turno liberado no quedó asignado al que se fue
+    with sched.admit("webhook", "C"):
+        assert sched._running == {"interactive": 0, "webhook": 1, "backfill": 0}
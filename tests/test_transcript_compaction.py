@@ -0,0 +1,73 @@
+# tests/test_transcript_compaction.py
+"""Compactación del transcript por nivel (src/domain/transcript_compaction.py)."""
+import pytest
+
+from src.domain.transcript_compaction import compact_transcript
+
+SRT = """1
+00:00:01,000 --> 00:00:04,000
+Abogado: ¿Cuántos años tiene?
+
+2
+00:00:04,500 --> 00:00:06,000
+Testigo: Tengo 42 años.
+"""
+
+ASR = """**Speaker 1** (00:01:02): eh, bueno, que que que yo llegué en 2019.
+**Speaker 1** (00:01:10): Y trabajé en la obra.
+Speaker 2: ¿Cuántos hijos?
+Speaker 2: ¿Cuántos hijos?
+3
+Speaker 1: Tres hijos, y y todos nacieron aquí.
+"""
+
+
+def test_off_returns_the_transcript_untouched():
+    assert compact_transcript(ASR, "off") == (ASR, None)
+
+
+def test_invalid_level_is_rejected():
+    with pytest.raises(ValueError):
+        compact_transcript(ASR, "máximo")
+
+
+def test_light_drops_subtitle_cues_and_timestamps():
+    text, report = compact_transcript(SRT, "light")
+
+    assert text == "Abogado: ¿Cuántos años tiene?\nTestigo: Tengo 42 años."
+    assert report.tokens_saved == report.tokens_before - report.tokens_after > 0
+
+
+def test_a_bare_number_is_an_answer_unless_a_cue_timing_follows():
+    text, _ = compact_transcript(ASR, "light")
+
+    assert text.splitlines() == [
+        "Speaker 1: eh, bueno, que que que yo llegué en 2019.",
+        "Speaker 1: Y trabajé en la obra.",
+        "Speaker 2: ¿Cuántos hijos?",
+        "3",
+        "Speaker 1: Tres hijos, y y todos nacieron aquí.",
+    ]
+
+
+def test_standard_merges_turns_and_drops_fillers_and_stutters():
+    text, _ = compact_transcript(ASR, "standard")
+
+    assert text.splitlines() == [
+        "Speaker 1: bueno, que yo llegué en 2019. Y trabajé en la obra.",
+        "Speaker 2: ¿Cuántos hijos? 3",
+        "Speaker 1: Tres hijos, y y todos nacieron aquí.",
+    ]
+
+
+def test_aggressive_also_drops_double_words():
+    text, _ = compact_transcript(ASR, "aggressive")
+
+    assert text.splitlines()[-1] == "Speaker 1: Tres hijos, y todos nacieron aquí."
+
+
+def test_levels_never_drop_content_words():
+    for level in ("light", "standard", "aggressive"):
+        text, _ = compact_transcript(ASR, level)
+        for word in ("2019", "obra", "hijos", "3", "nacieron"):
+            assert word in text, (level, word)
@@ -0,0 +1,92 @@
+# tests/test_vertex_batch.py
+"""Emparejamiento de predicciones de batch con sus filas (LocalBatchBackend: mismo formato que Vertex)."""
+import json
+import os
+
+import pytest
+
+from src.clients.llm_router import LLMResult
+from src.clients.vertex_batch import LocalBatchBackend, collect_results, request_line
+
+PROMPTS = {"2:C-1#0": "prompt uno", "2:C-1#1": "prompt uno (en)", "3:C-2#0": "prompt dos"}
+
+
+def _generate(prompt: str) -> str:
+    if "falla" in prompt:
+        raise RuntimeError("cuota agotada")
+    return f"testimonio de {prompt}"
+
+
+@pytest.fixture
+def run(tmp_path):
+    """(backend, input.jsonl) → job ya procesado y listo para leer."""
+    def _run(prompts, generate=_generate):
+        input_path = tmp_path / "input.jsonl"
+        input_path.write_text("".join(request_line(k, p) + "\n" for k, p in prompts.items()), encoding="utf-8")
+        backend = LocalBatchBackend(str(tmp_path), generate=generate, model="modelo-batch")
+        job = backend.wait(backend.submit(str(input_path), "run-1"), poll_s=0, max_wait_s=0)
+        return backend, job, str(input_path)
+    return _run
+
+
+def _rewrite_predictions(job, edit):
+    path = os.path.join(job.output, "predictions.jsonl")
+    with open(path, encoding="utf-8") as fh:
+        lines = [json.loads(line) for line in fh if line.strip()]
+    with open(path, "w", encoding="utf-8") as fh:
+        for line in lines:
+            fh.write(json.dumps(edit(line), ensure_ascii=False) + "\n")
+
+
+def test_results_are_keyed_by_row_and_output(run):
+    backend, job, input_path = run(PROMPTS)
+
+    results = collect_results(backend, job, input_path)
+
+    assert set(results) == set(PROMPTS)
+    for key, prompt in PROMPTS.items():
+        assert isinstance(results[key], LLMResult)
+        assert results[key].text == f"testimonio de {prompt}"
+        assert results[key].model == "modelo-batch" and results[key].backend == "local-batch"
+
+
+def test_lines_without_key_match_by_prompt_hash(run):
+    backend, job, input_path = run(PROMPTS)
+    _rewrite_predictions(job, lambda line: {k: v for k, v in line.items() if k != "key"})
+
+    results = collect_results(backend, job, input_path)
+
+    assert {k: r.text for k, r in results.items()} == {k: f"testimonio de {p}" for k, p in PROMPTS.items()}
+
+
+def test_unknown_predictions_are_ignored(run):
+    backend, job, input_path = run(PROMPTS)
+
+    def _orphan(line):
+        if line["key"] == "3:C-2#0":
+            line.pop("key")
+            line["request"]["contents"][0]["parts"][0]["text"] = "un prompt que nadie envió"
+        return line
+
+    _rewrite_predictions(job, _orphan)
+    results = collect_results(backend, job, input_path)
+
+    assert set(results) == {"2:C-1#0", "2:C-1#1"}
+
+
+def test_failed_lines_are_reported_per_key(run):
+    backend, job, input_path = run({**PROMPTS, "4:C-3#0": "este falla"})
+
+    results = collect_results(backend, job, input_path)
+
+    assert isinstance(results["4:C-3#0"], RuntimeError)
+    assert "cuota agotada" in str(results["4:C-3#0"])
+    assert all(isinstance(results[k], LLMResult) for k in PROMPTS)
+
+
+def test_empty_predictions_are_errors(run):
+    backend, job, input_path = run(PROMPTS, generate=lambda prompt: "  ")
+
+    results = collect_results(backend, job, input_path)
+
+    assert all(isinstance(r, RuntimeError) and "vacía" in str(r) for r in results.values())